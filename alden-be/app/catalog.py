@@ -0,0 +1,52 @@
+"""Built-in mindful session catalog shared by the API and the recommender"""
+from typing import Optional
+
+PREBUILT_SESSIONS = [
+    {
+        "id": "focus-boost",
+        "title": "Focus Boost",
+        "category": "pre_study",
+        "duration": 240,
+        "audio_url": "/audio/focus-boost.mp3",
+        "description": "A 4-minute meditation to prepare your mind for focused study",
+    },
+    {
+        "id": "sos-breathing",
+        "title": "SOS Breathing",
+        "category": "quick_relief",
+        "duration": 60,
+        "audio_url": "/audio/sos-breathing.mp3",
+        "description": "Quick breathing exercise for immediate stress relief",
+    },
+    {
+        "id": "study-reflection",
+        "title": "Study Reflection",
+        "category": "post_study",
+        "duration": 420,
+        "audio_url": "/audio/study-reflection.mp3",
+        "description": "Wind down and reflect on your study session",
+    },
+    {
+        "id": "pre-exam-calm",
+        "title": "Pre-Exam Calm",
+        "category": "exam_support",
+        "duration": 600,
+        "audio_url": "/audio/pre-exam-calm.mp3",
+        "description": "Calm your nerves before an important exam",
+    },
+]
+
+_BY_ID = {session["id"]: session for session in PREBUILT_SESSIONS}
+_BY_AUDIO_URL = {session["audio_url"]: session for session in PREBUILT_SESSIONS}
+
+
+def get_session(session_id: str) -> Optional[dict]:
+    return _BY_ID.get(session_id)
+
+
+def match_session(audio_url: Optional[str], title: Optional[str] = None) -> Optional[dict]:
+    """Catalog entry a user's mindful session was started from, if any"""
+    session = _BY_AUDIO_URL.get(audio_url)
+    if session is None and title:
+        session = next((s for s in PREBUILT_SESSIONS if s["title"] == title), None)
+    return session
@@ -0,0 +1,85 @@
+"""Records inserts, updates and deletes of user data into the change_log table.
+
+The records are written in the same transaction as the change itself, from
+an after_flush hook, so /api/sync can hand out only what changed since a
+client's last token. Code that bypasses the ORM unit of work (Core or bulk
+statements) must call `record_changes` itself.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import event, insert, select
+
+from . import models
+from .database import SessionLocal
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# Synced models and the key their rows appear under in /api/sync
+ENTITIES = {
+    models.StudySession: "study_sessions",
+    models.MindfulSession: "mindful_sessions",
+    models.AidaConversation: "conversations",
+    models.AidaMessage: "messages",
+    models.UploadedDocument: "documents",
+    models.User: "user",
+}
+
+
+def record_changes(connection, changes: Iterable[Tuple[str, str, str, str]]):
+    """Insert (user_id, entity, entity_id, operation) rows into the change log"""
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "entity": entity, "entity_id": entity_id, "operation": operation, "changed_at": now}
+        for user_id, entity, entity_id, operation in changes
+    ]
+    if rows:
+        connection.execute(insert(models.ChangeLog.__table__), rows)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _record_flushed_changes(session, flush_context):
+    # new/dirty/deleted still describe this flush while after_flush runs
+    changes: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    conversation_owners: Dict[str, str] = {}
+    connection = session.connection()
+
+    def owner_of_conversation(conversation_id: str) -> str:
+        if conversation_id not in conversation_owners:
+            conversation_owners[conversation_id] = connection.execute(
+                select(models.AidaConversation.user_id).where(models.AidaConversation.id == conversation_id)
+            ).scalar()
+        return conversation_owners[conversation_id]
+
+    def add(obj, operation: str):
+        entity = ENTITIES.get(type(obj))
+        if entity is None:
+            return
+        if isinstance(obj, models.User):
+            user_id = obj.id
+        elif isinstance(obj, models.AidaMessage):
+            # Messages go away only with their conversation, which is logged
+            if operation == DELETE:
+                return
+            user_id = owner_of_conversation(obj.conversation_id)
+            # create_message bumps last_message with a bulk UPDATE, which
+            # skips this hook, so log the conversation here
+            changes[("conversations", obj.conversation_id)] = (user_id, UPSERT)
+        else:
+            user_id = obj.user_id
+        if user_id is not None:
+            changes[(entity, obj.id)] = (user_id, operation)
+
+    for obj in session.new:
+        add(obj, UPSERT)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            add(obj, UPSERT)
+    for obj in session.deleted:
+        add(obj, DELETE)
+
+    record_changes(connection, (
+        (user_id, entity, entity_id, operation)
+        for (entity, entity_id), (user_id, operation) in changes.items()
+    ))
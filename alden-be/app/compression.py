@@ -0,0 +1,210 @@
+"""Response compression (brotli when installed, otherwise gzip) and fast JSON rendering"""
+import gzip
+import zlib
+from typing import Any, Dict, List, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # optional dependency, see requirements-optional.txt
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional dependency, see requirements-optional.txt
+    orjson = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed.
+
+    Used by the endpoints returning large lists (conversations with their
+    messages, histories); output matches JSONResponse apart from whitespace.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Encodes plain dicts (datetimes, enums, None) exactly as response models would
+_rows_adapter = TypeAdapter(List[Dict[str, Any]])
+
+
+def rows_response(rows: List[Dict[str, Any]], headers: Optional[dict] = None) -> Response:
+    """JSON list response for plain row dicts, encoded in one pass by pydantic-core.
+
+    For list endpoints that already selected exactly their response fields:
+    there are no ORM objects to validate, so the response model is skipped.
+    """
+    return Response(_rows_adapter.dump_json(rows), media_type="application/json", headers=headers)
+
+
+def _accepted_encodings(header: str) -> dict:
+    """Parse Accept-Encoding into {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or "+json" in content_type
+
+
+class _Compressor:
+    """Incremental compressor; `flush` keeps streamed responses progressive"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.brotli_quality)
+        else:
+            self._gzip = zlib.compressobj(settings.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._gzip.compress(data)
+        return out + self._gzip.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.brotli_quality)
+    return gzip.compress(body, compresslevel=settings.gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text responses of at least `minimum_size` bytes.
+
+    Streaming responses are compressed chunk by chunk. Responses that are
+    already encoded, partial (206), or of binary types (audio, images, PDFs)
+    are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = settings.compression_min_size if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.compression_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                # e.g. zerocopysend for files: never compressed
+                if compressor is None and not passthrough:
+                    passthrough = True
+                    await send(start_message)
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = [(name, value) for name, value in start_message.get("headers", [])]
+                header_names = {name.lower() for name, _ in headers}
+                content_type = next((value.decode("latin-1") for name, value in headers if name.lower() == b"content-type"), "")
+                compressible = (
+                    start_message["status"] not in (204, 206, 304)
+                    and b"content-encoding" not in header_names
+                    and _is_compressible(content_type)
+                )
+                if compressible:
+                    headers = _add_vary(headers)
+                if not compressible or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send({**start_message, "headers": headers})
+                    await send(message)
+                    return
+
+                headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                if not more_body:
+                    # Whole body at once: compress in one go and keep Content-Length
+                    compressed = compress_body(body, encoding)
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed, "more_body": False})
+                    return
+                compressor = _Compressor(encoding)
+                await send({**start_message, "headers": headers})
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _add_vary(headers: list) -> list:
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[index] = (name, value + b", Accept-Encoding")
+            return headers
+    return headers + [(b"vary", b"Accept-Encoding")]
@@ -1,20 +1,149 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import os
 
 class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./alden.db"
+    auto_migrate: bool = True  # create/migrate the schema on startup
     
     # AI API
     gemini_api_key: Optional[str] = None
+    ai_provider: str = "gemini"  # "gemini", or "fake" for the deterministic offline provider
+    ai_model: str = "gemini-1.5-flash"
+    ai_fast_model: Optional[str] = "gemini-1.5-flash-8b"  # short, simple prompts; None disables routing
+    ai_fast_max_chars: int = 200  # longest student message routed to the fast model
+    ai_request_timeout: float = 20.0  # seconds, including a hedged retry
+    ai_max_concurrent_calls: int = 32  # provider calls in flight per worker (threads)
+    
+    # AI circuit breaker (per model, over a sliding window)
+    ai_breaker_window_seconds: float = 30.0
+    ai_breaker_min_requests: int = 10
+    ai_breaker_error_rate: float = 0.5  # open at this failure ratio
+    ai_breaker_open_seconds: float = 30.0  # then let one probe through
+    
+    # AI hedged requests: a second call when the first is slower than p95
+    ai_hedge_enabled: bool = False
+    ai_hedge_min_delay: float = 1.0  # seconds; floor for the p95-based delay
+    ai_hedge_min_samples: int = 20  # latencies needed before p95 is trusted
+    
+    # Fake AI provider (AI_PROVIDER=fake)
+    ai_fake_latency_ms: float = 300.0
+    ai_fake_error_rate: float = 0.0
     
     # CORS
     allow_origins: list = ["*"]  # In production, specify exact origins
     allow_credentials: bool = True
     allow_methods: list = ["*"]
     allow_headers: list = ["*"]
-    
+
+    # Logging
+    log_level: str = "INFO"
+    log_json: bool = True
+    log_slow_query_ms: float = 200.0  # SQL slower than this is logged at WARNING
+
+    # Profiling of slow requests
+    profiling_enabled: bool = False
+    profiling_allow_header: bool = False  # let clients force a profile with "X-Profile: 1"
+    profiling_slow_threshold_ms: float = 1000.0
+    profiling_sample_interval_ms: float = 5.0
+    profiling_buffer_size: int = 50
+
+    # Admin endpoints are disabled unless a token is configured
+    admin_token: Optional[str] = None
+
+    # Rate limiting (token buckets per user and route)
+    rate_limit_enabled: bool = True
+    rate_limit_storage_url: Optional[str] = None  # e.g. redis://localhost:6379/0 to share across workers
+    rate_limit_chat_per_minute: int = 20
+    rate_limit_chat_burst: int = 5
+    rate_limit_flashcards_per_minute: int = 5
+    rate_limit_flashcards_burst: int = 2
+
+    # Idempotency-Key on POST /api/ai/chat
+    idempotency_storage_url: Optional[str] = None  # defaults to RATE_LIMIT_STORAGE_URL; in-memory when both are unset
+    idempotency_ttl_seconds: int = 3600
+    idempotency_max_keys: int = 10_000  # in-memory store, per worker
+    idempotency_wait_seconds: float = 5.0  # a repeat waits this long for the original request
+
+    # Upstream AI quota governor (shared by all users)
+    ai_max_requests_per_second: float = 5.0
+    ai_max_tokens_per_minute: int = 100000
+    ai_expected_response_tokens: int = 512
+    ai_governor_max_wait: float = 30.0  # seconds a call may queue before falling back
+
+    # Per-user AI usage accounting (ai_usage_records, GET /api/ai/usage)
+    ai_usage_flush_seconds: float = 5.0  # records are buffered per worker and written in batches
+    ai_usage_batch_size: int = 500
+    ai_usage_max_pending: int = 20_000  # newer records are dropped if the database can't keep up
+    ai_usage_retention_days: int = 90  # raw records; daily totals are kept
+    ai_daily_token_quota: int = 0  # prompt + response tokens per user per UTC day; 0 disables
+    # USD per million (prompt, response) tokens, for cost estimates
+    ai_token_prices: Dict[str, Tuple[float, float]] = {
+        "gemini-1.5-flash": (0.075, 0.30),
+        "gemini-1.5-flash-8b": (0.0375, 0.15),
+    }
+
+    # Response compression (brotli needs the optional `brotli` package)
+    compression_enabled: bool = True
+    compression_min_size: int = 1024  # bytes; smaller bodies are sent as-is
+    gzip_level: int = 6
+    brotli_quality: int = 4  # 0-11; higher is smaller but much slower for dynamic responses
+
+    # Audio assets for mindful sessions (served at /audio/<name>)
+    audio_directory: str = "audio"
+    audio_accel_redirect_prefix: Optional[str] = None  # e.g. /internal-audio to let nginx send files
+
+    # Delta sync (/api/sync)
+    sync_page_size: int = 500  # change log entries per response
+    sync_settle_seconds: float = 5.0  # tokens never move past changes younger than this
+
+    # Archival of old chat messages into compressed blobs
+    message_archive_after_days: int = 90
+    message_archive_batch_size: int = 100  # conversations per archival pass
+
+    # Full-text search (/api/search)
+    search_max_document_chars: int = 200_000  # text indexed per uploaded document
+
+    # Study aids precomputed after document upload (opt-in; uses the AI provider)
+    precompute_study_aids: bool = False
+    study_aids_max_concurrency: int = 2  # documents processed at once per worker
+    study_aids_max_chars: int = 30_000  # document text sent to the model
+
+    # Document previews (optional pillow or opencv-python; PDFs also need pypdfium2)
+    generate_previews: bool = True
+    preview_directory: str = "uploads/previews"
+    preview_workers: int = 2  # rendering processes per worker
+    preview_jpeg_quality: int = 80
+
+    # Resumable document uploads (/api/documents/uploads)
+    upload_max_bytes: int = 200 * 1024 * 1024
+    upload_partial_directory: str = "uploads/partial"  # same filesystem as uploads/ so completion is a rename
+    upload_session_ttl_hours: int = 24  # since the last chunk; then the partial file is deleted
+    upload_cleanup_minutes: int = 60
+
+    # Scheduled maintenance, run by one worker at a time (leases in scheduled_jobs)
+    scheduler_enabled: bool = True
+    scheduler_poll_seconds: float = 60.0
+    scheduler_lease_seconds: int = 900  # another worker may take over a job after this
+    maintenance_batch_size: int = 500  # rows per transaction
+    stale_session_check_minutes: int = 15
+    stale_session_after_hours: float = 12.0  # active sessions older than this are closed
+    study_session_max_minutes: int = 240  # duration cap for sessions ended late
+    rollup_interval_hours: int = 24  # user totals, streaks and data compaction
+    change_log_retention_days: int = 30  # older sync tokens get reset: true
+    account_purge_check_minutes: int = 15  # finishes interrupted account deletions
+
+    # Production server (python -m app.server)
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: Optional[int] = None  # defaults to the number of CPU cores
+    server_reuse_port: bool = False  # one SO_REUSEPORT socket per worker instead of a shared one
+    graceful_shutdown_timeout: float = 30.0  # seconds to finish requests and AI jobs on SIGTERM
+    shutdown_drain_seconds: float = 5.0  # after SIGTERM, /ready reports draining while requests are still served
+    metrics_directory: Optional[str] = None  # workers of one server share /metrics through snapshot files here; set by app.server
+    metrics_write_seconds: float = 2.0  # how often each worker refreshes its snapshot
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -1,15 +1,31 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func, desc
-from typing import List, Optional
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, func, desc, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 import uuid
 
-from . import models, schemas
+from . import models, schemas, catalog
+from .config import settings
+from .services import archival, purge, recommender
+from . import change_log  # noqa: F401 - registers the change log hook
+
+# Lean list reads: only the response columns, as Core rows turned into plain
+# dicts for compression.rows_response; no ORM objects or identity map
+def _response_columns(model, schema) -> list:
+    """Columns of `model` named by the fields of `schema`, in field order"""
+    table = model.__table__
+    return [table.c[name] for name in schema.model_fields if name in table.c]
+
+def _rows(db: Session, statement) -> List[dict]:
+    return [dict(row) for row in db.execute(statement).mappings()]
 
 # User CRUD
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
+def create_user(db: Session, user: schemas.UserCreate, user_id: Optional[str] = None) -> models.User:
     db_user = models.User(
-        id=str(uuid.uuid4()),
+        id=user_id or str(uuid.uuid4()),
         email=user.email,
         name=user.name
     )
@@ -26,6 +42,11 @@ def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
 
 # Study Session CRUD
 def create_study_session(db: Session, session: schemas.StudySessionCreate, user_id: str) -> models.StudySession:
+    """Start a session, or return the user's active one if they already have it.
+
+    A unique index allows one active session per user, so when two starts
+    race the loser's insert fails and it returns the winner's session.
+    """
     db_session = models.StudySession(
         id=str(uuid.uuid4()),
         user_id=user_id,
@@ -36,7 +57,14 @@ def create_study_session(db: Session, session: schemas.StudySessionCreate, user_
         start_time=datetime.utcnow()
     )
     db.add(db_session)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        active = get_active_study_session(db, user_id)
+        if active is None:
+            raise
+        return active
     db.refresh(db_session)
     return db_session
 
@@ -45,7 +73,15 @@ def get_study_sessions(db: Session, user_id: str, skip: int = 0, limit: int = 10
         models.StudySession.user_id == user_id
     ).order_by(desc(models.StudySession.created_at)).offset(skip).limit(limit).all()
 
+def list_study_sessions(db: Session, user_id: str, skip: int = 0, limit: int = 100) -> List[dict]:
+    """get_study_sessions as plain dicts of the StudySession response fields"""
+    table = models.StudySession.__table__
+    return _rows(db, select(*_response_columns(models.StudySession, schemas.StudySession)).where(
+        table.c.user_id == user_id
+    ).order_by(desc(table.c.created_at)).offset(skip).limit(limit))
+
 def get_active_study_session(db: Session, user_id: str) -> Optional[models.StudySession]:
+    # Matches the partial unique index on (user_id) WHERE NOT completed
     return db.query(models.StudySession).filter(
         and_(
             models.StudySession.user_id == user_id,
@@ -62,27 +98,34 @@ def end_study_session(db: Session, session_id: str, user_id: str, update_data: s
     ).first()
     
     if db_session:
-        db_session.end_time = datetime.utcnow()
-        db_session.completed = True
         if update_data.focus_score is not None:
             db_session.focus_score = update_data.focus_score
         if update_data.notes is not None:
             db_session.notes = update_data.notes
-        
-        # Calculate actual duration
-        duration_minutes = (db_session.end_time - db_session.start_time).total_seconds() / 60
-        db_session.duration = int(duration_minutes)
-        
-        # Update user's total study time
-        user = get_user(db, user_id)
-        if user:
-            user.total_study_time += int(duration_minutes)
+        # Sessions closed by the stale-session job keep their capped duration
+        if not db_session.completed:
+            close_study_session(db, db_session, datetime.utcnow())
         
         db.commit()
         db.refresh(db_session)
     
     return db_session
 
+def close_study_session(db: Session, db_session: models.StudySession, end_time: datetime):
+    """Complete a session at `end_time` and add it to the user's totals (no commit)"""
+    # A session left running for days counts for at most study_session_max_minutes
+    duration_minutes = min((end_time - db_session.start_time).total_seconds() / 60, settings.study_session_max_minutes)
+    db_session.end_time = db_session.start_time + timedelta(minutes=duration_minutes)
+    db_session.completed = True
+    db_session.duration = int(duration_minutes)
+    
+    # Update user's total study time
+    user = get_user(db, db_session.user_id)
+    if user:
+        user.total_study_time += int(duration_minutes)
+        user.recent_study_load = recommender.decayed_load(user.recent_study_load, user.recent_study_load_at, db_session.end_time) + duration_minutes
+        user.recent_study_load_at = db_session.end_time
+
 # Mindful Session CRUD
 def create_mindful_session(db: Session, session: schemas.MindfulSessionCreate, user_id: str) -> models.MindfulSession:
     db_session = models.MindfulSession(
@@ -104,6 +147,13 @@ def get_mindful_sessions(db: Session, user_id: str) -> List[models.MindfulSessio
         models.MindfulSession.user_id == user_id
     ).order_by(models.MindfulSession.created_at).all()
 
+def list_mindful_sessions(db: Session, user_id: str) -> List[dict]:
+    """get_mindful_sessions as plain dicts of the MindfulSession response fields"""
+    table = models.MindfulSession.__table__
+    return _rows(db, select(*_response_columns(models.MindfulSession, schemas.MindfulSession)).where(
+        table.c.user_id == user_id
+    ).order_by(table.c.created_at))
+
 def complete_mindful_session(db: Session, session_id: str, user_id: str, complete_data: schemas.MindfulSessionComplete) -> Optional[models.MindfulSession]:
     db_session = db.query(models.MindfulSession).filter(
         and_(
@@ -113,11 +163,17 @@ def complete_mindful_session(db: Session, session_id: str, user_id: str, complet
     ).first()
     
     if db_session:
+        first_completion = not db_session.completed
+        previous_rating = db_session.rating
         db_session.completed = True
         db_session.completed_at = datetime.utcnow()
         if complete_data.rating is not None:
             db_session.rating = complete_data.rating
         
+        entry = catalog.match_session(db_session.audio_url, db_session.title)
+        if entry:
+            _update_mindful_score(db, user_id, entry["id"], db_session, first_completion, previous_rating)
+        
         # Update user's total mindful time
         user = get_user(db, user_id)
         if user:
@@ -128,6 +184,95 @@ def complete_mindful_session(db: Session, session_id: str, user_id: str, complet
     
     return db_session
 
+def _update_mindful_score(db: Session, user_id: str, catalog_id: str, db_session: models.MindfulSession,
+                          first_completion: bool, previous_rating: Optional[int]):
+    """Fold one completion into the user's precomputed score for a catalog session"""
+    if not ensure_mindful_scores(db, user_id):
+        # Freshly rebuilt from history, which already includes this completion
+        return
+    score = db.get(models.MindfulSessionScore, (user_id, catalog_id))
+    if score is None:
+        score = models.MindfulSessionScore(user_id=user_id, catalog_id=catalog_id, completions=0, rating_sum=0, rating_count=0)
+        db.add(score)
+    if first_completion:
+        score.completions += 1
+    if previous_rating is not None and not first_completion:
+        score.rating_sum -= previous_rating
+        score.rating_count -= 1
+    if db_session.rating is not None:
+        score.rating_sum += db_session.rating
+        score.rating_count += 1
+    score.last_completed_at = db_session.completed_at
+    score.affinity = recommender.affinity(score.completions, score.rating_sum, score.rating_count)
+
+def ensure_mindful_scores(db: Session, user_id: str) -> bool:
+    """Build the score rows from completion history if the user has none yet.
+
+    Returns True when rows already existed, including when a concurrent
+    request inserted them first. Pending changes in the session are flushed
+    first, so they are part of the rebuild.
+    """
+    exists = db.query(models.MindfulSessionScore.catalog_id).filter(
+        models.MindfulSessionScore.user_id == user_id
+    ).first()
+    if exists:
+        return True
+    
+    db.flush()
+    totals = {session["id"]: {"completions": 0, "rating_sum": 0, "rating_count": 0, "last_completed_at": None}
+              for session in catalog.PREBUILT_SESSIONS}
+    completed = db.query(models.MindfulSession).filter(
+        and_(
+            models.MindfulSession.user_id == user_id,
+            models.MindfulSession.completed == True
+        )
+    ).all()
+    for session in completed:
+        entry = catalog.match_session(session.audio_url, session.title)
+        if not entry:
+            continue
+        total = totals[entry["id"]]
+        total["completions"] += 1
+        if session.rating is not None:
+            total["rating_sum"] += session.rating
+            total["rating_count"] += 1
+        if session.completed_at and (total["last_completed_at"] is None or session.completed_at > total["last_completed_at"]):
+            total["last_completed_at"] = session.completed_at
+    
+    rows = [
+        {
+            "user_id": user_id,
+            "catalog_id": catalog_id,
+            "affinity": recommender.affinity(total["completions"], total["rating_sum"], total["rating_count"]),
+            **total
+        }
+        for catalog_id, total in totals.items()
+    ]
+    # Two first reads (or a read and a completion) can race to build the rows;
+    # the rebuild is deterministic, so the loser just keeps the winner's rows
+    return _insert_ignoring_conflicts(db, models.MindfulSessionScore.__table__, rows) == 0
+
+
+def _insert_ignoring_conflicts(db: Session, table, rows: List[dict]) -> int:
+    """INSERT ... ON CONFLICT DO NOTHING; returns how many rows were inserted"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    elif dialect == "postgresql":
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    else:
+        statement = insert(table)
+    return db.execute(statement.values(rows)).rowcount
+
+def get_mindful_scores(db: Session, user_id: str) -> dict:
+    """Precomputed scores keyed by catalog id (one primary-key range scan)"""
+    if not ensure_mindful_scores(db, user_id):
+        db.commit()
+    rows = db.query(models.MindfulSessionScore).filter(
+        models.MindfulSessionScore.user_id == user_id
+    ).all()
+    return {row.catalog_id: row for row in rows}
+
 # Conversation CRUD
 def create_conversation(db: Session, conversation: schemas.AidaConversationCreate, user_id: str) -> models.AidaConversation:
     db_conversation = models.AidaConversation(
@@ -147,6 +292,13 @@ def get_conversations(db: Session, user_id: str) -> List[models.AidaConversation
         models.AidaConversation.user_id == user_id
     ).order_by(desc(models.AidaConversation.last_message)).all()
 
+def get_conversations_version(db: Session, user_id: str) -> Tuple[int, Optional[datetime]]:
+    """Count and newest activity of the user's conversations, for ETags"""
+    return db.query(
+        func.count(models.AidaConversation.id),
+        func.max(models.AidaConversation.last_message)
+    ).filter(models.AidaConversation.user_id == user_id).one()
+
 def get_conversation(db: Session, conversation_id: str, user_id: str) -> Optional[models.AidaConversation]:
     return db.query(models.AidaConversation).filter(
         and_(
@@ -156,16 +308,16 @@ def get_conversation(db: Session, conversation_id: str, user_id: str) -> Optiona
     ).first()
 
 def delete_conversation(db: Session, conversation_id: str, user_id: str) -> bool:
-    db_conversation = db.query(models.AidaConversation).filter(
+    owned = db.query(models.AidaConversation.id).filter(
         and_(
             models.AidaConversation.id == conversation_id,
             models.AidaConversation.user_id == user_id
         )
     ).first()
     
-    if db_conversation:
-        db.delete(db_conversation)
-        db.commit()
+    if owned:
+        db.rollback()  # end the read transaction before the batched deletes
+        purge.delete_conversation(conversation_id, user_id)
         return True
     return False
 
@@ -194,19 +346,37 @@ def get_messages(db: Session, conversation_id: str, user_id: str) -> List[models
     if not conversation:
         return []
     
-    return db.query(models.AidaMessage).filter(
+    hot = db.query(models.AidaMessage).filter(
         models.AidaMessage.conversation_id == conversation_id
     ).order_by(models.AidaMessage.timestamp).all()
+    archived = get_archived_messages(db, conversation_id)
+    return archived + hot if archived else hot
+
+def get_archived_messages(db: Session, conversation_id: str) -> List[models.AidaMessage]:
+    """Rehydrate archived messages as detached, read-only message objects"""
+    payloads = db.query(models.AidaMessageArchive.payload).filter(
+        models.AidaMessageArchive.conversation_id == conversation_id
+    ).order_by(models.AidaMessageArchive.first_timestamp, models.AidaMessageArchive.id).all()
+    return [
+        models.AidaMessage(conversation_id=conversation_id, **message)
+        for (payload,) in payloads
+        for message in archival.decode_messages(payload)
+    ]
+
+def attach_messages(conversation: models.AidaConversation, messages: List[models.AidaMessage]):
+    """Set a conversation's messages for serialization without marking it changed"""
+    set_committed_value(conversation, "messages", messages)
 
 # Document CRUD
-def create_document(db: Session, document: schemas.UploadedDocumentCreate, user_id: str) -> models.UploadedDocument:
+def create_document(db: Session, document: schemas.UploadedDocumentCreate, user_id: str, extracted_text: Optional[str] = None) -> models.UploadedDocument:
     db_document = models.UploadedDocument(
         id=str(uuid.uuid4()),
         user_id=user_id,
         name=document.name,
         type=document.type,
         uri=document.uri,
-        size=document.size
+        size=document.size,
+        extracted_text=extracted_text
     )
     db.add(db_document)
     db.commit()
@@ -218,6 +388,36 @@ def get_documents(db: Session, user_id: str) -> List[models.UploadedDocument]:
         models.UploadedDocument.user_id == user_id
     ).order_by(desc(models.UploadedDocument.upload_date)).all()
 
+def list_documents(db: Session, user_id: str) -> List[dict]:
+    """get_documents as plain dicts of the UploadedDocument response fields, with preview URLs"""
+    documents = models.UploadedDocument.__table__
+    previews = models.DocumentPreview.__table__
+    rows = _rows(db, select(*_response_columns(models.UploadedDocument, schemas.UploadedDocument)).where(
+        documents.c.user_id == user_id
+    ).order_by(desc(documents.c.upload_date)))
+    urls = {}
+    if rows:
+        # Subquery rather than a list of ids, so any number of documents fits in one statement
+        user_documents = select(documents.c.id).where(documents.c.user_id == user_id)
+        for document_id, size, digest in db.execute(
+            select(previews.c.document_id, previews.c.size, previews.c.digest).where(previews.c.document_id.in_(user_documents))
+        ):
+            urls.setdefault(document_id, {})[size] = schemas.preview_url(digest)
+    for row in rows:
+        row["previews"] = urls.get(row["id"], {})
+    return rows
+
+def get_documents_version(db: Session, user_id: str) -> Tuple[int, Optional[datetime], int]:
+    """Count and newest upload of the user's documents, plus their preview count, for ETags"""
+    previews = db.query(func.count(models.DocumentPreview.digest)).join(
+        models.UploadedDocument, models.UploadedDocument.id == models.DocumentPreview.document_id
+    ).filter(models.UploadedDocument.user_id == user_id).scalar_subquery()
+    return db.query(
+        func.count(models.UploadedDocument.id),
+        func.max(models.UploadedDocument.upload_date),
+        previews
+    ).filter(models.UploadedDocument.user_id == user_id).one()
+
 def delete_document(db: Session, document_id: str, user_id: str) -> bool:
     db_document = db.query(models.UploadedDocument).filter(
         and_(
@@ -232,6 +432,61 @@ def delete_document(db: Session, document_id: str, user_id: str) -> bool:
         return True
     return False
 
+def get_document(db: Session, document_id: str, user_id: str) -> Optional[models.UploadedDocument]:
+    return db.query(models.UploadedDocument).filter(
+        and_(
+            models.UploadedDocument.id == document_id,
+            models.UploadedDocument.user_id == user_id
+        )
+    ).first()
+
+def user_has_preview(db: Session, digest: str, user_id: str) -> bool:
+    """Whether one of the user's documents has the preview stored under `digest`"""
+    return db.query(models.DocumentPreview.digest).join(
+        models.UploadedDocument, models.UploadedDocument.id == models.DocumentPreview.document_id
+    ).filter(
+        models.DocumentPreview.digest == digest,
+        models.UploadedDocument.user_id == user_id
+    ).first() is not None
+
+def get_study_aids(db: Session, document_ids: List[str], user_id: str) -> List[models.DocumentStudyAids]:
+    """Ready study aids for the user's documents among `document_ids`"""
+    if not document_ids:
+        return []
+    return db.query(models.DocumentStudyAids).join(
+        models.UploadedDocument, models.UploadedDocument.id == models.DocumentStudyAids.document_id
+    ).filter(
+        models.DocumentStudyAids.document_id.in_(document_ids),
+        models.DocumentStudyAids.status == "ready",
+        models.UploadedDocument.user_id == user_id
+    ).all()
+
+# Upload session CRUD
+def create_upload_session(db: Session, upload: schemas.UploadSessionCreate, user_id: str, temp_path: str, expires_at: datetime) -> models.UploadSession:
+    db_upload = models.UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        name=upload.name,
+        content_type=upload.content_type,
+        size=upload.size,
+        offset=0,
+        checksum=0,
+        temp_path=temp_path,
+        expires_at=expires_at
+    )
+    db.add(db_upload)
+    db.commit()
+    db.refresh(db_upload)
+    return db_upload
+
+def get_upload_session(db: Session, upload_id: str, user_id: str) -> Optional[models.UploadSession]:
+    return db.query(models.UploadSession).filter(
+        and_(
+            models.UploadSession.id == upload_id,
+            models.UploadSession.user_id == user_id
+        )
+    ).first()
+
 # Progress and Stats
 def get_user_progress(db: Session, user_id: str) -> dict:
     user = get_user(db, user_id)
@@ -268,4 +523,33 @@ def get_user_progress(db: Session, user_id: str) -> dict:
         "total_mindful_time": user.total_mindful_time,
         "sessions_today": sessions_today,
         "mindful_sessions_completed": mindful_completed
-    } 
\ No newline at end of file
+    }
+
+# Sync
+def get_settled_change_token(db: Session, settled_before: datetime) -> int:
+    """Newest change log id with nothing unsettled at or below it"""
+    oldest_unsettled = db.query(func.min(models.ChangeLog.id)).filter(
+        models.ChangeLog.changed_at > settled_before
+    ).scalar()
+    if oldest_unsettled is not None:
+        return oldest_unsettled - 1
+    return db.query(func.max(models.ChangeLog.id)).scalar() or 0
+
+def get_latest_change_id(db: Session) -> int:
+    return db.query(func.max(models.ChangeLog.id)).scalar() or 0
+
+def get_pruned_change_id(db: Session) -> int:
+    """Newest change log id removed by pruning; older tokens can't be synced"""
+    oldest = db.query(func.min(models.ChangeLog.id)).scalar()
+    return oldest - 1 if oldest else 0
+
+def get_changes(db: Session, user_id: str, since: int, limit: int) -> List[models.ChangeLog]:
+    return db.query(models.ChangeLog).filter(
+        models.ChangeLog.user_id == user_id,
+        models.ChangeLog.id > since
+    ).order_by(models.ChangeLog.id).limit(limit).all()
+
+def get_rows_by_ids(db: Session, model, ids: List[str]) -> list:
+    if not ids:
+        return []
+    return db.query(model).filter(model.id.in_(ids)).all()
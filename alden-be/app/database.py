@@ -1,13 +1,58 @@
-from sqlalchemy import create_engine
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from . import metrics
+from .profiling import current_profile
+
+logger = logging.getLogger("app.db")
 
 engine = create_engine(
     settings.database_url,
     connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
 )
 
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys (and ON DELETE CASCADE) unless asked per connection
+    if engine.dialect.name == "sqlite":
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+    metrics.db_query_duration.observe(elapsed, operation)
+
+    duration_ms = elapsed * 1000
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record_statement(statement, duration_ms)
+
+    if duration_ms >= settings.log_slow_query_ms:
+        logger.warning("Slow query", extra={"statement": statement, "duration_ms": round(duration_ms, 2)})
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Query", extra={"statement": statement, "duration_ms": round(duration_ms, 2)})
+
+@event.listens_for(engine, "handle_error")
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute; drop their start time
+    conn = context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -22,4 +67,105 @@ def get_db():
 
 def create_tables():
     """Create all tables in the database"""
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+
+# Arbitrary constant identifying the schema migration lock
+SCHEMA_LOCK_KEY = 7312004
+
+@contextmanager
+def _schema_lock(conn):
+    """Serialize schema changes across processes"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        return
+
+    try:
+        import fcntl
+    except ImportError:  # Windows: single-process development only
+        yield
+        return
+    with open(os.path.join(tempfile.gettempdir(), "alden-schema.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _pending_schema_changes(conn) -> list:
+    """Tables, columns and indexes defined on the models but missing in the database"""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append(("table", table))
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        changes.extend(("column", column) for column in table.columns if column.name not in columns)
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        changes.extend(("index", index) for index in table.indexes if index.name not in indexes)
+        if _needs_autoincrement(conn, table):
+            changes.append(("autoincrement", table))
+    return changes
+
+def _needs_autoincrement(conn, table) -> bool:
+    """A SQLite table declared with sqlite_autoincrement but created without AUTOINCREMENT"""
+    if conn.dialect.name != "sqlite" or not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    ddl = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+    ).scalar()
+    return ddl is not None and "AUTOINCREMENT" not in ddl.upper()
+
+def _rebuild_with_autoincrement(conn, table):
+    """SQLite can't alter a primary key, so copy the rows into a new table; the sequence starts at their max id"""
+    old = f"{table.name}_before_autoincrement"
+    conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {old}"))
+    # Index names are global in SQLite and would clash with the new table's
+    for index in table.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    table.create(conn)
+    columns = ", ".join(column.name for column in table.columns)
+    conn.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}"))
+    conn.execute(text(f"DROP TABLE {old}"))
+
+def _apply_schema_change(conn, kind: str, item):
+    if kind == "table":
+        item.create(conn)
+    elif kind == "column":
+        column_ddl = CreateColumn(item).compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {item.table.name} ADD COLUMN {column_ddl}"))
+    elif kind == "index":
+        # e.g. resolving rows that would violate a new unique index
+        prepare = item.info.get("before_create")
+        if prepare is not None:
+            prepare(conn)
+        item.create(conn)
+    elif kind == "autoincrement":
+        _rebuild_with_autoincrement(conn, item)
+    logger.info("Applied schema change", extra={"kind": kind, "schema_object": str(item)})
+
+def init_db():
+    """Create or migrate the schema, once across all workers.
+
+    Missing tables, columns and indexes are added; existing ones are left
+    untouched. The common case (schema already current) costs a few
+    catalog queries and takes no lock.
+    """
+    from . import models  # noqa: F401 - registers the tables on Base.metadata
+    from . import search
+
+    with engine.connect() as conn:
+        if not _pending_schema_changes(conn) and not search.index_missing(conn):
+            return
+        with _schema_lock(conn):
+            # Another worker may have migrated while we waited for the lock
+            for kind, item in _pending_schema_changes(conn):
+                _apply_schema_change(conn, kind, item)
+            # Search tables and triggers reference the columns created above
+            search.create_index(conn)
+            conn.commit()
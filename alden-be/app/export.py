@@ -0,0 +1,159 @@
+"""Streaming export of a user's history as NDJSON or CSV.
+
+Rows are read with Core selects (plain tuples, no ORM identity map) in
+`yield_per` partitions over a server-side cursor where the driver supports
+one, and written out in ~64 KB chunks, so memory use does not grow with the
+size of the history.
+"""
+import csv
+import enum
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Sequence
+
+from sqlalchemy import select
+
+from . import models
+from .compression import orjson
+from .database import engine
+from .services import archival
+
+ROWS_PER_FETCH = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+def _columns(table, names: Sequence[str]):
+    return [table.c[name] for name in names]
+
+
+_study = models.StudySession.__table__
+_mindful = models.MindfulSession.__table__
+_conversations = models.AidaConversation.__table__
+_messages = models.AidaMessage.__table__
+_documents = models.UploadedDocument.__table__
+_archives = models.AidaMessageArchive.__table__
+
+# Exported entity -> column names, in output order
+COLUMNS = {
+    "study_sessions": ("id", "subject", "goal", "technique", "duration", "start_time", "end_time", "completed", "focus_score", "notes", "created_at"),
+    "mindful_sessions": ("id", "title", "category", "duration", "audio_url", "completed", "completed_at", "rating", "created_at"),
+    "conversations": ("id", "title", "subject", "last_message", "created_at"),
+    "messages": ("id", "conversation_id", "type", "content", "timestamp"),
+    # Metadata only: no server paths or extracted text
+    "documents": ("id", "name", "type", "size", "upload_date"),
+}
+
+ENTITIES = tuple(COLUMNS)
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _query(entity: str, user_id: str):
+    names = COLUMNS[entity]
+    if entity == "study_sessions":
+        return select(*_columns(_study, names)).where(_study.c.user_id == user_id).order_by(_study.c.start_time)
+    if entity == "mindful_sessions":
+        return select(*_columns(_mindful, names)).where(_mindful.c.user_id == user_id).order_by(_mindful.c.created_at)
+    if entity == "conversations":
+        return select(*_columns(_conversations, names)).where(_conversations.c.user_id == user_id).order_by(_conversations.c.created_at)
+    if entity == "messages":
+        # Follows the (conversation_id, timestamp) index
+        return (
+            select(*_columns(_messages, names))
+            .join(_conversations, _conversations.c.id == _messages.c.conversation_id)
+            .where(_conversations.c.user_id == user_id)
+            .order_by(_messages.c.conversation_id, _messages.c.timestamp)
+        )
+    return select(*_columns(_documents, names)).where(_documents.c.user_id == user_id).order_by(_documents.c.upload_date)
+
+
+def _archived_rows(conn, user_id: str) -> Iterator[tuple]:
+    """Archived messages, one decompressed block at a time"""
+    blocks = conn.execution_options(stream_results=True, yield_per=1).execute(
+        select(_archives.c.conversation_id, _archives.c.payload)
+        .join(_conversations, _conversations.c.id == _archives.c.conversation_id)
+        .where(_conversations.c.user_id == user_id)
+        .order_by(_archives.c.conversation_id, _archives.c.first_timestamp, _archives.c.id)
+    )
+    for conversation_id, payload in blocks:
+        for message in archival.decode_messages(payload):
+            yield (message["id"], conversation_id, _value(message["type"]), message["content"], _value(message["timestamp"]))
+
+
+def _message_rows(conn, user_id: str) -> Iterator[tuple]:
+    """Messages in (conversation_id, timestamp) order, archived and hot.
+
+    A conversation's archived messages are all older than its hot ones, so
+    each conversation's archive blocks go out before its hot rows. Both
+    streams are merged by walking the user's conversation ids in the
+    database's own order and matching on equality, so nothing depends on
+    Python collating ids the way the database does.
+    """
+    options = {"stream_results": True, "yield_per": ROWS_PER_FETCH}
+    conversation_ids = conn.execution_options(**options).execute(
+        select(_conversations.c.id).where(_conversations.c.user_id == user_id).order_by(_conversations.c.id)
+    ).scalars()
+    hot = iter(conn.execution_options(**options).execute(_query("messages", user_id)))
+    archived = _archived_rows(conn, user_id)
+    next_hot, next_archived = next(hot, None), next(archived, None)
+    for conversation_id in conversation_ids:
+        while next_archived is not None and next_archived[1] == conversation_id:
+            yield next_archived
+            next_archived = next(archived, None)
+        while next_hot is not None and next_hot.conversation_id == conversation_id:
+            yield tuple(_value(value) for value in next_hot)
+            next_hot = next(hot, None)
+
+
+def iter_rows(conn, entity: str, user_id: str) -> Iterator[tuple]:
+    """Rows of one entity as tuples of JSON/CSV-ready values"""
+    if entity == "messages":
+        yield from _message_rows(conn, user_id)
+        return
+    result = conn.execution_options(stream_results=True, yield_per=ROWS_PER_FETCH).execute(_query(entity, user_id))
+    for row in result:
+        yield tuple(_value(value) for value in row)
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def stream_ndjson(user_id: str, entities: Sequence[str] = ENTITIES) -> Iterator[bytes]:
+    """One JSON object per line, tagged with its entity"""
+    with engine.connect() as conn:
+        buffer = bytearray()
+        for entity in entities:
+            names = ("entity",) + COLUMNS[entity]
+            for row in iter_rows(conn, entity, user_id):
+                buffer += _dumps(dict(zip(names, (entity,) + row)))
+                buffer += b"\n"
+                if len(buffer) >= CHUNK_SIZE:
+                    yield bytes(buffer)
+                    buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+
+def stream_csv(user_id: str, entity: str) -> Iterator[bytes]:
+    """One entity as CSV with a header row"""
+    with engine.connect() as conn:
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(COLUMNS[entity])
+        for row in iter_rows(conn, entity, user_id):
+            writer.writerow(row)
+            if text.tell() >= CHUNK_SIZE:
+                yield text.getvalue().encode("utf-8")
+                text.seek(0)
+                text.truncate()
+        yield text.getvalue().encode("utf-8")
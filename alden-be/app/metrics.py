@@ -0,0 +1,336 @@
+"""Prometheus metrics kept in process memory.
+
+Under `app.server` several workers serve /metrics, so each one writes a
+snapshot of its metrics to `<directory>/<pid>.json` every few seconds and
+/metrics answers with the sum over all snapshots. Counters and histograms
+of workers that have exited are kept, so totals never go down when a worker
+restarts; gauges only count live workers.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, tuned for API handlers and DB queries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class for metrics rendered in the Prometheus text format"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def render(self, items: Optional[list] = None) -> List[str]:
+        """This process's samples, or the given (labelvalues, value) items merged from several"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples(self.snapshot() if items is None else items))
+        return lines
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [(key, value) for key, value in self._values.items()]
+
+    def merge(self, snapshots: Iterable[Tuple[bool, list]]) -> list:
+        """Combine (process alive, snapshot) pairs by summing per label set"""
+        merged: Dict[Tuple[str, ...], float] = {}
+        for _, items in snapshots:
+            for key, value in items:
+                merged[key] = merged.get(key, 0.0) + value
+        return list(merged.items())
+
+    def _samples(self, items: list) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down; across workers, the sum (or `max`) over live ones"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def inc(self, amount: float = 1.0, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, *labelvalues: str):
+        self.inc(-amount, *labelvalues)
+
+    def set(self, value: float, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def merge(self, snapshots: Iterable[Tuple[bool, list]]) -> list:
+        live = [(alive, items) for alive, items in snapshots if alive]
+        if self.multiprocess_mode != "max":
+            return super().merge(live)
+        merged: Dict[Tuple[str, ...], float] = {}
+        for _, items in live:
+            for key, value in items:
+                merged[key] = max(merged.get(key, value), value)
+        return list(merged.items())
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: ([count per bucket (+Inf last)], [sum])
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[labelvalues] = state
+            state[0][index] += 1
+            state[1][0] += value
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [(key, (list(counts), total[0])) for key, (counts, total) in self._values.items()]
+
+    def merge(self, snapshots: Iterable[Tuple[bool, list]]) -> list:
+        merged: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        for _, items in snapshots:
+            for key, (counts, total) in items:
+                if key in merged:
+                    merged_counts, merged_total = merged[key]
+                    merged[key] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total)
+                else:
+                    merged[key] = (list(counts), total)
+        return list(merged.items())
+
+    def _samples(self, items: list) -> List[str]:
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                le_label = 'le="' + le + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Collection of metrics exposed on /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self.directory: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def share(self, directory: str, write_seconds: float):
+        """Publish this worker's metrics in `directory` and serve the merged ones (call from the event loop)"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._task = asyncio.create_task(self._write_periodically(write_seconds))
+
+    async def stop(self):
+        """Stop publishing; the last snapshot stays, so an exited worker's counters still count"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await asyncio.to_thread(self.write)
+
+    async def _write_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.write)
+            except OSError as e:
+                logger.warning("Failed to write metrics snapshot: %s", e)
+
+    def write(self):
+        """Replace this process's snapshot file atomically"""
+        pid = os.getpid()
+        data = {metric.name: [[list(key), value] for key, value in metric.snapshot()] for metric in self._metrics}
+        path = os.path.join(self.directory, f"{pid}.json")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    def _snapshots(self) -> List[Tuple[bool, dict]]:
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # removed or replaced while listing
+            pid = int(os.path.basename(path)[:-len(".json")])
+            snapshots.append((_alive(pid), data))
+        return snapshots
+
+    def render(self) -> str:
+        lines = []
+        if self.directory is None:
+            for metric in self._metrics:
+                lines.extend(metric.render())
+            return "\n".join(lines) + "\n"
+        # Our own snapshot too comes from the file, so each worker's share only ever grows
+        self.write()
+        snapshots = self._snapshots()
+        for metric in self._metrics:
+            per_process = [
+                (alive, [(tuple(key), value) for key, value in data.get(metric.name, [])])
+                for alive, data in snapshots
+            ]
+            lines.extend(metric.render(metric.merge(per_process)))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route template", ("method", "route", "status")
+))
+http_requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled"
+))
+
+# Database
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Duration of SQL statements by operation", ("operation",)
+))
+
+# AI provider
+ai_request_duration = registry.register(Histogram(
+    "ai_request_duration_seconds", "Latency of AI provider calls", ("model", "outcome"),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 60.0)
+))
+ai_tokens = registry.register(Counter(
+    "ai_tokens_total", "Tokens exchanged with the AI provider", ("model", "direction")
+))
+ai_fallbacks = registry.register(Counter(
+    "ai_fallbacks_total", "AI requests answered with a canned fallback", ("reason",)
+))
+ai_circuit_state = registry.register(Gauge(
+    "ai_circuit_state", "AI circuit breaker state per model (0 closed, 1 half-open, 2 open)", ("model",),
+    multiprocess_mode="max"
+))
+ai_hedged_requests = registry.register(Counter(
+    "ai_hedged_requests_total", "Hedged second AI calls by which call answered first", ("winner",)
+))
+ai_usage_dropped = registry.register(Counter(
+    "ai_usage_records_dropped_total", "AI usage records discarded because the write buffer was full"
+))
+
+# Uploads
+upload_bytes = registry.register(Counter(
+    "document_upload_bytes_total", "Bytes received through document uploads"
+))
+upload_throughput = registry.register(Histogram(
+    "document_upload_throughput_bytes_per_second", "Per-upload write throughput",
+    buckets=(1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8)
+))
+
+# Scheduled maintenance
+scheduled_job_duration = registry.register(Histogram(
+    "scheduled_job_duration_seconds", "Run time of scheduled maintenance jobs", ("job", "status"),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0)
+))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per route template.
+
+    Labels use the matched route's path (e.g. `/api/ai/conversations/{conversation_id}`)
+    so the series count stays bounded regardless of ids in the URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = ["500"]
+        # Background tasks run after the body is sent; time the response only
+        finished = [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished[0] = time.perf_counter()
+            await send(message)
+
+        http_requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            end = finished[0] or time.perf_counter()
+            http_request_duration.observe(end - start, scope["method"], route_path, status[0])
+            http_requests_in_progress.dec()
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, Text, ForeignKey, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, Integer, String, Date, DateTime, Boolean, Float, Text, ForeignKey, Enum, Index, LargeBinary, inspect, select, text, update
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from .database import Base
+from datetime import datetime
 import enum
 
 class StudyTechnique(enum.Enum):
@@ -31,24 +32,62 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     name = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)  # ETag source
     
     # User settings
     daily_goal = Column(Integer, default=120)  # minutes
     current_streak = Column(Integer, default=0)
     total_study_time = Column(Integer, default=0)  # minutes
     total_mindful_time = Column(Integer, default=0)  # minutes
+    recent_study_load = Column(Float, default=0.0)  # study minutes, decayed as of recent_study_load_at
+    recent_study_load_at = Column(DateTime(timezone=True), nullable=True)
+    deletion_requested_at = Column(DateTime(timezone=True), nullable=True)  # account purge pending
     
     # Relationships
-    study_sessions = relationship("StudySession", back_populates="user")
-    mindful_sessions = relationship("MindfulSession", back_populates="user")
-    conversations = relationship("AidaConversation", back_populates="user")
-    documents = relationship("UploadedDocument", back_populates="user")
+    study_sessions = relationship("StudySession", back_populates="user", passive_deletes=True)
+    mindful_sessions = relationship("MindfulSession", back_populates="user", passive_deletes=True)
+    conversations = relationship("AidaConversation", back_populates="user", passive_deletes=True)
+    documents = relationship("UploadedDocument", back_populates="user", passive_deletes=True)
+
+def _complete_extra_active_sessions(conn):
+    """Keep only each user's newest active study session, so the unique index can be built"""
+    sessions = StudySession.__table__
+    active = conn.execute(
+        select(sessions.c.id, sessions.c.user_id)
+        .where(sessions.c.completed == False)
+        .order_by(sessions.c.user_id, sessions.c.start_time.desc())
+    ).all()
+    seen, extra = set(), []
+    for session_id, user_id in active:
+        if user_id in seen:
+            extra.append((session_id, user_id))
+        seen.add(user_id)
+    if not extra:
+        return
+    conn.execute(
+        update(sessions)
+        .where(sessions.c.id.in_([session_id for session_id, _ in extra]))
+        .values(completed=True, end_time=sessions.c.start_time)
+    )
+    if inspect(conn).has_table("change_log"):
+        from .change_log import UPSERT, record_changes
+        record_changes(conn, [(user_id, "study_sessions", session_id, UPSERT) for session_id, user_id in extra])
 
 class StudySession(Base):
     __tablename__ = "study_sessions"
+    __table_args__ = (
+        # At most one active session per user; also serves /study-sessions/active
+        Index(
+            "uq_study_sessions_user_active", "user_id",
+            unique=True,
+            sqlite_where=text("completed = 0"),
+            postgresql_where=text("completed = false"),
+            info={"before_create": _complete_extra_active_sessions},
+        ),
+    )
     
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"))
     subject = Column(String)
     goal = Column(Text)
     technique = Column(Enum(StudyTechnique))
@@ -67,7 +106,7 @@ class MindfulSession(Base):
     __tablename__ = "mindful_sessions"
     
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"))
     title = Column(String)
     category = Column(Enum(MindfulCategory))
     duration = Column(Integer)  # in seconds
@@ -83,9 +122,13 @@ class MindfulSession(Base):
 
 class AidaConversation(Base):
     __tablename__ = "aida_conversations"
+    __table_args__ = (
+        # Serves the newest-first list and its ETag (count, max last_message)
+        Index("ix_aida_conversations_user_last_message", "user_id", "last_message"),
+    )
     
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"))
     title = Column(String)
     subject = Column(String, nullable=True)
     last_message = Column(DateTime(timezone=True))
@@ -93,13 +136,20 @@ class AidaConversation(Base):
     
     # Relationships
     user = relationship("User", back_populates="conversations")
-    messages = relationship("AidaMessage", back_populates="conversation", cascade="all, delete-orphan")
+    # Children are removed by the database (ON DELETE CASCADE) or in batches
+    # by crud.delete_conversation, never loaded just to be deleted
+    messages = relationship("AidaMessage", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True)
+    message_archives = relationship("AidaMessageArchive", cascade="all, delete-orphan", passive_deletes=True)
 
 class AidaMessage(Base):
     __tablename__ = "aida_messages"
+    __table_args__ = (
+        # Serves per-conversation reads in timestamp order and the archival scan
+        Index("ix_aida_messages_conversation_timestamp", "conversation_id", "timestamp"),
+    )
     
     id = Column(String, primary_key=True, index=True)
-    conversation_id = Column(String, ForeignKey("aida_conversations.id"))
+    conversation_id = Column(String, ForeignKey("aida_conversations.id", ondelete="CASCADE"))
     type = Column(Enum(MessageType))
     content = Column(Text)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
@@ -107,16 +157,181 @@ class AidaMessage(Base):
     # Relationships
     conversation = relationship("AidaConversation", back_populates="messages")
 
+class AidaMessageArchive(Base):
+    """A batch of old messages moved out of aida_messages, as zlib-compressed JSON"""
+    __tablename__ = "aida_message_archives"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(String, ForeignKey("aida_conversations.id", ondelete="CASCADE"), index=True)
+    message_count = Column(Integer)
+    first_timestamp = Column(DateTime(timezone=True))
+    last_timestamp = Column(DateTime(timezone=True))
+    payload = deferred(Column(LargeBinary))
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+class AidaMessageArchiveEntry(Base):
+    """Search index entry for one archived message; the text stays in the compressed block"""
+    __tablename__ = "aida_message_archive_entries"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)  # rowid in aida_message_archives_fts on SQLite
+    archive_id = Column(Integer, ForeignKey("aida_message_archives.id", ondelete="CASCADE"), index=True)
+    conversation_id = Column(String, nullable=False, index=True)
+    message_id = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)  # index of the message in the block's payload
+    timestamp = Column(DateTime(timezone=True))
+
 class UploadedDocument(Base):
     __tablename__ = "uploaded_documents"
+    __table_args__ = (
+        # Serves the newest-first list and its ETag (count, max upload_date)
+        Index("ix_uploaded_documents_user_upload_date", "user_id", "upload_date"),
+    )
     
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"))
     name = Column(String)
     type = Column(Enum(DocumentType))
     uri = Column(String)
     size = Column(Integer, nullable=True)
+    # Plain text for search when it could be extracted; deferred so lists don't load it
+    extracted_text = deferred(Column(Text, nullable=True))
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    user = relationship("User", back_populates="documents")
\ No newline at end of file
+    user = relationship("User", back_populates="documents")
+    study_aids = relationship("DocumentStudyAids", back_populates="document", uselist=False, cascade="all, delete-orphan")
+    # Small, so loaded with every document (one extra query per batch) for the preview URLs
+    previews = relationship("DocumentPreview", lazy="selectin", cascade="all, delete-orphan", passive_deletes=True)
+
+class DocumentStudyAids(Base):
+    """Summary, key terms and flashcards generated in the background after upload"""
+    __tablename__ = "document_study_aids"
+    
+    document_id = Column(String, ForeignKey("uploaded_documents.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(String, nullable=False)  # "pending", "ready" or "failed"
+    summary = Column(Text, nullable=True)
+    key_terms = Column(Text, nullable=True)  # JSON list of {term, definition}
+    flashcards = Column(Text, nullable=True)  # JSON list of {question, answer}
+    model = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    document = relationship("UploadedDocument", back_populates="study_aids")
+
+class DocumentPreview(Base):
+    """A rendered thumbnail of a document, stored under the SHA-256 of its bytes"""
+    __tablename__ = "document_previews"
+    __table_args__ = (
+        # Finds previews already rendered from an identical file
+        Index("ix_document_previews_source_digest", "source_digest"),
+        Index("ix_document_previews_digest", "digest"),
+    )
+    
+    document_id = Column(String, ForeignKey("uploaded_documents.id", ondelete="CASCADE"), primary_key=True)
+    size = Column(String, primary_key=True)  # "small", "medium" or "large"
+    digest = Column(String, nullable=False)  # SHA-256 of the JPEG; also its file name
+    source_digest = Column(String, nullable=False)  # SHA-256 of the original upload
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class UploadSession(Base):
+    """A resumable upload in progress; the document row is only created once every byte has arrived"""
+    __tablename__ = "upload_sessions"
+    __table_args__ = (
+        Index("ix_upload_sessions_expires_at", "expires_at"),
+    )
+    
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    name = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)  # total bytes announced at creation
+    offset = Column(BigInteger, nullable=False, default=0)  # bytes received so far
+    checksum = Column(BigInteger, nullable=False, default=0)  # CRC-32 of the first `offset` bytes
+    temp_path = Column(String, nullable=False)
+    document_id = Column(String, nullable=True)  # set once completed
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+class ChangeLog(Base):
+    """Append-only log of row changes per user; ids double as sync tokens"""
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_user_id_id", "user_id", "id"),
+        Index("ix_change_log_changed_at", "changed_at"),
+        # Never reuse the ids of deleted rows (e.g. a purged user's newest
+        # changes): a client token inside a reused range would skip changes
+        {"sqlite_autoincrement": True},
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    entity = Column(String, nullable=False)  # e.g. "study_sessions", "messages"
+    entity_id = Column(String, nullable=False)
+    operation = Column(String, nullable=False)  # "upsert" or "delete"
+    changed_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+class AIUsageRecord(Base):
+    """One AI provider call (or a stored answer served instead); append-only, written in batches"""
+    __tablename__ = "ai_usage_records"
+    __table_args__ = (
+        Index("ix_ai_usage_records_user_created_at", "user_id", "created_at"),
+        Index("ix_ai_usage_records_created_at", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=True)  # None for calls made outside a user's request
+    feature = Column(String, nullable=False)  # "chat", "flashcards" or "study_aids"
+    model = Column(String, nullable=True)  # None when no model was called
+    status = Column(String, nullable=False)  # "ok", "cached" or the fallback reason
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    response_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)  # prompt tokens served from the provider's context cache
+    latency_ms = Column(Integer, nullable=True)
+    cache_hit = Column(Boolean, nullable=False, default=False)
+    fallback = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class AIUsageDaily(Base):
+    """Per-user, per-day totals of ai_usage_records, kept up to date by the same batched writes"""
+    __tablename__ = "ai_usage_daily"
+    
+    user_id = Column(String, primary_key=True)  # "" for unattributed calls
+    day = Column(Date, primary_key=True)  # UTC
+    feature = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)  # "" when no model was called
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    response_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)  # sum, for averages
+    cache_hits = Column(Integer, nullable=False, default=0)
+    fallbacks = Column(Integer, nullable=False, default=0)
+
+class MindfulSessionScore(Base):
+    """Precomputed per-user preference for each catalog session, updated on completion"""
+    __tablename__ = "mindful_session_scores"
+    
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    catalog_id = Column(String, primary_key=True)
+    completions = Column(Integer, default=0)
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
+    last_completed_at = Column(DateTime(timezone=True), nullable=True)
+    affinity = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ScheduledJob(Base):
+    """Run state of a periodic maintenance job; the lease columns elect the worker that runs it"""
+    __tablename__ = "scheduled_jobs"
+    
+    name = Column(String, primary_key=True)
+    lease_holder = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_status = Column(String, nullable=True)  # "ok" or "error"
+    last_result = Column(Text, nullable=True)  # JSON summary or error message
@@ -0,0 +1,203 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .config import settings
+from .logging_config import request_id_var
+
+# Frames whose top of stack is in one of these files are waiting, not working
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+# ...and these functions block inside C code (e.g. the log listener's queue)
+_IDLE_FUNCTIONS = {("handlers.py", "dequeue")}
+
+# Maximum SQL statements kept per profile
+MAX_STATEMENTS = 200
+
+
+class RequestProfile:
+    """Samples and SQL statements collected while one request ran"""
+
+    def __init__(self, method: str, path: str, forced: bool):
+        self.id = uuid.uuid4().hex
+        self.request_id = request_id_var.get()
+        self.method = method
+        self.path = path
+        self.forced = forced
+        self.started_at = datetime.now(timezone.utc)
+        self.status: Optional[int] = None
+        self.duration_ms: float = 0.0
+        self.samples: Counter = Counter()
+        self.statements: List[dict] = []
+        self.dropped_statements = 0
+
+    def record_statement(self, statement: str, duration_ms: float):
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append({"statement": statement, "duration_ms": round(duration_ms, 3)})
+        else:
+            self.dropped_statements += 1
+
+    def folded(self) -> str:
+        """Samples in collapsed-stack format (flamegraph.pl, speedscope, inferno)"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 2),
+            "started_at": self.started_at.isoformat(),
+            "forced": self.forced,
+            "sample_count": sum(self.samples.values()),
+            "statement_count": len(self.statements) + self.dropped_statements,
+        }
+
+    def detail(self) -> dict:
+        data = self.summary()
+        data["statements"] = self.statements
+        data["top_stacks"] = [{"stack": stack, "count": count} for stack, count in self.samples.most_common(20)]
+        return data
+
+
+# Profile of the request being handled, read by the SQL hooks in database.py
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+class _Sampler:
+    """Background thread sampling every thread's stack while profiles are active.
+
+    Samples are credited to every request in flight at that moment, so under
+    concurrency a profile can include stacks of neighbouring requests.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: Dict[str, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[object, str] = {}
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._active[profile.id] = profile
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            self._active.pop(profile.id, None)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            # Clear before checking so an add() in between still wakes us
+            self._wakeup.clear()
+            if not self._active:
+                self._wakeup.wait()
+                continue
+            time.sleep(self.interval)
+
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = self._fold(frame)
+                if stack:
+                    stacks.append(stack)
+
+            with self._lock:
+                for profile in self._active.values():
+                    profile.samples.update(stacks)
+
+    def _fold(self, frame) -> Optional[str]:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename in _IDLE_FILES or (filename, frame.f_code.co_name) in _IDLE_FUNCTIONS:
+            return None
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                self._labels[code] = label
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+
+class ProfileStore:
+    """Bounded ring buffer of the most recent slow-request profiles"""
+
+    def __init__(self, size: int):
+        self._profiles = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[RequestProfile]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+
+sampler = _Sampler(settings.profiling_sample_interval_ms / 1000)
+profile_store = ProfileStore(settings.profiling_buffer_size)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware sampling requests and keeping the slow ones.
+
+    Active for every request when `profiling_enabled` is set, or for a single
+    request sending `X-Profile: 1` when `profiling_allow_header` is set.
+    Profiles slower than `profiling_slow_threshold_ms` (or forced by the
+    header) are kept in `profile_store`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        forced = settings.profiling_allow_header and (b"x-profile", b"1") in scope["headers"]
+        if not (settings.profiling_enabled or forced):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], forced)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        token = current_profile.set(profile)
+        sampler.add(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            sampler.remove(profile)
+            current_profile.reset(token)
+            if forced or profile.duration_ms >= settings.profiling_slow_threshold_ms:
+                profile_store.add(profile)
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import hmac
+
+from ..config import settings
+from ..database import engine
+from ..profiling import profile_store
+from ..services.archival import archive_old_messages
+from ..services.maintenance import scheduler
+from ..services.scheduler import JobBusy
+from ..services.usage import top_users
+from .. import search
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only with the configured admin token"""
+    if not settings.admin_token:
+        # Admin endpoints are disabled entirely without a token
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/profiles")
+def list_profiles():
+    """List retained slow-request profiles, newest first"""
+    return [profile.summary() for profile in profile_store.list()]
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    """Get a profile with its SQL statements and hottest stacks"""
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.detail()
+
+@router.get("/profiles/{profile_id}/folded", response_class=PlainTextResponse)
+def get_profile_folded(profile_id: str):
+    """Get a profile's samples as collapsed stacks for flame graph tools"""
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile.folded())
+
+@router.post("/search/rebuild")
+def rebuild_search_index():
+    """Re-index all searchable rows, e.g. after a SQLite VACUUM"""
+    with engine.begin() as conn:
+        search.rebuild_index(conn)
+    return {"message": "Search index rebuilt"}
+
+@router.post("/archive-messages")
+def archive_messages(older_than_days: Optional[int] = Query(None, ge=0)):
+    """Move old chat messages into compressed archive blocks now"""
+    return archive_old_messages(older_than_days)
+
+@router.get("/ai-usage")
+def ai_usage(days: int = Query(7, ge=1, le=366), limit: int = Query(50, ge=1, le=1000)):
+    """Users with the most AI tokens over the last `days` days, with estimated cost"""
+    return top_users(days, limit)
+
+@router.get("/jobs")
+def list_jobs():
+    """List scheduled maintenance jobs with their last run and current lease"""
+    return scheduler.status()
+
+@router.post("/jobs/{name}/run")
+def run_job(name: str):
+    """Run a scheduled maintenance job now, unless another worker is running it"""
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        return scheduler.run(name, force=True)
+    except JobBusy:
+        raise HTTPException(status_code=409, detail="Job is already running on another worker")
@@ -1,61 +1,107 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Header, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import logging
+import time
+from datetime import datetime
 
+from ..compression import FastJSONResponse
+from ..config import settings
 from ..database import get_db
 from ..schemas import (
     AidaConversation, AidaConversationCreate, AidaMessage,
-    ChatRequest, ChatResponse, MessageType
+    AIUsageSummary, ChatRequest, ChatResponse, MessageType
 )
-from .. import crud
+from .. import crud, http_cache
 from ..services.ai_service import ai_service
+from ..services.idempotency import IdempotencyInProgress, IdempotencyKeyReused, fingerprint, idempotency_guard
+from ..services.jobs import background_jobs
+from ..services.study_aids import answer_from_study_aids, prompt_context, to_schema
+from ..services.rate_limit import rate_limiter, RateLimitExceeded
+from ..services.usage import attribute, daily_usage, next_reset, usage_recorder
 
 router = APIRouter(prefix="/ai", tags=["ai-chat"])
 
+logger = logging.getLogger(__name__)
+
 def get_current_user_id() -> str:
     # TODO: Replace with proper authentication
     return "default-user"
 
+async def enforce_rate_limit(user_id: str, route: str):
+    """Reject the request with 429 when the user is over the route's limit"""
+    try:
+        await rate_limiter.hit(user_id, route)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests. Please slow down and try again shortly.",
+            headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))}
+        )
+
+def enforce_token_quota(user_id: str):
+    """Reject the request with 429 once the user's daily AI token quota is used up"""
+    if usage_recorder.quota_remaining(user_id) == 0:
+        resets_at = next_reset()
+        raise HTTPException(
+            status_code=429,
+            detail=f"You've used today's AI allowance. It resets at {resets_at.isoformat()}Z.",
+            headers={"Retry-After": str(max(1, int((resets_at - datetime.utcnow()).total_seconds())))}
+        )
+
 async def process_ai_response(
     db: Session,
     conversation_id: str,
     user_message: str,
     subject: Optional[str] = None,
-    documents: Optional[List[str]] = None
+    documents: Optional[List[str]] = None,
+    user_id: Optional[str] = None
 ):
     """Background task to process AI response"""
+    start = time.perf_counter()
     try:
-        # Generate AI response
-        ai_response = await ai_service.generate_study_response(
-            message=user_message,
-            subject=subject,
-            documents=documents
-        )
+        with attribute(user_id, "chat"):
+            # Precomputed study aids answer summary requests outright and give
+            # the model document notes without another pass over the text
+            study_aids = crud.get_study_aids(db, documents, user_id) if documents else []
+            ai_response = answer_from_study_aids(user_message, study_aids)
+            if ai_response is None:
+                ai_response = await ai_service.generate_study_response(
+                    message=user_message,
+                    subject=subject,
+                    documents=documents,
+                    document_notes=prompt_context(study_aids)
+                )
+            else:
+                usage_recorder.record_cached()
         
         # Save AI response to database
         crud.create_message(db, conversation_id, ai_response, MessageType.assistant)
+        logger.info(
+            "AI response stored",
+            extra={"conversation_id": conversation_id, "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
+        )
         
     except Exception as e:
-        print(f"Error processing AI response: {e}")
+        logger.exception("Error processing AI response: %s", e, extra={"conversation_id": conversation_id})
         # Save fallback response
         fallback_response = "I'm sorry, I'm experiencing technical difficulties. Please try again later."
         crud.create_message(db, conversation_id, fallback_response, MessageType.assistant)
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat_with_ai(
+def start_chat(
     request: ChatRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    user_id: str = Depends(get_current_user_id)
-):
-    """Send a message to the AI assistant"""
+    db: Session,
+    user_id: str
+) -> ChatResponse:
+    """Store the user's message and schedule the AI reply"""
     # Ensure user exists
     user = crud.get_user(db, user_id)
     if not user:
         # Create a default user for demo purposes
         from ..schemas import UserCreate
         user_create = UserCreate(email="demo@alden.app", name="Demo User")
-        user = crud.create_user(db, user_create)
+        user = crud.create_user(db, user_create, user_id)
     
     # Get or create conversation
     conversation_id = request.conversation_id
@@ -78,12 +124,14 @@ async def chat_with_ai(
     
     # Process AI response in background
     background_tasks.add_task(
+        background_jobs.run,
         process_ai_response,
         db,
         conversation_id,
         request.message,
         conversation.subject if 'conversation' in locals() else None,
-        request.documents
+        request.documents,
+        user_id
     )
     
     return ChatResponse(
@@ -92,17 +140,72 @@ async def chat_with_ai(
         message_id=user_message.id
     )
 
-@router.get("/conversations", response_model=List[AidaConversation])
+@router.post("/chat", response_model=ChatResponse)
+async def chat_with_ai(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Send a message to the AI assistant.
+
+    With an `Idempotency-Key` header, repeats of the same request (e.g. client
+    retries) return the original response instead of sending the message again.
+    """
+    if not idempotency_key:
+        await enforce_rate_limit(user_id, "ai_chat")
+        enforce_token_quota(user_id)
+        return start_chat(request, background_tasks, db, user_id)
+
+    key = f"chat:{user_id}:{idempotency_key}"
+    request_fingerprint = fingerprint(request.model_dump_json())
+    try:
+        replay = await idempotency_guard.begin(key, request_fingerprint)
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    except IdempotencyInProgress:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still being processed",
+            headers={"Retry-After": "1"}
+        )
+    if replay is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return ChatResponse(**replay)
+
+    try:
+        await enforce_rate_limit(user_id, "ai_chat")
+        enforce_token_quota(user_id)
+        result = start_chat(request, background_tasks, db, user_id)
+    except BaseException:
+        await idempotency_guard.abandon(key)
+        raise
+    await idempotency_guard.finish(key, request_fingerprint, result.model_dump())
+    return result
+
+@router.get("/conversations", response_model=List[AidaConversation], response_class=FastJSONResponse)
 def get_conversations(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
     """Get user's AI conversations"""
+    # New messages bump last_message, so count + newest activity covers the
+    # conversations and the messages embedded in them
+    count, last_message = crud.get_conversations_version(db, user_id)
+    etag = http_cache.make_etag("conversations", user_id, count, last_message)
+    not_modified = http_cache.conditional(request, response, etag, last_message)
+    if not_modified:
+        return not_modified
+
     conversations = crud.get_conversations(db, user_id)
     
     # Load messages for each conversation
     for conversation in conversations:
-        conversation.messages = crud.get_messages(db, conversation.id, user_id)
+        crud.attach_messages(conversation, crud.get_messages(db, conversation.id, user_id))
     
     return conversations
 
@@ -119,11 +222,11 @@ def create_conversation(
         # Create a default user for demo purposes
         from ..schemas import UserCreate
         user_create = UserCreate(email="demo@alden.app", name="Demo User")
-        user = crud.create_user(db, user_create)
+        user = crud.create_user(db, user_create, user_id)
     
     return crud.create_conversation(db, conversation, user_id)
 
-@router.get("/conversations/{conversation_id}", response_model=AidaConversation)
+@router.get("/conversations/{conversation_id}", response_model=AidaConversation, response_class=FastJSONResponse)
 def get_conversation(
     conversation_id: str,
     db: Session = Depends(get_db),
@@ -134,7 +237,7 @@ def get_conversation(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    conversation.messages = crud.get_messages(db, conversation_id, user_id)
+    crud.attach_messages(conversation, crud.get_messages(db, conversation_id, user_id))
     return conversation
 
 @router.delete("/conversations/{conversation_id}")
@@ -149,7 +252,7 @@ def delete_conversation(
         raise HTTPException(status_code=404, detail="Conversation not found")
     return {"message": "Conversation deleted successfully"}
 
-@router.get("/conversations/{conversation_id}/messages", response_model=List[AidaMessage])
+@router.get("/conversations/{conversation_id}/messages", response_model=List[AidaMessage], response_class=FastJSONResponse)
 def get_messages(
     conversation_id: str,
     db: Session = Depends(get_db),
@@ -160,14 +263,50 @@ def get_messages(
 
 @router.post("/flashcards")
 async def generate_flashcards(
-    content: str,
+    content: Optional[str] = None,
     subject: Optional[str] = None,
+    document_id: Optional[str] = None,
+    db: Session = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
-    """Generate flashcards from study content"""
+    """Generate flashcards from study content, or return a document's precomputed deck"""
+    if document_id:
+        document = crud.get_document(db, document_id, user_id)
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        study_aids = crud.get_study_aids(db, [document_id], user_id)
+        if study_aids and study_aids[0].flashcards:
+            with attribute(user_id, "flashcards"):
+                usage_recorder.record_cached()
+            return {"flashcards": to_schema(study_aids[0])["flashcards"], "precomputed": True}
+        # Same cap as the precomputed decks; extracted text can be far larger than a prompt should be
+        content = content or (document.extracted_text or "")[:settings.study_aids_max_chars]
+    if not content:
+        raise HTTPException(status_code=400, detail="Provide content or a document with extractable text")
+
+    await enforce_rate_limit(user_id, "ai_flashcards")
+    enforce_token_quota(user_id)
+
     try:
-        flashcards = await ai_service.generate_flashcards(content, subject)
+        with attribute(user_id, "flashcards"):
+            flashcards = await ai_service.generate_flashcards(content, subject)
         return {"flashcards": flashcards}
     except Exception as e:
-        print(f"Error generating flashcards: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate flashcards") 
\ No newline at end of file
+        logger.exception("Error generating flashcards: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to generate flashcards") 
+
+@router.get("/usage", response_model=AIUsageSummary)
+def get_usage(
+    days: int = Query(30, ge=1, le=366),
+    user_id: str = Depends(get_current_user_id)
+):
+    """The user's AI usage per day, feature and model, and today's quota"""
+    used_today = usage_recorder.tokens_used_today(user_id)
+    quota = settings.ai_daily_token_quota or None
+    return AIUsageSummary(
+        daily_token_quota=quota,
+        used_today=used_today,
+        remaining_today=max(0, quota - used_today) if quota else None,
+        resets_at=next_reset(),
+        days=daily_usage(user_id, days)
+    )
@@ -0,0 +1,144 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from typing import Optional, Tuple
+import json
+from datetime import datetime, timezone
+
+import anyio
+
+from ..config import settings
+from ..services.audio import audio_library, AudioAsset
+from .. import http_cache
+
+router = APIRouter(prefix="/audio", tags=["audio"])
+
+# Versioned URLs (?v=<hash> from the manifest) never change content
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Unversioned URLs may be replaced; revalidate daily with the ETag
+REVALIDATE_DAILY = "public, max-age=86400"
+MANIFEST_CACHE = "public, max-age=300"
+
+CHUNK_SIZE = 64 * 1024
+
+class FileRangeResponse(Response):
+    """Sends bytes [start, end] of a file.
+
+    Uses the ASGI zerocopysend extension (sendfile) when the server offers
+    it, otherwise streams the range in chunks read off the event loop.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict, media_type: str, method: str):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.send_header_only = method == "HEAD"
+        self.init_headers({**headers, "content-length": str(end - start + 1)})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        count = self.end - self.start + 1
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.start, "count": count, "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if count == 0 or remaining > 0:
+            # Empty file, or it shrank underneath us; end the response rather than hang
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range; None means send the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        # Multipart ranges are not worth supporting for audio; send everything
+        return None
+    first, _, last = spec.partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            start, end = size - int(last), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None  # malformed ranges are ignored (RFC 9110)
+    if first == "" and start >= size:
+        raise ValueError("empty suffix range")
+    start = max(0, start)
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+def _if_range_matches(request: Request, asset: AudioAsset, last_modified: str) -> bool:
+    """Whether a Range request may be honoured given If-Range (strong comparison)"""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == asset.etag
+    return if_range == last_modified
+
+@router.get("/manifest")
+def get_audio_manifest(request: Request):
+    """Sizes, durations and versioned URLs of all audio assets, for prefetching"""
+    body = json.dumps(audio_library.manifest(), separators=(",", ":")).encode("utf-8")
+    etag = http_cache.make_etag("audio-manifest", body)
+    headers = http_cache.cache_headers(etag, cache_control=MANIFEST_CACHE)
+    if http_cache.is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@router.api_route("/{name}", methods=["GET", "HEAD"])
+def get_audio(name: str, request: Request, v: Optional[str] = None):
+    """Serve an audio file with Range, ETag and long-lived caching"""
+    asset = audio_library.get(name)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    last_modified = http_cache.http_date(datetime.fromtimestamp(asset.mtime_ns / 1e9, timezone.utc))
+    headers = {
+        "ETag": asset.etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": IMMUTABLE if v == asset.version else REVALIDATE_DAILY,
+        "Accept-Ranges": "bytes",
+    }
+    if http_cache.is_not_modified(request, asset.etag):
+        return Response(status_code=304, headers=headers)
+
+    if settings.audio_accel_redirect_prefix:
+        # The proxy serves the file itself (sendfile, ranges) from an internal location
+        headers["X-Accel-Redirect"] = f"{settings.audio_accel_redirect_prefix.rstrip('/')}/{asset.name}"
+        return Response(headers=headers, media_type=asset.content_type)
+
+    byte_range = None
+    if _if_range_matches(request, asset, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("range"), asset.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{asset.size}"})
+
+    if byte_range is None:
+        return FileRangeResponse(asset.path, 0, asset.size - 1, 200, headers, asset.content_type, request.method)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{asset.size}"
+    return FileRangeResponse(asset.path, start, end, 206, headers, asset.content_type, request.method)
@@ -1,81 +1,326 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, UploadFile, File, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
 from sqlalchemy.orm import Session
-from typing import List
+from starlette.requests import ClientDisconnect
+from typing import List, Optional
+import asyncio
 import os
 import uuid
+import logging
+import re
 import shutil
+import time
+from datetime import datetime
 
+from ..compression import rows_response
+from ..config import settings
 from ..database import get_db
-from ..schemas import UploadedDocument, UploadedDocumentCreate
-from .. import crud
+from ..schemas import DocumentStudyAids, PreviewSize, UploadedDocument, UploadedDocumentCreate, UploadSession, UploadSessionCreate, UserCreate
+from .. import crud, http_cache, metrics, models
+from ..services import uploads
+from ..services.jobs import background_jobs
+from ..services.previews import preview_path, preview_pipeline
+from ..services.study_aids import study_aid_pipeline, to_schema
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+logger = logging.getLogger(__name__)
+
 def get_current_user_id() -> str:
     # TODO: Replace with proper authentication
     return "default-user"
 
-# Create uploads directory if it doesn't exist
 UPLOAD_DIRECTORY = "uploads"
-os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
-@router.post("/upload", response_model=UploadedDocument)
-async def upload_document(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    user_id: str = Depends(get_current_user_id)
-):
-    """Upload a document"""
-    # Ensure user exists
+ALLOWED_CONTENT_TYPES = ["application/pdf", "image/jpeg", "image/png", "text/plain"]
+
+# Preview URLs are content-addressed, so their bytes never change
+PREVIEW_CACHE = "private, max-age=31536000, immutable"
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+def extract_text(file_path: str, content_type: str):
+    """Searchable text of an upload; only plain text files for now"""
+    if content_type != "text/plain":
+        return None
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read(settings.search_max_document_chars)
+
+def ensure_user(db: Session, user_id: str):
     user = crud.get_user(db, user_id)
     if not user:
         # Create a default user for demo purposes
-        from ..schemas import UserCreate
         user_create = UserCreate(email="demo@alden.app", name="Demo User")
-        user = crud.create_user(db, user_create)
-    
-    # Validate file type
-    allowed_types = ["application/pdf", "image/jpeg", "image/png", "text/plain"]
-    if file.content_type not in allowed_types:
+        user = crud.create_user(db, user_create, user_id)
+    return user
+
+def check_content_type(content_type: Optional[str]):
+    if content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(
             status_code=400,
             detail="File type not supported. Please upload PDF, image, or text files."
         )
+
+def save_document(
+    background_tasks: BackgroundTasks,
+    db: Session,
+    user_id: str,
+    name: str,
+    content_type: str,
+    file_path: str,
+    size: Optional[int]
+) -> models.UploadedDocument:
+    """Create the document row for a file already stored at `file_path`"""
+    # Determine document type
+    doc_type = "pdf" if content_type == "application/pdf" else \
+               "image" if content_type.startswith("image/") else \
+               "text"
+    
+    # Create document record
+    document_create = UploadedDocumentCreate(
+        name=name,
+        type=doc_type,
+        uri=file_path,
+        size=size
+    )
+    
+    try:
+        extracted_text = extract_text(file_path, content_type)
+    except OSError as e:
+        logger.warning("Failed to extract text from %s: %s", file_path, e)
+        extracted_text = None
+    
+    document = crud.create_document(db, document_create, user_id, extracted_text)
+    if settings.precompute_study_aids and extracted_text:
+        background_tasks.add_task(background_jobs.run, study_aid_pipeline.process, document.id)
+    if preview_pipeline.wanted(document):
+        background_tasks.add_task(background_jobs.run, preview_pipeline.process, document.id)
+    return document
+
+@router.post("/upload", response_model=UploadedDocument)
+async def upload_document(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Upload a document"""
+    ensure_user(db, user_id)
+    check_content_type(file.content_type)
     
     # Generate unique filename
     file_extension = os.path.splitext(file.filename)[1]
     unique_filename = f"{uuid.uuid4()}{file_extension}"
     file_path = os.path.join(UPLOAD_DIRECTORY, unique_filename)
+
+    # Create uploads directory if it doesn't exist
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
     
     # Save file
     try:
+        start = time.perf_counter()
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
+            bytes_written = buffer.tell()
+        elapsed = time.perf_counter() - start
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+
+    metrics.upload_bytes.inc(bytes_written)
+    if elapsed > 0:
+        metrics.upload_throughput.observe(bytes_written / elapsed)
     
-    # Determine document type
-    doc_type = "pdf" if file.content_type == "application/pdf" else \
-               "image" if file.content_type.startswith("image/") else \
-               "text"
+    return save_document(background_tasks, db, user_id, file.filename, file.content_type, file_path, file.size)
+
+def get_open_upload(db: Session, upload_id: str, user_id: str) -> models.UploadSession:
+    upload = crud.get_upload_session(db, upload_id, user_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=410, detail="Upload expired")
+    return upload
+
+def offset_headers(upload: models.UploadSession) -> dict:
+    return {"Upload-Offset": str(upload.offset), "Upload-Length": str(upload.size), "Cache-Control": "no-store"}
+
+@router.post("/uploads", response_model=UploadSession, status_code=201)
+def create_upload(
+    upload: UploadSessionCreate,
+    response: Response,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Start a resumable upload; send the bytes with PATCH, then complete it"""
+    ensure_user(db, user_id)
+    check_content_type(upload.content_type)
+    if upload.size > settings.upload_max_bytes:
+        raise HTTPException(status_code=413, detail=f"File is larger than {settings.upload_max_bytes} bytes")
     
-    # Create document record
-    document_create = UploadedDocumentCreate(
-        name=file.filename,
-        type=doc_type,
-        uri=file_path,
-        size=file.size
+    temp_path = uploads.new_temp_path(str(uuid.uuid4()))
+    try:
+        uploads.preallocate(temp_path, upload.size)
+    except OSError as e:
+        uploads.remove_temp_file(temp_path)
+        raise HTTPException(status_code=507, detail=f"Not enough storage for this upload: {str(e)}")
+    
+    upload_session = crud.create_upload_session(db, upload, user_id, temp_path, uploads.expiry())
+    response.headers["Location"] = f"/api/documents/uploads/{upload_session.id}"
+    response.headers.update(offset_headers(upload_session))
+    return upload_session
+
+@router.get("/uploads/{upload_id}", response_model=UploadSession)
+def get_upload(
+    upload_id: str,
+    response: Response,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get an upload's offset, to resume after a dropped connection"""
+    upload = get_open_upload(db, upload_id, user_id)
+    response.headers.update(offset_headers(upload))
+    return upload
+
+@router.patch("/uploads/{upload_id}", response_model=UploadSession)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., ge=0),
+    upload_checksum: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Append the request body to an upload, starting at `Upload-Offset`"""
+    upload = get_open_upload(db, upload_id, user_id)
+    if upload.document_id:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+    try:
+        expected_checksum = uploads.parse_checksum(upload_checksum)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    start = time.perf_counter()
+    try:
+        segment, written, checksum = await uploads.write_chunk(upload, upload_offset, request.stream(), expected_checksum)
+    except uploads.UploadOffsetMismatch:
+        raise HTTPException(status_code=409, detail="Upload-Offset does not match the upload", headers=offset_headers(upload))
+    except uploads.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Chunk runs past the upload size", headers=offset_headers(upload))
+    except uploads.ChecksumMismatch:
+        raise HTTPException(status_code=460, detail="Chunk checksum mismatch", headers=offset_headers(upload))
+    except ClientDisconnect:
+        # The offset is unchanged, so the client resends this chunk
+        raise HTTPException(status_code=400, detail="Upload interrupted")
+    elapsed = time.perf_counter() - start
+    
+    metrics.upload_bytes.inc(written)
+    if elapsed > 0 and written:
+        metrics.upload_throughput.observe(written / elapsed)
+    
+    committed = await asyncio.to_thread(
+        uploads.commit_chunk, upload.id, upload.temp_path, segment, upload_offset, upload_offset + written, checksum
     )
+    if not committed:
+        # Another request for the same offset got there first
+        db.refresh(upload)
+        raise HTTPException(status_code=409, detail="Upload-Offset does not match the upload", headers=offset_headers(upload))
+    db.refresh(upload)
+    response.headers.update(offset_headers(upload))
+    return upload
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadedDocument)
+async def complete_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    upload_checksum: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Verify a fully received upload and create its document"""
+    upload = get_open_upload(db, upload_id, user_id)
+    if upload.document_id:
+        # Completed before; the client probably lost the response
+        document = crud.get_document(db, upload.document_id, user_id)
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        return document
+    if upload.offset != upload.size:
+        raise HTTPException(status_code=409, detail="Upload is incomplete", headers=offset_headers(upload))
+    try:
+        expected_checksum = uploads.parse_checksum(upload_checksum)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        actual_checksum = await asyncio.to_thread(uploads.file_crc32, upload.temp_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+    if actual_checksum != upload.checksum or expected_checksum not in (None, actual_checksum):
+        uploads.reset(upload.id)
+        raise HTTPException(
+            status_code=422,
+            detail="Upload is corrupted; send it again from offset 0",
+            headers={"Upload-Offset": "0"}
+        )
+    
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+    file_path = os.path.join(UPLOAD_DIRECTORY, f"{uuid.uuid4()}{os.path.splitext(upload.name)[1]}")
+    try:
+        os.replace(upload.temp_path, file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
     
-    return crud.create_document(db, document_create, user_id)
+    document = save_document(background_tasks, db, user_id, upload.name, upload.content_type, file_path, upload.size)
+    upload.document_id = document.id
+    db.commit()
+    return document
+
+@router.delete("/uploads/{upload_id}")
+def cancel_upload(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Abandon an upload and delete what was received"""
+    upload = crud.get_upload_session(db, upload_id, user_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if not upload.document_id:
+        uploads.remove_temp_file(upload.temp_path)
+    db.delete(upload)
+    db.commit()
+    return {"message": "Upload cancelled"}
 
 @router.get("/", response_model=List[UploadedDocument])
 def get_documents(
+    request: Request,
     db: Session = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
     """Get user's uploaded documents"""
-    return crud.get_documents(db, user_id)
+    count, last_upload, previews = crud.get_documents_version(db, user_id)
+    etag = http_cache.make_etag("documents", user_id, count, last_upload, previews)
+    headers = http_cache.cache_headers(etag, last_upload)
+    if http_cache.is_not_modified(request, etag, last_upload):
+        return Response(status_code=304, headers=headers)
+    return rows_response(crud.list_documents(db, user_id), headers)
+
+@router.get("/previews/{digest}")
+def get_preview_image(
+    digest: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Serve a preview JPEG by its SHA-256 (the URLs in a document's `previews`)"""
+    if not SHA256_HEX.match(digest) or not crud.user_has_preview(db, digest, user_id):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    headers = {"ETag": f'"{digest}"', "Cache-Control": PREVIEW_CACHE}
+    if http_cache.is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    path = preview_path(digest)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
 
 @router.delete("/{document_id}")
 def delete_document(
@@ -85,8 +330,7 @@ def delete_document(
 ):
     """Delete a document"""
     # Get document to find file path
-    documents = crud.get_documents(db, user_id)
-    document = next((doc for doc in documents if doc.id == document_id), None)
+    document = crud.get_document(db, document_id, user_id)
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -96,7 +340,7 @@ def delete_document(
         if os.path.exists(document.uri):
             os.remove(document.uri)
     except Exception as e:
-        print(f"Warning: Failed to delete file {document.uri}: {e}")
+        logger.warning("Failed to delete file %s: %s", document.uri, e)
     
     # Delete from database
     success = crud.delete_document(db, document_id, user_id)
@@ -105,6 +349,47 @@ def delete_document(
     
     return {"message": "Document deleted successfully"}
 
+@router.get("/{document_id}/study-aids", response_model=DocumentStudyAids)
+def get_document_study_aids(
+    document_id: str,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get the precomputed summary, key terms and flashcards of a document"""
+    document = crud.get_document(db, document_id, user_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not document.study_aids:
+        raise HTTPException(status_code=404, detail="No study aids for this document")
+    return to_schema(document.study_aids)
+
+@router.get("/{document_id}/preview")
+def get_document_preview(
+    document_id: str,
+    background_tasks: BackgroundTasks,
+    size: PreviewSize = PreviewSize.small,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Redirect to a document's preview, rendering it first if it doesn't exist yet"""
+    document = crud.get_document(db, document_id, user_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    preview = next((row for row in document.previews if row.size == size.value), None)
+    if preview:
+        return RedirectResponse(
+            f"/api/documents/previews/{preview.digest}",
+            status_code=302,
+            headers={"Cache-Control": http_cache.PRIVATE_REVALIDATE}
+        )
+    if preview_pipeline.rendering(document.id):
+        return JSONResponse({"detail": "Preview is being generated"}, status_code=202, headers={"Retry-After": "2"})
+    if not preview_pipeline.wanted(document):
+        raise HTTPException(status_code=404, detail="No preview for this document")
+    # Documents uploaded before previews existed get them on first request
+    background_tasks.add_task(background_jobs.run, preview_pipeline.process, document.id)
+    return JSONResponse({"detail": "Preview is being generated"}, status_code=202, headers={"Retry-After": "2"})
+
 @router.get("/{document_id}/content")
 def get_document_content(
     document_id: str,
@@ -112,28 +397,32 @@ def get_document_content(
     user_id: str = Depends(get_current_user_id)
 ):
     """Get document content for AI processing"""
-    # Get document
-    documents = crud.get_documents(db, user_id)
-    document = next((doc for doc in documents if doc.id == document_id), None)
+    document = crud.get_document(db, document_id, user_id)
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Read file content based on type
     try:
-        if document.type == "text":
+        if document.type == models.DocumentType.text:
+            # The stored copy is cut off at the search limit; only a shorter one is the whole file
+            text = document.extracted_text
+            if text is not None and len(text) < settings.search_max_document_chars:
+                return {"content": text, "type": "text"}
             with open(document.uri, "r", encoding="utf-8") as f:
                 content = f.read()
             return {"content": content, "type": "text"}
-        elif document.type == "pdf":
+        elif document.type == models.DocumentType.pdf:
             # For PDF, you might want to use PyPDF2 or similar library
             # For now, return a placeholder
             return {"content": "PDF content extraction not implemented yet", "type": "pdf"}
-        elif document.type == "image":
+        elif document.type == models.DocumentType.image:
             # For images, you might want to use OCR
             # For now, return a placeholder
             return {"content": "Image OCR not implemented yet", "type": "image"}
         else:
             raise HTTPException(status_code=400, detail="Unsupported document type")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read document: {str(e)}")
\ No newline at end of file
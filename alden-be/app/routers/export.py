@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from datetime import datetime
+
+from ..schemas import ExportEntity
+from .. import export
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+def get_current_user_id() -> str:
+    # TODO: Replace with proper authentication
+    return "default-user"
+
+def _attachment(extension: str) -> dict:
+    filename = f"alden-history-{datetime.utcnow():%Y%m%d}.{extension}"
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+@router.get("/history.ndjson")
+def export_ndjson(
+    entity: Optional[List[ExportEntity]] = Query(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Stream the user's history as newline-delimited JSON"""
+    entities = [e.value for e in entity] if entity else export.ENTITIES
+    return StreamingResponse(
+        export.stream_ndjson(user_id, entities),
+        media_type="application/x-ndjson",
+        headers=_attachment("ndjson"),
+    )
+
+@router.get("/{entity}.csv")
+def export_csv(
+    entity: ExportEntity,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Stream one kind of history record as CSV"""
+    return StreamingResponse(
+        export.stream_csv(user_id, entity.value),
+        media_type="text/csv",
+        headers=_attachment(f"{entity.value}.csv"),
+    )
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import List
+from datetime import datetime
+import json
 
+from ..compression import rows_response
 from ..database import get_db
-from ..schemas import MindfulSession, MindfulSessionCreate, MindfulSessionComplete
-from .. import crud
+from ..schemas import MindfulSession, MindfulSessionCreate, MindfulSessionComplete, MindfulRecommendations, RecommendationContext
+from ..services import recommender
+from .. import catalog, crud, http_cache
 
 router = APIRouter(prefix="/mindful-sessions", tags=["mindful-sessions"])
 
@@ -12,6 +16,10 @@ def get_current_user_id() -> str:
     # TODO: Replace with proper authentication
     return "default-user"
 
+# Static catalog, serialized once at import
+PREBUILT_SESSIONS_BODY = json.dumps(catalog.PREBUILT_SESSIONS, separators=(",", ":")).encode("utf-8")
+PREBUILT_SESSIONS_ETAG = http_cache.make_etag("prebuilt", PREBUILT_SESSIONS_BODY)
+
 @router.post("/", response_model=MindfulSession)
 def create_mindful_session(
     session: MindfulSessionCreate,
@@ -25,7 +33,7 @@ def create_mindful_session(
         # Create a default user for demo purposes
         from ..schemas import UserCreate
         user_create = UserCreate(email="demo@alden.app", name="Demo User")
-        user = crud.create_user(db, user_create)
+        user = crud.create_user(db, user_create, user_id)
     
     return crud.create_mindful_session(db, session, user_id)
 
@@ -35,7 +43,7 @@ def get_mindful_sessions(
     user_id: str = Depends(get_current_user_id)
 ):
     """Get user's mindful sessions"""
-    return crud.get_mindful_sessions(db, user_id)
+    return rows_response(crud.list_mindful_sessions(db, user_id))
 
 @router.put("/{session_id}/complete", response_model=MindfulSession)
 def complete_mindful_session(
@@ -51,39 +59,30 @@ def complete_mindful_session(
     return session
 
 @router.get("/prebuilt")
-def get_prebuilt_sessions():
+def get_prebuilt_sessions(request: Request):
     """Get prebuilt mindful sessions"""
-    return [
-        {
-            "id": "focus-boost",
-            "title": "Focus Boost",
-            "category": "pre_study",
-            "duration": 240,
-            "audio_url": "/audio/focus-boost.mp3",
-            "description": "A 4-minute meditation to prepare your mind for focused study",
-        },
-        {
-            "id": "sos-breathing",
-            "title": "SOS Breathing",
-            "category": "quick_relief",
-            "duration": 60,
-            "audio_url": "/audio/sos-breathing.mp3",
-            "description": "Quick breathing exercise for immediate stress relief",
-        },
-        {
-            "id": "study-reflection",
-            "title": "Study Reflection",
-            "category": "post_study",
-            "duration": 420,
-            "audio_url": "/audio/study-reflection.mp3",
-            "description": "Wind down and reflect on your study session",
-        },
-        {
-            "id": "pre-exam-calm",
-            "title": "Pre-Exam Calm",
-            "category": "exam_support",
-            "duration": 600,
-            "audio_url": "/audio/pre-exam-calm.mp3",
-            "description": "Calm your nerves before an important exam",
-        },
-    ] 
\ No newline at end of file
+    headers = http_cache.cache_headers(PREBUILT_SESSIONS_ETAG, cache_control=http_cache.PUBLIC_CATALOG)
+    if http_cache.is_not_modified(request, PREBUILT_SESSIONS_ETAG):
+        return Response(status_code=304, headers=headers)
+    return Response(PREBUILT_SESSIONS_BODY, media_type="application/json", headers=headers)
+
+@router.get("/recommendations", response_model=MindfulRecommendations)
+def get_recommendations(
+    context: RecommendationContext = RecommendationContext.anytime,
+    limit: int = Query(3, ge=1, le=len(catalog.PREBUILT_SESSIONS)),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Catalog sessions ranked for this user and moment"""
+    user = crud.get_user(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    now = datetime.utcnow()
+    study_load = recommender.decayed_load(user.recent_study_load, user.recent_study_load_at, now)
+    scores = crud.get_mindful_scores(db, user_id)
+    return {
+        "context": context,
+        "recent_study_load": round(study_load, 1),
+        "recommendations": recommender.rank(scores, context.value, study_load, now, limit),
+    }
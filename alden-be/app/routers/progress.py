@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
+import asyncio
 
 from ..database import get_db
 from ..schemas import UserProgress, User
-from .. import crud
+from .. import crud, http_cache
+from ..services import purge
+from ..services.jobs import background_jobs
 
 router = APIRouter(prefix="/progress", tags=["progress"])
 
@@ -24,6 +27,8 @@ def get_user_progress(
 
 @router.get("/user", response_model=User)
 def get_user_profile(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
@@ -33,9 +38,30 @@ def get_user_profile(
         # Create a default user for demo purposes
         from ..schemas import UserCreate
         user_create = UserCreate(email="demo@alden.app", name="Demo User")
-        user = crud.create_user(db, user_create)
+        user = crud.create_user(db, user_create, user_id)
+
+    # Rows created before updated_at existed fall back to created_at
+    last_modified = user.updated_at or user.created_at
+    etag = http_cache.make_etag("user", user.id, last_modified)
+    not_modified = http_cache.conditional(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
     return user
 
+@router.delete("/user", status_code=202)
+def delete_account(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Delete the user and all their data; the purge runs in the background"""
+    if not crud.get_user(db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    purge.request_account_deletion(user_id)
+    # Interrupted purges are finished by the purge_requested_accounts job
+    background_tasks.add_task(background_jobs.run, asyncio.to_thread, purge.purge_user, user_id)
+    return {"message": "Account deletion started"}
+
 @router.put("/daily-goal")
 def update_daily_goal(
     goal_minutes: int,
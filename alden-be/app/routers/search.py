@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from ..database import get_db
+from ..schemas import SearchKind, SearchResponse
+from .. import search
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+def get_current_user_id() -> str:
+    # TODO: Replace with proper authentication
+    return "default-user"
+
+@router.get("/", response_model=SearchResponse)
+def search_everything(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[List[SearchKind]] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Search messages, conversation titles and documents, best matches first"""
+    kinds = [k.value for k in kind] if kind else list(search.KINDS)
+    try:
+        results, has_more = search.search(db, user_id, q, kinds, limit, offset)
+    except OperationalError:
+        # The FTS5 tables are missing when SQLite was built without FTS5
+        raise HTTPException(status_code=503, detail="Search is not available")
+    return {"results": results, "has_more": has_more}
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 
+from ..compression import rows_response
 from ..database import get_db
 from ..schemas import StudySession, StudySessionCreate, StudySessionUpdate
 from .. import crud
@@ -19,22 +20,14 @@ def create_study_session(
     db: Session = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
-    """Start a new study session"""
-    # Check if user has an active session
-    active_session = crud.get_active_study_session(db, user_id)
-    if active_session:
-        raise HTTPException(
-            status_code=400,
-            detail="You already have an active study session. End it before starting a new one."
-        )
-    
+    """Start a new study session, or return the one already active"""
     # Ensure user exists
     user = crud.get_user(db, user_id)
     if not user:
         # Create a default user for demo purposes
         from ..schemas import UserCreate
         user_create = UserCreate(email="demo@alden.app", name="Demo User")
-        user = crud.create_user(db, user_create)
+        user = crud.create_user(db, user_create, user_id)
     
     return crud.create_study_session(db, session, user_id)
 
@@ -46,7 +39,7 @@ def get_study_sessions(
     user_id: str = Depends(get_current_user_id)
 ):
     """Get user's study sessions"""
-    return crud.get_study_sessions(db, user_id, skip, limit)
+    return rows_response(crud.list_study_sessions(db, user_id, skip, limit))
 
 @router.get("/active", response_model=StudySession)
 def get_active_session(
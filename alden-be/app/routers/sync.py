@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+
+from ..config import settings
+from ..compression import FastJSONResponse
+from ..database import get_db
+from ..schemas import SyncResponse
+from ..change_log import DELETE
+from .. import crud, models
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+def get_current_user_id() -> str:
+    # TODO: Replace with proper authentication
+    return "default-user"
+
+# Entity name in the change log -> model whose current rows are returned
+SYNC_MODELS = {
+    "study_sessions": models.StudySession,
+    "mindful_sessions": models.MindfulSession,
+    "conversations": models.AidaConversation,
+    "messages": models.AidaMessage,
+    "documents": models.UploadedDocument,
+    "user": models.User,
+}
+
+def _as_naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+@router.get("", response_model=SyncResponse, response_class=FastJSONResponse)
+def sync(
+    since: Optional[str] = None,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Rows created, updated or deleted since a previous sync token"""
+    settled_before = datetime.utcnow() - timedelta(seconds=settings.sync_settle_seconds)
+
+    if since is None:
+        # First sync: the client loads everything, then syncs from this token
+        return SyncResponse(token=str(crud.get_settled_change_token(db, settled_before)), reset=True)
+    try:
+        since_id = int(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    if since_id < 0 or since_id > crud.get_latest_change_id(db) or since_id < crud.get_pruned_change_id(db):
+        # Token from another database (e.g. after a reset), or older than the
+        # retained change log
+        return SyncResponse(token=str(crud.get_settled_change_token(db, settled_before)), reset=True)
+
+    entries = crud.get_changes(db, user_id, since_id, settings.sync_page_size + 1)
+    has_more = len(entries) > settings.sync_page_size
+    entries = entries[:settings.sync_page_size]
+
+    # Changes from transactions that may still be committing are sent, but the
+    # token stops before them so the next sync looks again
+    token = since_id
+    for entry in entries:
+        if _as_naive_utc(entry.changed_at) > settled_before:
+            break
+        token = entry.id
+    if token == since_id:
+        has_more = False
+
+    # Only the latest operation per row matters
+    latest = {}
+    for entry in entries:
+        latest[(entry.entity, entry.entity_id)] = entry.operation
+
+    response = {"token": str(token), "has_more": has_more, "deleted": {}}
+    upserts = {}
+    for (entity, entity_id), operation in latest.items():
+        if entity not in SYNC_MODELS:
+            continue
+        if operation == DELETE:
+            response["deleted"].setdefault(entity, []).append(entity_id)
+        else:
+            upserts.setdefault(entity, []).append(entity_id)
+
+    for entity, ids in upserts.items():
+        rows = crud.get_rows_by_ids(db, SYNC_MODELS[entity], ids)
+        if entity == "user":
+            response["user"] = rows[0] if rows else None
+        else:
+            response[entity] = rows
+    return response
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, List, Dict
+from datetime import date, datetime
 from enum import Enum
 
 class StudyTechnique(str, Enum):
@@ -14,6 +14,34 @@ class MindfulCategory(str, Enum):
     post_study = "post_study"
     exam_support = "exam_support"
 
+class RecommendationContext(str, Enum):
+    pre_study = "pre_study"
+    post_study = "post_study"
+    exam = "exam"
+    anytime = "anytime"
+
+class SearchKind(str, Enum):
+    messages = "messages"
+    conversations = "conversations"
+    documents = "documents"
+
+class ExportEntity(str, Enum):
+    study_sessions = "study_sessions"
+    mindful_sessions = "mindful_sessions"
+    conversations = "conversations"
+    messages = "messages"
+    documents = "documents"
+
+class PreviewSize(str, Enum):
+    small = "small"
+    medium = "medium"
+    large = "large"
+
+class StudyAidStatus(str, Enum):
+    pending = "pending"
+    ready = "ready"
+    failed = "failed"
+
 class DocumentType(str, Enum):
     pdf = "pdf"
     image = "image"
@@ -94,6 +122,19 @@ class MindfulSession(MindfulSessionBase):
     class Config:
         from_attributes = True
 
+class PrebuiltMindfulSession(MindfulSessionBase):
+    id: str
+
+class MindfulRecommendation(BaseModel):
+    session: PrebuiltMindfulSession
+    score: float
+    reasons: List[str]
+
+class MindfulRecommendations(BaseModel):
+    context: RecommendationContext
+    recent_study_load: float  # decayed study minutes
+    recommendations: List[MindfulRecommendation]
+
 # Message schemas
 class AidaMessageBase(BaseModel):
     content: str
@@ -118,16 +159,18 @@ class AidaConversationBase(BaseModel):
 class AidaConversationCreate(AidaConversationBase):
     pass
 
-class AidaConversation(AidaConversationBase):
+class AidaConversationSummary(AidaConversationBase):
     id: str
     user_id: str
     last_message: datetime
     created_at: datetime
-    messages: List[AidaMessage] = []
     
     class Config:
         from_attributes = True
 
+class AidaConversation(AidaConversationSummary):
+    messages: List[AidaMessage] = []
+
 # Document schemas
 class UploadedDocumentBase(BaseModel):
     name: str
@@ -137,16 +180,76 @@ class UploadedDocumentCreate(UploadedDocumentBase):
     uri: str
     size: Optional[int] = None
 
+def preview_url(digest: str) -> str:
+    """URL of a stored preview, relative to /api"""
+    return f"/documents/previews/{digest}"
+
 class UploadedDocument(UploadedDocumentBase):
     id: str
     user_id: str
     uri: str
     size: Optional[int] = None
     upload_date: datetime
+    previews: Dict[PreviewSize, str] = {}  # size -> preview URL (relative to /api)
+    
+    @field_validator("previews", mode="before")
+    @classmethod
+    def preview_urls(cls, value):
+        # Built from the document's DocumentPreview rows
+        if isinstance(value, dict):
+            return value
+        return {row.size: preview_url(row.digest) for row in value or []}
     
     class Config:
         from_attributes = True
 
+class UploadSessionCreate(BaseModel):
+    name: str
+    content_type: str
+    size: int = Field(..., gt=0)
+
+class UploadSession(BaseModel):
+    id: str
+    name: str
+    content_type: str
+    size: int
+    offset: int
+    expires_at: datetime
+    document_id: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class KeyTerm(BaseModel):
+    term: str
+    definition: str
+
+class Flashcard(BaseModel):
+    question: str
+    answer: str
+
+class DocumentStudyAids(BaseModel):
+    document_id: str
+    status: StudyAidStatus
+    summary: Optional[str] = None
+    key_terms: List[KeyTerm] = []
+    flashcards: List[Flashcard] = []
+    updated_at: Optional[datetime] = None
+
+# Search schemas
+class SearchResult(BaseModel):
+    kind: str  # "message", "conversation" or "document"
+    id: str
+    conversation_id: Optional[str] = None
+    title: Optional[str] = None
+    snippet: Optional[str] = None  # matches wrapped in <mark></mark>
+    score: float  # lower is better
+    timestamp: Optional[datetime] = None
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    has_more: bool
+
 # AI Chat schemas
 class ChatRequest(BaseModel):
     message: str
@@ -158,6 +261,26 @@ class ChatResponse(BaseModel):
     conversation_id: str
     message_id: str
 
+class AIUsageDay(BaseModel):
+    day: date  # UTC
+    feature: str  # "chat", "flashcards" or "study_aids"
+    model: Optional[str] = None  # None for answers served without a model call
+    requests: int
+    prompt_tokens: int
+    response_tokens: int
+    cached_tokens: int
+    cache_hits: int
+    fallbacks: int
+    avg_latency_ms: Optional[float] = None
+    estimated_cost: Optional[float] = None  # USD; None when the model has no configured price
+
+class AIUsageSummary(BaseModel):
+    daily_token_quota: Optional[int] = None  # None when unlimited
+    used_today: int
+    remaining_today: Optional[int] = None
+    resets_at: datetime
+    days: List[AIUsageDay]
+
 # Progress schemas
 class UserProgress(BaseModel):
     daily_goal: int
@@ -166,4 +289,17 @@ class UserProgress(BaseModel):
     total_study_time: int
     total_mindful_time: int
     sessions_today: int
-    mindful_sessions_completed: int 
\ No newline at end of file
+    mindful_sessions_completed: int
+
+# Sync schemas
+class SyncResponse(BaseModel):
+    token: str  # pass back as ?since= on the next call
+    reset: bool = False  # token unknown or expired: reload everything, then sync from `token`
+    has_more: bool = False  # more changes are waiting; call again right away
+    study_sessions: List[StudySession] = []
+    mindful_sessions: List[MindfulSession] = []
+    conversations: List[AidaConversationSummary] = []
+    messages: List[AidaMessage] = []
+    documents: List[UploadedDocument] = []
+    user: Optional[User] = None
+    deleted: Dict[str, List[str]] = {}  # entity -> ids
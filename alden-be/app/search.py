@@ -0,0 +1,405 @@
+"""Full-text search over messages, conversation titles and document text.
+
+SQLite uses external-content FTS5 tables kept current by triggers on the
+source tables; PostgreSQL uses generated tsvector columns with GIN indexes.
+Either way the index is updated in the same statement as the row, and the
+schema is created by `init_db`.
+
+Archived messages live in compressed blocks, so they are indexed through
+`aida_message_archive_entries`, one row per message pointing into its
+block. On SQLite the text goes into a contentless FTS5 table keyed by the
+entry id; on PostgreSQL into a tsvector column on the entry. Archival and
+purging keep it current with `index_archive_block` and `unindex_archives`.
+"""
+import logging
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("messages", "conversations", "documents")
+
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+SNIPPET_WORDS = 12
+
+# Source table -> (FTS table, indexed columns)
+SQLITE_INDEXES = {
+    "aida_messages": ("aida_messages_fts", ("content",)),
+    "aida_conversations": ("aida_conversations_fts", ("title", "subject")),
+    "uploaded_documents": ("uploaded_documents_fts", ("name", "extracted_text")),
+}
+
+# Source table -> tsvector expression
+POSTGRES_VECTORS = {
+    "aida_messages": "to_tsvector('english', coalesce(content, ''))",
+    "aida_conversations": "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(subject, ''))",
+    "uploaded_documents": "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(extracted_text, ''))",
+}
+
+ARCHIVE_FTS = "aida_message_archives_fts"
+
+# Result kind -> sources ranked separately
+SOURCES = {
+    "messages": ("messages", "archived_messages"),
+    "conversations": ("conversations",),
+    "documents": ("documents",),
+}
+
+_archives = models.AidaMessageArchive.__table__
+_entries = models.AidaMessageArchiveEntry.__table__
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Whether this SQLite build has FTS5; probed once per process
+_fts5_available: Optional[bool] = None
+
+
+def _sqlite_ddl(source: str, fts: str, columns: Sequence[str]) -> List[str]:
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_values});"
+    insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{source}', content_rowid='rowid', tokenize='porter unicode61')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {source} BEGIN {insert_new} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {source} BEGIN {delete_old} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {source} BEGIN {delete_old} {insert_new} END",
+        # Index the rows that existed before the index did
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def _sqlite_drop(fts: str) -> List[str]:
+    """Undo `_sqlite_ddl` (SQLite runs DDL outside the transaction, so a failure leaves it half done)"""
+    return [f"DROP TRIGGER IF EXISTS {fts}_{suffix}" for suffix in ("ai", "ad", "au")] + [f"DROP TABLE IF EXISTS {fts}"]
+
+
+def fts5_available(conn) -> bool:
+    """Probe FTS5 with a table in the connection's temp schema, which never touches the database file"""
+    global _fts5_available
+    if _fts5_available is None:
+        try:
+            conn.execute(text("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)"))
+            conn.execute(text("DROP TABLE temp.fts5_probe"))
+            _fts5_available = True
+        except Exception:
+            logger.warning("SQLite FTS5 is not available; search is disabled")
+            _fts5_available = False
+    return _fts5_available
+
+
+def _sqlite_tables(conn) -> set:
+    return {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+
+
+def _postgres_vector_tables(conn) -> set:
+    return set(conn.execute(text(
+        "SELECT table_name FROM information_schema.columns WHERE column_name = 'search_vector' "
+        "AND table_name IN ('aida_messages', 'aida_conversations', 'uploaded_documents', 'aida_message_archive_entries')"
+    )).scalars())
+
+
+def archive_index_exists(conn) -> bool:
+    if conn.dialect.name == "sqlite":
+        return ARCHIVE_FTS in _sqlite_tables(conn)
+    if conn.dialect.name == "postgresql":
+        return _entries.name in _postgres_vector_tables(conn)
+    return False
+
+
+def index_missing(conn) -> bool:
+    if conn.dialect.name == "sqlite":
+        if not fts5_available(conn):
+            return False  # nothing can be created, so don't take the schema lock for it
+        existing = _sqlite_tables(conn)
+        return any(fts not in existing for fts, _ in SQLITE_INDEXES.values()) or ARCHIVE_FTS not in existing
+    if conn.dialect.name == "postgresql":
+        return len(_postgres_vector_tables(conn)) < len(POSTGRES_VECTORS) + 1
+    return False
+
+
+def create_index(conn):
+    """Create whatever part of the search index is missing (called under the schema lock)"""
+    global _fts5_available
+    if conn.dialect.name == "sqlite":
+        if not fts5_available(conn):
+            return
+        existing = _sqlite_tables(conn)
+        for source, (fts, columns) in SQLITE_INDEXES.items():
+            if fts in existing:
+                continue
+            try:
+                for statement in _sqlite_ddl(source, fts, columns):
+                    conn.execute(text(statement))
+            except Exception:
+                logger.warning("Could not create the search index; search is disabled", exc_info=True)
+                for statement in _sqlite_drop(fts):
+                    conn.execute(text(statement))
+                _fts5_available = False
+                return
+            logger.info("Created search index", extra={"schema_object": fts})
+        if ARCHIVE_FTS not in existing:
+            try:
+                conn.execute(text(f"CREATE VIRTUAL TABLE {ARCHIVE_FTS} USING fts5(content, content='', tokenize='porter unicode61')"))
+                _index_existing_archives(conn)
+            except Exception:
+                logger.warning("Could not create the archive search index; search is disabled", exc_info=True)
+                conn.execute(text(f"DROP TABLE IF EXISTS {ARCHIVE_FTS}"))
+                _fts5_available = False
+                return
+            logger.info("Created search index", extra={"schema_object": ARCHIVE_FTS})
+    elif conn.dialect.name == "postgresql":
+        for source, vector in POSTGRES_VECTORS.items():
+            conn.execute(text(
+                f"ALTER TABLE {source} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED"
+            ))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{source}_search_vector ON {source} USING gin (search_vector)"))
+        if not archive_index_exists(conn):
+            # Not generated: the text is in the compressed block, so it is set when the entry is written
+            conn.execute(text(f"ALTER TABLE {_entries.name} ADD COLUMN search_vector tsvector"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{_entries.name}_search_vector ON {_entries.name} USING gin (search_vector)"))
+            _index_existing_archives(conn)
+
+
+def _index_existing_archives(conn, batch_size: int = 100):
+    """Index the archive blocks written before the archive index existed"""
+    from .services.archival import decode_messages
+
+    conn.execute(_entries.delete())
+    last_id = 0
+    while True:
+        blocks = conn.execute(
+            select(_archives.c.id, _archives.c.conversation_id, _archives.c.payload)
+            .where(_archives.c.id > last_id).order_by(_archives.c.id).limit(batch_size)
+        ).all()
+        for block in blocks:
+            _add_entries(conn, block.id, block.conversation_id, decode_messages(block.payload))
+        if len(blocks) < batch_size:
+            break
+        last_id = blocks[-1].id
+
+
+def _add_entries(conn, archive_id: int, conversation_id: str, messages: List[dict]):
+    if not messages:
+        return
+    conn.execute(insert(_entries), [
+        {"archive_id": archive_id, "conversation_id": conversation_id, "message_id": message["id"],
+         "position": position, "timestamp": message["timestamp"]}
+        for position, message in enumerate(messages)
+    ])
+    ids = conn.execute(
+        select(_entries.c.id).where(_entries.c.archive_id == archive_id).order_by(_entries.c.position)
+    ).scalars().all()
+    values = [{"id": entry_id, "content": message["content"] or ""} for entry_id, message in zip(ids, messages)]
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(f"INSERT INTO {ARCHIVE_FTS}(rowid, content) VALUES (:id, :content)"), values)
+    else:
+        conn.execute(text(f"UPDATE {_entries.name} SET search_vector = to_tsvector('english', :content) WHERE id = :id"), values)
+
+
+def index_archive_block(conn, archive_id: int, conversation_id: str, messages: List[dict]):
+    """Index the messages just archived as block `archive_id` (dicts with id, content and timestamp)"""
+    if archive_index_exists(conn):
+        _add_entries(conn, archive_id, conversation_id, messages)
+
+
+def unindex_archives(conn, archive_ids: Sequence[int]):
+    """Remove archive blocks from the index; call before deleting them.
+
+    A contentless FTS5 table can only forget a row when given the text it
+    indexed, so the blocks are decoded again here.
+    """
+    from .services.archival import decode_messages
+
+    if not archive_ids:
+        return
+    if conn.dialect.name == "sqlite" and archive_index_exists(conn):
+        blocks = conn.execute(select(_archives.c.id, _archives.c.payload).where(_archives.c.id.in_(archive_ids))).all()
+        for block in blocks:
+            messages = decode_messages(block.payload)
+            entries = conn.execute(
+                select(_entries.c.id, _entries.c.position).where(_entries.c.archive_id == block.id)
+            ).all()
+            values = [
+                {"id": entry.id, "content": messages[entry.position]["content"] or ""}
+                for entry in entries if entry.position < len(messages)
+            ]
+            if values:
+                conn.execute(text(f"INSERT INTO {ARCHIVE_FTS}({ARCHIVE_FTS}, rowid, content) VALUES ('delete', :id, :content)"), values)
+    conn.execute(_entries.delete().where(_entries.c.archive_id.in_(archive_ids)))
+
+
+def rebuild_index(conn):
+    """Re-index everything; needed on SQLite after VACUUM, which may renumber rowids"""
+    if conn.dialect.name == "sqlite":
+        for fts, _ in SQLITE_INDEXES.values():
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def fts_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: all words must match, the last as a prefix.
+
+    Quoting every token keeps FTS5 operators and punctuation in user input
+    from being parsed as query syntax.
+    """
+    tokens = _TOKEN.findall(query)
+    if not tokens:
+        return None
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+_SQLITE_SELECTS = {
+    "messages": (
+        "SELECT 'message' AS kind, m.id AS id, m.conversation_id AS conversation_id, c.title AS title, "
+        "snippet(aida_messages_fts, 0, :open, :close, '…', :words) AS snippet, "
+        "bm25(aida_messages_fts) AS score, m.timestamp AS timestamp "
+        "FROM aida_messages_fts JOIN aida_messages m ON m.rowid = aida_messages_fts.rowid "
+        "JOIN aida_conversations c ON c.id = m.conversation_id "
+        "WHERE aida_messages_fts MATCH :query AND c.user_id = :user_id"
+    ),
+    # Snippets come from the decoded block, see `_archived_snippets`
+    "archived_messages": (
+        "SELECT 'message' AS kind, e.message_id AS id, e.conversation_id AS conversation_id, c.title AS title, "
+        "NULL AS snippet, bm25(aida_message_archives_fts) AS score, e.timestamp AS timestamp, "
+        "e.archive_id AS archive_id, e.position AS position "
+        "FROM aida_message_archives_fts JOIN aida_message_archive_entries e ON e.id = aida_message_archives_fts.rowid "
+        "JOIN aida_conversations c ON c.id = e.conversation_id "
+        "WHERE aida_message_archives_fts MATCH :query AND c.user_id = :user_id"
+    ),
+    "conversations": (
+        "SELECT 'conversation' AS kind, c.id AS id, c.id AS conversation_id, c.title AS title, "
+        "snippet(aida_conversations_fts, -1, :open, :close, '…', :words) AS snippet, "
+        "bm25(aida_conversations_fts) AS score, c.last_message AS timestamp "
+        "FROM aida_conversations_fts JOIN aida_conversations c ON c.rowid = aida_conversations_fts.rowid "
+        "WHERE aida_conversations_fts MATCH :query AND c.user_id = :user_id"
+    ),
+    "documents": (
+        "SELECT 'document' AS kind, d.id AS id, NULL AS conversation_id, d.name AS title, "
+        "snippet(uploaded_documents_fts, -1, :open, :close, '…', :words) AS snippet, "
+        "bm25(uploaded_documents_fts) AS score, d.upload_date AS timestamp "
+        "FROM uploaded_documents_fts JOIN uploaded_documents d ON d.rowid = uploaded_documents_fts.rowid "
+        "WHERE uploaded_documents_fts MATCH :query AND d.user_id = :user_id"
+    ),
+}
+
+# ts_rank grows with relevance; negate it so both paths sort ascending
+_POSTGRES_SELECTS = {
+    "messages": (
+        "SELECT 'message' AS kind, m.id AS id, m.conversation_id AS conversation_id, c.title AS title, "
+        "ts_headline('english', m.content, q, :headline) AS snippet, "
+        "-ts_rank(m.search_vector, q) AS score, m.timestamp AS timestamp "
+        "FROM aida_messages m JOIN aida_conversations c ON c.id = m.conversation_id, "
+        "websearch_to_tsquery('english', :query) q "
+        "WHERE m.search_vector @@ q AND c.user_id = :user_id"
+    ),
+    "archived_messages": (
+        "SELECT 'message' AS kind, e.message_id AS id, e.conversation_id AS conversation_id, c.title AS title, "
+        "NULL AS snippet, -ts_rank(e.search_vector, q) AS score, e.timestamp AS timestamp, "
+        "e.archive_id AS archive_id, e.position AS position "
+        "FROM aida_message_archive_entries e JOIN aida_conversations c ON c.id = e.conversation_id, "
+        "websearch_to_tsquery('english', :query) q "
+        "WHERE e.search_vector @@ q AND c.user_id = :user_id"
+    ),
+    "conversations": (
+        "SELECT 'conversation' AS kind, c.id AS id, c.id AS conversation_id, c.title AS title, "
+        "ts_headline('english', coalesce(c.title, '') || ' ' || coalesce(c.subject, ''), q, :headline) AS snippet, "
+        "-ts_rank(c.search_vector, q) AS score, c.last_message AS timestamp "
+        "FROM aida_conversations c, websearch_to_tsquery('english', :query) q "
+        "WHERE c.search_vector @@ q AND c.user_id = :user_id"
+    ),
+    "documents": (
+        "SELECT 'document' AS kind, d.id AS id, NULL AS conversation_id, d.name AS title, "
+        "ts_headline('english', coalesce(d.extracted_text, d.name), q, :headline) AS snippet, "
+        "-ts_rank(d.search_vector, q) AS score, d.upload_date AS timestamp "
+        "FROM uploaded_documents d, websearch_to_tsquery('english', :query) q "
+        "WHERE d.search_vector @@ q AND d.user_id = :user_id"
+    ),
+}
+
+
+def highlight(content: str, query: str) -> str:
+    """A snippet of about SNIPPET_WORDS words around the first word matching the query, like FTS5's snippet()"""
+    terms = [term.lower() for term in _TOKEN.findall(query)]
+    words = list(_TOKEN.finditer(content))
+    if not words:
+        return ""
+    hits = [i for i, word in enumerate(words) if any(word.group().lower().startswith(term) for term in terms)]
+    first = max(0, hits[0] - SNIPPET_WORDS // 2) if hits else 0
+    window = words[first:first + SNIPPET_WORDS]
+    parts = []
+    for i, word in enumerate(window):
+        if i:
+            parts.append(content[window[i - 1].end():word.start()])
+        matched = first + i in hits
+        parts.append(f"{SNIPPET_OPEN}{word.group()}{SNIPPET_CLOSE}" if matched else word.group())
+    prefix = "…" if first > 0 else ""
+    suffix = "…" if first + SNIPPET_WORDS < len(words) else ""
+    return prefix + "".join(parts) + suffix
+
+
+def _archived_snippets(db: Session, rows: List[dict], query: str):
+    """Fill in snippets for archived messages from their blocks, one decode per block"""
+    from .services.archival import decode_messages
+
+    archived = [row for row in rows if row.get("archive_id") is not None]
+    if not archived:
+        return
+    blocks = db.execute(
+        select(_archives.c.id, _archives.c.payload).where(_archives.c.id.in_({row["archive_id"] for row in archived}))
+    ).all()
+    messages = {block.id: decode_messages(block.payload) for block in blocks}
+    for row in archived:
+        block = messages.get(row["archive_id"], [])
+        if row["position"] < len(block):
+            row["snippet"] = highlight(block[row["position"]]["content"] or "", query)
+
+
+def search(db: Session, user_id: str, query: str, kinds: Sequence[str], limit: int, offset: int) -> Tuple[list, bool]:
+    """Best matches first, as (rows, has_more).
+
+    bm25() and ts_rank() values from different indexes are not on the same
+    scale, so each source is ranked on its own. Its scores are then rescaled
+    so that its best match is 0 and a score of 0 would be 1, and the
+    sources are merged on that.
+    """
+    dialect = db.get_bind().dialect.name
+    params = {"user_id": user_id, "window": offset + limit + 1}
+    if dialect == "postgresql":
+        selects = _POSTGRES_SELECTS
+        params.update(
+            query=query,
+            headline=f"StartSel={SNIPPET_OPEN}, StopSel={SNIPPET_CLOSE}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS}",
+        )
+    else:
+        selects = _SQLITE_SELECTS
+        match = fts_query(query)
+        if match is None:
+            return [], False
+        params.update(query=match, open=SNIPPET_OPEN, close=SNIPPET_CLOSE, words=SNIPPET_WORDS)
+
+    merged = []
+    for source in (source for kind in kinds for source in SOURCES[kind]):
+        # Enough of each source to fill the requested page on its own
+        rows = db.execute(text(f"{selects[source]} ORDER BY score, timestamp DESC LIMIT :window"), params).mappings().all()
+        if not rows:
+            continue
+        best = rows[0]["score"]
+        for row in rows:
+            row = dict(row)
+            row["score"] = 1 - row["score"] / best if best else 0.0
+            merged.append(row)
+    # Newest first among equal scores (stable sorts), missing timestamps last
+    merged.sort(key=lambda row: (row["timestamp"] is not None, row["timestamp"] or 0), reverse=True)
+    merged.sort(key=lambda row: row["score"])
+    page = merged[offset:offset + limit + 1]
+    _archived_snippets(db, page[:limit], query)
+    return page[:limit], len(page) > limit
@@ -0,0 +1,220 @@
+"""Production server: a supervisor process running several uvicorn workers.
+
+    python -m app.server --workers 4 --port 8000
+
+The supervisor migrates the schema once, binds the listening socket and
+spawns the workers, restarting any that crash. On SIGTERM/SIGINT every
+worker first reports draining on /ready while still serving for
+`shutdown_drain_seconds`, so load balancers stop sending it traffic. It then
+stops accepting connections, finishes open requests and streams, drains its
+background AI jobs, and exits; stragglers are killed after the grace period.
+The workers publish their metrics in a shared directory, so /metrics on any
+of them reports the whole server.
+"""
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from .config import settings
+from .logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# A worker exiting this soon after starting counts as a failed start
+MIN_WORKER_UPTIME = 5.0
+MAX_FAILED_STARTS = 5
+
+
+def default_workers() -> int:
+    """CPU cores available to this process (respects container CPU affinity)"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def bind_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: Optional[socket.socket], host: str, port: int, graceful_timeout: float, drain_seconds: float):
+    """Worker process entry point: serve main:app on the given socket"""
+    import uvicorn
+
+    from .services.jobs import background_jobs
+
+    class DrainingServer(uvicorn.Server):
+        """Marks the worker draining on the first exit signal and only stops listening after `drain_seconds`"""
+
+        drain_timer: Optional[threading.Timer] = None
+
+        def handle_exit(self, sig, frame):
+            background_jobs.draining = True
+            if drain_seconds <= 0:
+                return super().handle_exit(sig, frame)
+            if self.drain_timer is not None:
+                # The supervisor repeats a process group's SIGTERM; only a second Ctrl+C skips the drain
+                if sig == signal.SIGINT:
+                    super().handle_exit(sig, frame)
+                return
+            logger.info("Draining before shutdown", extra={"pid": os.getpid(), "seconds": drain_seconds})
+            self.drain_timer = threading.Timer(drain_seconds, super().handle_exit, (sig, frame))
+            self.drain_timer.daemon = True
+            self.drain_timer.start()
+
+    if sock is None:
+        # SO_REUSEPORT mode: each worker binds its own socket and the kernel
+        # balances new connections between them
+        sock = bind_socket(host, port, reuse_port=True)
+    config = uvicorn.Config(
+        "main:app",
+        lifespan="on",
+        timeout_graceful_shutdown=graceful_timeout,
+        # Requests are logged by RequestIdMiddleware
+        log_config=None,
+        access_log=False,
+    )
+    DrainingServer(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Starts, watches and stops the worker processes"""
+
+    def __init__(self, workers: int, host: str, port: int, reuse_port: bool, graceful_timeout: float, drain_seconds: float):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.graceful_timeout = graceful_timeout
+        self.drain_seconds = drain_seconds
+        self.should_exit = False
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self.started_at: List[float] = [0.0] * workers
+        self.failed_starts = 0
+        self.context = multiprocessing.get_context("spawn")
+        self.sock: Optional[socket.socket] = None
+
+    def _handle_signal(self, signum, frame):
+        logger.info("Shutdown requested", extra={"signal": signal.Signals(signum).name})
+        self.should_exit = True
+
+    def _spawn(self, index: int):
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.sock, self.host, self.port, self.graceful_timeout, self.drain_seconds),
+            name=f"alden-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+        logger.info("Worker started", extra={"worker": index, "pid": process.pid})
+
+    def _check_workers(self):
+        for index, process in enumerate(self.processes):
+            if self.should_exit:
+                return
+            if process.is_alive():
+                continue
+            uptime = time.monotonic() - self.started_at[index]
+            logger.warning("Worker exited", extra={"worker": index, "pid": process.pid, "exitcode": process.exitcode})
+            self.failed_starts = self.failed_starts + 1 if uptime < MIN_WORKER_UPTIME else 0
+            if self.failed_starts >= MAX_FAILED_STARTS:
+                logger.error("Workers keep failing on startup, giving up")
+                self.should_exit = True
+                return
+            self._spawn(index)
+
+    def _stop_workers(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()  # SIGTERM: uvicorn's graceful shutdown
+
+        # After the drain period, open requests and then background jobs each get the grace period
+        deadline = time.monotonic() + self.drain_seconds + 2 * self.graceful_timeout + 5
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+        for index, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                logger.warning("Killing worker after grace period", extra={"worker": index, "pid": process.pid})
+                process.kill()
+                process.join()
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+        if not self.reuse_port:
+            self.sock = bind_socket(self.host, self.port)
+        logger.info("Starting server", extra={
+            "host": self.host, "port": self.port, "workers": self.workers, "reuse_port": self.reuse_port
+        })
+        for index in range(self.workers):
+            self._spawn(index)
+
+        try:
+            while not self.should_exit:
+                time.sleep(0.5)
+                self._check_workers()
+        finally:
+            self._stop_workers()
+            if self.sock is not None:
+                self.sock.close()
+        logger.info("Server stopped")
+        return 1 if self.failed_starts >= MAX_FAILED_STARTS else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Alden API with multiple worker processes")
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.server_workers or default_workers())
+    parser.add_argument("--reuse-port", action="store_true", default=settings.server_reuse_port,
+                        help="bind one SO_REUSEPORT socket per worker instead of sharing one")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.graceful_shutdown_timeout)
+    parser.add_argument("--drain-seconds", type=float, default=settings.shutdown_drain_seconds,
+                        help="keep serving this long after SIGTERM while /ready reports draining")
+    args = parser.parse_args()
+
+    setup_logging()
+    if settings.auto_migrate:
+        from .database import init_db
+
+        # Migrate once here instead of racing in every worker's lifespan
+        init_db()
+    os.environ["AUTO_MIGRATE"] = "false"
+
+    # Workers inherit the environment; snapshots of a previous run must not count
+    metrics_directory = settings.metrics_directory or tempfile.mkdtemp(prefix="alden-metrics-")
+    os.makedirs(metrics_directory, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_directory, "*.json")):
+        os.remove(path)
+    os.environ["METRICS_DIRECTORY"] = metrics_directory
+
+    supervisor = Supervisor(args.workers, args.host, args.port, args.reuse_port, args.graceful_timeout, args.drain_seconds)
+    try:
+        code = supervisor.run()
+    finally:
+        if not settings.metrics_directory:
+            shutil.rmtree(metrics_directory, ignore_errors=True)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
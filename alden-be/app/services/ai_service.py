@@ -1,30 +1,208 @@
-import os
 import asyncio
-import base64
-import io
-from typing import Optional, List
-from google import genai
-from google.genai import types
+import contextvars
+import json
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Deque, Dict, Optional, List, Tuple
 from ..config import settings
+from .. import metrics
+from .rate_limit import ai_governor, estimate_tokens, GovernorTimeout
+from .usage import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+# Student messages that need the full model even when short
+COMPLEX_PROMPT = re.compile(
+    r"\b(explain|why|prove|derive|step[- ]by[- ]step|compare|analy[sz]e|essay|solve|calculate|code|quiz|flashcards?)\b",
+    re.IGNORECASE,
+)
+
+class CircuitBreaker:
+    """Fails fast while a model's recent error rate is too high.
+
+    Closed: calls pass and outcomes are kept for `window_seconds`. Once at
+    least `min_requests` outcomes are known and the failure ratio reaches
+    `error_rate`, the circuit opens and refuses calls for `open_seconds`.
+    It then lets a single probe through: success closes it, failure
+    re-opens it. Used from the event loop only, so it needs no lock.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, window_seconds: float, min_requests: int, error_rate: float, open_seconds: float, clock=time.monotonic):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.ai_circuit_state.set(self._GAUGE[state], self.name)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if self._clock() - self._opened_at < self.open_seconds:
+                return False
+            self._set_state(self.HALF_OPEN)
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def release(self):
+        """The allowed call never reached the provider; free the probe slot"""
+        self._probe_in_flight = False
+
+    def record(self, ok: bool):
+        now = self._clock()
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if ok:
+                self._outcomes.clear()
+                self._failures = 0
+                self._set_state(self.CLOSED)
+                logger.info("AI circuit closed", extra={"model": self.name})
+            else:
+                self._open(now)
+            return
+        if self.state == self.OPEN:
+            return  # late results from calls started before the circuit opened
+
+        self._outcomes.append((now, ok))
+        self._failures += 0 if ok else 1
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            _, old_ok = self._outcomes.popleft()
+            self._failures -= 0 if old_ok else 1
+        total = len(self._outcomes)
+        if total >= self.min_requests and self._failures / total >= self.error_rate:
+            self._open(now)
+
+    def _open(self, now: float):
+        self._opened_at = now
+        self._set_state(self.OPEN)
+        logger.warning("AI circuit opened", extra={"model": self.name, "open_seconds": self.open_seconds})
+
+class LatencyTracker:
+    """Recent successful call latencies of one model, for the hedge delay"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def p95(self, min_samples: int) -> Optional[float]:
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
 
 class AIService:
     def __init__(self):
-        self.client = None
-        self._initialize_client()
+        self._client = None
+        self._client_initialized = False
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        # Provider SDK calls block; run them here instead of on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=settings.ai_max_concurrent_calls, thread_name_prefix="ai-call")
+
+    @property
+    def client(self):
+        """Gemini client, created on first use so importing this module stays cheap"""
+        if not self._client_initialized:
+            self._initialize_client()
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+        self._client_initialized = True
+
+    @property
+    def client_state(self) -> str:
+        """Client status for readiness checks, without forcing initialization"""
+        if self._client_initialized:
+            return "ready" if self._client else "unavailable"
+        configured = settings.gemini_api_key or settings.ai_provider == "fake"
+        return "not_initialized" if configured else "not_configured"
+
+    @property
+    def circuit_states(self) -> Dict[str, str]:
+        return {model: breaker.state for model, breaker in self._breakers.items()}
 
     def _initialize_client(self):
         """Initialize the Gemini AI client"""
-        if settings.gemini_api_key:
-            self.client = genai.Client(
+        self._client_initialized = True
+        if settings.ai_provider == "fake":
+            from .fake_ai import FakeGeminiClient
+
+            self._client = FakeGeminiClient(
+                latency_ms=settings.ai_fake_latency_ms,
+                jitter_ms=settings.ai_fake_latency_ms / 4,
+                error_rate=settings.ai_fake_error_rate,
+            )
+            logger.warning("Using the fake AI provider")
+        elif settings.gemini_api_key:
+            # Deferred import: the SDK pulls in a large dependency tree
+            from google import genai
+
+            self._client = genai.Client(
                 http_options={"api_version": "v1beta"},
                 api_key=settings.gemini_api_key,
             )
         else:
-            print("Warning: GEMINI_API_KEY not set. AI functionality will be limited.")
+            logger.warning("GEMINI_API_KEY not set. AI functionality will be limited.")
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(
+                model,
+                window_seconds=settings.ai_breaker_window_seconds,
+                min_requests=settings.ai_breaker_min_requests,
+                error_rate=settings.ai_breaker_error_rate,
+                open_seconds=settings.ai_breaker_open_seconds,
+            )
+        return self._breakers[model]
+
+    def _latency(self, model: str) -> LatencyTracker:
+        return self._latencies.setdefault(model, LatencyTracker())
 
-    async def generate_study_response(self, message: str, subject: Optional[str] = None, documents: Optional[List[str]] = None) -> str:
+    def choose_model(self, message: str, has_documents: bool = False) -> str:
+        """Send short, simple questions to the cheaper fast model"""
+        fast_model = settings.ai_fast_model
+        if not fast_model or has_documents or len(message) > settings.ai_fast_max_chars:
+            return settings.ai_model
+        if COMPLEX_PROMPT.search(message):
+            return settings.ai_model
+        return fast_model
+
+    async def generate_study_response(
+        self,
+        message: str,
+        subject: Optional[str] = None,
+        documents: Optional[List[str]] = None,
+        document_notes: Optional[str] = None
+    ) -> str:
         """Generate AI response for study-related queries"""
         if not self.client:
+            metrics.ai_fallbacks.inc(1, "no_client")
+            usage_recorder.record(None, "no_client")
             return self._fallback_response(message)
 
         try:
@@ -41,36 +219,159 @@ class AIService:
             
             if documents:
                 context += f"\n\nThe student has uploaded {len(documents)} document(s) for reference."
+            if document_notes:
+                context += f"\n\nNotes on the student's documents:\n{document_notes}"
             
             context += "\n\nRespond in a helpful, encouraging, and educational manner."
             
             full_prompt = f"{context}\n\nStudent question: {message}\n\nAida's response:"
             
             # Use Gemini to generate response
-            response = await self._call_gemini_api(full_prompt)
+            response = await self._call_gemini_api(full_prompt, self.choose_model(message, bool(documents)))
             return response
             
         except Exception as e:
-            print(f"Error calling Gemini API: {e}")
+            logger.exception("Error calling Gemini API: %s", e)
+            metrics.ai_fallbacks.inc(1, "error")
             return self._fallback_response(message)
 
-    async def _call_gemini_api(self, prompt: str) -> str:
-        """Call the Gemini API with the given prompt"""
+    async def _call_gemini_api(self, prompt: str, model: Optional[str] = None) -> str:
+        """Call the provider, answering with a canned fallback when it fails"""
+        text = await self._complete(prompt, model)
+        return text if text is not None else self._fallback_response(prompt)
+
+    async def _complete(self, prompt: str, model: Optional[str] = None) -> Optional[str]:
+        """Call the provider through the circuit breaker, with a timeout and optional hedging.
+
+        Returns None when no answer could be obtained.
+        """
+        model = model or settings.ai_model
+        # A routed model with an open circuit falls back to the default model
+        candidates = [model] if model == settings.ai_model else [model, settings.ai_model]
+        model = next((candidate for candidate in candidates if self._breaker(candidate).allow()), None)
+        if model is None:
+            metrics.ai_fallbacks.inc(1, "circuit_open")
+            usage_recorder.record(None, "circuit_open")
+            return None
+        breaker = self._breaker(model)
+
+        tokens = estimate_tokens(prompt) + settings.ai_expected_response_tokens
         try:
-            # For now, we'll use a simple text generation
-            # In a full implementation, you might want to use the live API
-            # or other Gemini models based on your needs
-            
-            response = self.client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=prompt
-            )
-            
-            return response.text if response and response.text else self._fallback_response(prompt)
-            
+            # Queue behind the shared provider quota instead of tripping it
+            await ai_governor.acquire(tokens)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except GovernorTimeout as e:
+            breaker.release()
+            logger.warning("Gemini API error: %s", e, extra={"model": model, "prompt_chars": len(prompt)})
+            metrics.ai_fallbacks.inc(1, "quota_wait")
+            usage_recorder.record(model, "quota_wait")
+            return None
+
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._generate(model, prompt, tokens), timeout=settings.ai_request_timeout)
+        except asyncio.CancelledError:
+            # Not the provider's fault (e.g. shutdown); free a half-open probe
+            # slot, or the circuit would never close again. `_generate` records
+            # the call's usage once its thread returns.
+            breaker.release()
+            raise
         except Exception as e:
-            print(f"Gemini API error: {e}")
-            return self._fallback_response(prompt)
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            status = "timeout" if timed_out else "error"
+            logger.warning("Gemini API error: %s", "timeout" if timed_out else e, extra={"model": model, "prompt_chars": len(prompt)})
+            breaker.record(False)
+            elapsed = time.perf_counter() - start
+            metrics.ai_request_duration.observe(elapsed, model, status)
+            metrics.ai_fallbacks.inc(1, status)
+            usage_recorder.record(model, status, latency=elapsed)
+            return None
+
+        elapsed = time.perf_counter() - start
+        breaker.record(True)
+        self._latency(model).observe(elapsed)
+        metrics.ai_request_duration.observe(elapsed, model, "ok")
+        text = response.text if response else None
+        self._record_usage(model, response, "ok" if text else "empty_response", elapsed)
+
+        if text:
+            return text
+        metrics.ai_fallbacks.inc(1, "empty_response")
+        return None
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before a hedged second call; None disables hedging"""
+        if not settings.ai_hedge_enabled:
+            return None
+        p95 = self._latency(model).p95(settings.ai_hedge_min_samples)
+        if p95 is None:
+            return None
+        return max(settings.ai_hedge_min_delay, p95)
+
+    async def _generate(self, model: str, prompt: str, tokens: int):
+        """One provider call, plus a second one if the first is slower than usual"""
+        call = partial(self.client.models.generate_content, model=model, contents=prompt)
+        sent = time.perf_counter()
+        primary_call = self._executor.submit(call)
+        primary = asyncio.wrap_future(primary_call)
+        calls = {primary: (primary_call, sent)}
+        pending = {primary}
+        # Until a call wins, anything left running was cancelled with us
+        status = "cancelled"
+        try:
+            delay = self._hedge_delay(model)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                # The hedge is optional: only send it if quota is free right now
+                if not done and await ai_governor.try_acquire(tokens):
+                    hedge_call = self._executor.submit(call)
+                    calls[asyncio.wrap_future(hedge_call)] = (hedge_call, time.perf_counter())
+                    pending = set(calls)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if len(calls) > 1:
+                            metrics.ai_hedged_requests.inc(1, "primary" if future is primary else "hedge")
+                        status = "ok"  # the other call lost the race
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            # Threads cannot be interrupted; a dropped call still uses tokens
+            for future in pending:
+                future.cancel()
+                self._record_when_done(*calls[future], model, status)
+
+    def _record_when_done(self, call: Future, start: float, model: str, status: str):
+        """Record a dropped call's usage once its thread returns, charged to the current caller"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+
+        def done(call: Future):
+            if call.cancelled() or call.exception() is not None:
+                return
+            elapsed = time.perf_counter() - start
+            try:
+                loop.call_soon_threadsafe(self._record_usage, model, call.result(), status, elapsed, context=context)
+            except RuntimeError:
+                pass  # the event loop has closed
+
+        call.add_done_callback(done)
+
+    def _record_usage(self, model: str, response, status: str, elapsed: float):
+        """Count prompt and response tokens reported by the provider, and charge them to the caller"""
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+        response_tokens = getattr(usage, "candidates_token_count", None) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+        if usage is not None:
+            metrics.ai_tokens.inc(prompt_tokens, model, "prompt")
+            metrics.ai_tokens.inc(response_tokens, model, "response")
+        usage_recorder.record(model, status, prompt_tokens, response_tokens, cached_tokens, elapsed)
 
     def _fallback_response(self, message: str) -> str:
         """Provide fallback responses when AI is not available"""
@@ -100,6 +401,8 @@ class AIService:
     async def generate_flashcards(self, content: str, subject: Optional[str] = None) -> List[dict]:
         """Generate flashcards from study content"""
         if not self.client:
+            metrics.ai_fallbacks.inc(1, "no_client")
+            usage_recorder.record(None, "no_client")
             return self._fallback_flashcards()
 
         try:
@@ -117,9 +420,45 @@ class AIService:
             return flashcards
             
         except Exception as e:
-            print(f"Error generating flashcards: {e}")
+            logger.exception("Error generating flashcards: %s", e)
+            metrics.ai_fallbacks.inc(1, "error")
             return self._fallback_flashcards()
 
+    async def generate_study_aids(self, text: str, title: str) -> Optional[dict]:
+        """Summary, key terms and flashcards for a document; None if they could not be generated"""
+        if not self.client:
+            return None
+        prompt = (
+            f"Create study aids for the document \"{title}\". Respond with JSON only, in this form:\n"
+            '{"summary": "...", "key_terms": [{"term": "...", "definition": "..."}], '
+            '"flashcards": [{"question": "...", "answer": "..."}]}\n'
+            "Write a 3-5 sentence summary, 5-10 key terms and 5-10 flashcards."
+            f"\n\nDocument:\n{text}"
+        )
+        response = await self._complete(prompt, settings.ai_model)
+        return self._parse_study_aids(response) if response else None
+
+    def _parse_study_aids(self, response: str) -> Optional[dict]:
+        """Extract the JSON object from a study aids response"""
+        start, end = response.find("{"), response.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        try:
+            data = json.loads(response[start:end + 1])
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("summary"), str):
+            return None
+        key_terms = [
+            {"term": str(item["term"]), "definition": str(item.get("definition", ""))}
+            for item in data.get("key_terms") or [] if isinstance(item, dict) and item.get("term")
+        ]
+        flashcards = [
+            {"question": str(item["question"]), "answer": str(item["answer"])}
+            for item in data.get("flashcards") or [] if isinstance(item, dict) and item.get("question") and item.get("answer")
+        ]
+        return {"summary": data["summary"].strip(), "key_terms": key_terms, "flashcards": flashcards}
+
     def _parse_flashcards_response(self, response: str) -> List[dict]:
         """Parse AI response to extract flashcards"""
         # This is a simplified parser - you might want to use more robust JSON parsing
@@ -0,0 +1,120 @@
+"""Moves old chat messages out of `aida_messages` into compressed archive blocks.
+
+Each pass archives, per conversation, the messages older than the cutoff as
+zlib-compressed JSON blocks in `aida_message_archives`, oldest first and at
+most `maintenance_batch_size` messages per block. Each block is written in
+its own short transaction, together with the delete from the hot table, so a
+long conversation never becomes one huge read or one long write lock.
+`crud.get_messages` reads the blocks back, so clients see the same
+conversation as before, and `search.index_archive_block` keeps the archived
+text searchable.
+"""
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, select
+
+from .. import models, search
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits bound parameters per statement
+DELETE_CHUNK = 500
+
+
+def encode_messages(rows) -> bytes:
+    """Compress (id, type, content, timestamp) rows into an archive payload"""
+    data = [
+        [row.id, row.type.value if row.type is not None else None, row.content, row.timestamp.isoformat() if row.timestamp else None]
+        for row in rows
+    ]
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_messages(payload: bytes) -> List[dict]:
+    return [
+        {
+            "id": message_id,
+            "type": models.MessageType(message_type) if message_type else None,
+            "content": content,
+            "timestamp": datetime.fromisoformat(timestamp) if timestamp else None,
+        }
+        for message_id, message_type, content, timestamp in json.loads(zlib.decompress(payload))
+    ]
+
+
+def archive_conversation(conn, conversation_id: str, cutoff: datetime, limit: int) -> int:
+    """Archive the oldest `limit` of one conversation's messages older than `cutoff` as one block; returns how many"""
+    messages = models.AidaMessage.__table__
+    rows = conn.execute(
+        select(messages.c.id, messages.c.type, messages.c.content, messages.c.timestamp)
+        .where(messages.c.conversation_id == conversation_id, messages.c.timestamp < cutoff)
+        .order_by(messages.c.timestamp, messages.c.id)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return 0
+
+    result = conn.execute(insert(models.AidaMessageArchive.__table__).values(
+        conversation_id=conversation_id,
+        message_count=len(rows),
+        first_timestamp=rows[0].timestamp,
+        last_timestamp=rows[-1].timestamp,
+        payload=encode_messages(rows),
+        created_at=datetime.utcnow(),
+    ))
+    search.index_archive_block(conn, result.inserted_primary_key[0], conversation_id, [
+        {"id": row.id, "content": row.content, "timestamp": row.timestamp} for row in rows
+    ])
+    # Core delete: the messages still exist for clients, so nothing goes to the
+    # sync change log (the hot search index triggers drop them; the archive index has them now)
+    ids = [row.id for row in rows]
+    for start in range(0, len(ids), DELETE_CHUNK):
+        conn.execute(delete(messages).where(messages.c.id.in_(ids[start:start + DELETE_CHUNK])))
+    return len(rows)
+
+
+def archive_old_messages(older_than_days: Optional[int] = None, batch_size: Optional[int] = None) -> dict:
+    """Archive messages older than `older_than_days` across all conversations.
+
+    Each block is archived in its own short transaction, so the job can be
+    interrupted at any point and holds write locks only briefly.
+    """
+    older_than_days = settings.message_archive_after_days if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.message_archive_batch_size
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    messages = models.AidaMessage.__table__
+
+    conversations = archived = 0
+    while True:
+        with engine.connect() as conn:
+            candidates = conn.execute(
+                select(messages.c.conversation_id)
+                .where(messages.c.timestamp < cutoff)
+                .distinct()
+                .limit(batch_size)
+            ).scalars().all()
+        if not candidates:
+            break
+        for conversation_id in candidates:
+            count = 0
+            while True:
+                with engine.begin() as conn:
+                    block = archive_conversation(conn, conversation_id, cutoff, settings.maintenance_batch_size)
+                count += block
+                if block < settings.maintenance_batch_size:
+                    break
+            conversations += 1 if count else 0
+            archived += count
+        if len(candidates) < batch_size:
+            break
+
+    if archived:
+        logger.info("Archived old messages", extra={"conversations": conversations, "messages": archived})
+    return {"conversations": conversations, "messages": archived, "cutoff": cutoff.isoformat()}
+
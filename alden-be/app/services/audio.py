@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import struct
+import threading
+from typing import Dict, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Asset names are flat file names; anything else is rejected before touching disk
+SAFE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+# MPEG audio frame header tables, indexed by version then layer
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_BITRATES[(2, 3)] = _BITRATES[(2, 2)]
+_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+
+def mp3_duration(path: str) -> Optional[float]:
+    """Duration in seconds from the first frame header (Xing/Info/VBRI or CBR estimate)"""
+    with open(path, "rb") as f:
+        head = f.read(10)
+        offset = 0
+        if head[:3] == b"ID3" and len(head) == 10:
+            # Skip the ID3v2 tag; its size is a 28-bit syncsafe integer
+            offset = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+        f.seek(offset)
+        data = f.read(4096)
+    file_size = os.path.getsize(path)
+
+    for i in range(len(data) - 4):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        version_bits = (data[i + 1] >> 3) & 0x3
+        layer_bits = (data[i + 1] >> 1) & 0x3
+        bitrate_index = data[i + 2] >> 4
+        rate_index = (data[i + 2] >> 2) & 0x3
+        if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+        layer = 4 - layer_bits
+        sample_rate = _SAMPLE_RATES[version][rate_index]
+        bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+        mono = (data[i + 3] >> 6) == 3
+        if layer == 1:
+            samples_per_frame = 384
+        elif layer == 3 and version != 1:
+            samples_per_frame = 576
+        else:
+            samples_per_frame = 1152
+
+        # VBR files carry the frame count in a Xing/Info or VBRI header
+        side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+        xing = i + 4 + side_info
+        if data[xing:xing + 4] in (b"Xing", b"Info") and data[xing + 7] & 0x1:
+            frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+            return frames * samples_per_frame / sample_rate
+        if data[i + 36:i + 40] == b"VBRI":
+            frames = struct.unpack(">I", data[i + 50:i + 54])[0]
+            return frames * samples_per_frame / sample_rate
+        return (file_size - offset - i) * 8 / bitrate
+    return None
+
+
+class AudioAsset:
+    def __init__(self, name: str, path: str, size: int, mtime_ns: int, digest: str, duration: Optional[float]):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+        self.duration = duration
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    @property
+    def etag(self) -> str:
+        # Strong validator: derived from the bytes, so byte ranges can be combined
+        return f'"{self.digest}"'
+
+    @property
+    def version(self) -> str:
+        return self.digest[:12]
+
+    def manifest_entry(self) -> dict:
+        return {
+            "name": self.name,
+            "url": f"/audio/{self.name}?v={self.version}",
+            "size": self.size,
+            "duration": round(self.duration, 2) if self.duration is not None else None,
+            "content_type": self.content_type,
+            "etag": self.etag,
+        }
+
+
+class AudioLibrary:
+    """Audio files in `settings.audio_directory` with hashes and durations.
+
+    Files are hashed and probed once; later scans only stat the directory
+    and reprocess files whose size or mtime changed.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.audio_directory
+        self._assets: Dict[str, AudioAsset] = {}
+        self._scanned_at: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _load(self, name: str, path: str, stat: os.stat_result) -> AudioAsset:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        duration = None
+        if name.lower().endswith(".mp3"):
+            try:
+                duration = mp3_duration(path)
+            except (OSError, struct.error, IndexError):
+                logger.warning("Could not read audio duration", extra={"file": name})
+        return AudioAsset(name, path, stat.st_size, stat.st_mtime_ns, digest.hexdigest()[:32], duration)
+
+    def refresh(self):
+        """Rescan the directory if it changed since the last scan"""
+        try:
+            directory_mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            self._assets, self._scanned_at = {}, None
+            return
+        with self._lock:
+            if directory_mtime == self._scanned_at:
+                return
+            assets = {}
+            for entry in os.scandir(self.directory):
+                if not entry.is_file() or not SAFE_NAME.match(entry.name) or entry.name.endswith(".json"):
+                    continue
+                stat = entry.stat()
+                known = self._assets.get(entry.name)
+                if known and known.size == stat.st_size and known.mtime_ns == stat.st_mtime_ns:
+                    assets[entry.name] = known
+                else:
+                    assets[entry.name] = self._load(entry.name, entry.path, stat)
+            self._assets = assets
+            self._scanned_at = directory_mtime
+
+    def get(self, name: str) -> Optional[AudioAsset]:
+        if not SAFE_NAME.match(name):
+            return None
+        self.refresh()
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+        # A file replaced in place keeps the directory mtime; check it directly
+        try:
+            stat = os.stat(asset.path)
+        except FileNotFoundError:
+            return None
+        if stat.st_size != asset.size or stat.st_mtime_ns != asset.mtime_ns:
+            with self._lock:
+                asset = self._assets[name] = self._load(name, asset.path, stat)
+        return asset
+
+    def manifest(self) -> list:
+        self.refresh()
+        return [asset.manifest_entry() for asset in sorted(self._assets.values(), key=lambda a: a.name)]
+
+
+# Create a singleton instance
+audio_library = AudioLibrary()
@@ -0,0 +1,85 @@
+"""Deterministic offline stand-in for the Gemini client.
+
+Selected with `AI_PROVIDER=fake`, and used by the benchmarks. Latency,
+errors and slow outliers are drawn from a RNG seeded per call number, so a
+given sequence of calls always behaves the same way.
+"""
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+
+class FakeModels:
+    """Stand-in for `genai.Client().models` with configurable latency and failures"""
+
+    def __init__(
+        self,
+        latency_ms: float,
+        jitter_ms: float,
+        error_rate: float,
+        seed: Optional[int],
+        slow_rate: float = 0.0,
+        slow_ms: float = 0.0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.seed = seed
+        self.calls = 0
+        self.calls_by_model = {}
+        self._lock = threading.Lock()
+
+    def generate_content(self, model: str, contents: str, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+            rng = random.Random(f"{self.seed}:{self.calls}")
+
+        delay = max(0.0, self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms))
+        if rng.random() < self.slow_rate:
+            delay = self.slow_ms
+        time.sleep(delay / 1000)
+        if rng.random() < self.error_rate:
+            raise RuntimeError("Fake provider error")
+
+        if '"key_terms"' in contents:
+            text = json.dumps({
+                "summary": "This document introduces the main ideas of the topic and how they connect.",
+                "key_terms": [{"term": f"Term {i}", "definition": f"Definition of term {i}."} for i in range(1, 6)],
+                "flashcards": [{"question": f"What is concept {i}?", "answer": f"Concept {i} explained briefly."} for i in range(1, 6)],
+            })
+        elif "flashcards" in contents.lower():
+            text = "\n".join(
+                f"Question: What is concept {i}?\nAnswer: Concept {i} explained briefly." for i in range(1, 6)
+            )
+        else:
+            text = "Here is a step-by-step explanation of your question. " * 8
+        prompt_tokens = len(contents) // 4
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=len(text) // 4,
+                total_token_count=prompt_tokens + len(text) // 4,
+            ),
+        )
+
+
+class FakeGeminiClient:
+    """Deterministic offline replacement for `google.genai.Client`"""
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        jitter_ms: float = 200.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = 42,
+        slow_rate: float = 0.0,
+        slow_ms: float = 0.0,
+    ):
+        self.models = FakeModels(latency_ms, jitter_ms, error_rate, seed, slow_rate, slow_ms)
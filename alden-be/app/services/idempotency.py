@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from ..config import settings
+
+
+class IdempotencyKeyReused(Exception):
+    """Raised when a key comes back with a different request body"""
+
+
+class IdempotencyInProgress(Exception):
+    """Raised when the original request is still running after the wait"""
+
+
+def fingerprint(body: str) -> str:
+    """Short digest identifying a request body"""
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=12).hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """Storage backend for idempotency records.
+
+    A record is (fingerprint, response); the response is None while the
+    original request is still running. `claim` atomically creates an empty
+    record that lives `ttl` seconds and returns None, or returns the existing
+    record untouched. `complete` stores the response and restarts the TTL.
+    """
+
+    @abstractmethod
+    async def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Tuple[str, Optional[dict]]]:
+        ...
+
+    @abstractmethod
+    async def complete(self, key: str, fingerprint: str, response: dict, ttl: float):
+        ...
+
+    @abstractmethod
+    async def release(self, key: str):
+        ...
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Per-process store: insertion-ordered, so expired and excess keys drop off the front"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._records: "OrderedDict[str, Tuple[float, str, Optional[dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # Oldest insert first; a pending record's shorter TTL may leave an
+        # expired one behind a live one, which `claim` then ignores
+        while self._records:
+            key, (expires_at, _, _) = next(iter(self._records.items()))
+            if expires_at > now and len(self._records) <= self.max_keys:
+                break
+            del self._records[key]
+
+    async def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Tuple[str, Optional[dict]]]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            record = self._records.get(key)
+            if record is not None and record[0] > now:
+                return record[1], record[2]
+            self._records[key] = (now + ttl, fingerprint, None)
+            self._records.move_to_end(key)
+        return None
+
+    async def complete(self, key: str, fingerprint: str, response: dict, ttl: float):
+        with self._lock:
+            self._records[key] = (time.monotonic() + ttl, fingerprint, response)
+            self._records.move_to_end(key)
+
+    async def release(self, key: str):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """Store backed by Redis, so a retry landing on another worker is recognized"""
+
+    def __init__(self, url: str, prefix: str = "alden:idempotency:"):
+        import redis.asyncio  # Optional dependency, see requirements-optional.txt
+
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._prefix = prefix
+
+    async def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Tuple[str, Optional[dict]]]:
+        if await self._client.set(self._prefix + key, json.dumps([fingerprint, None]), nx=True, px=int(ttl * 1000)):
+            return None
+        value = await self._client.get(self._prefix + key)
+        if value is None:  # expired in between; treat as claimed by nobody
+            return await self.claim(key, fingerprint, ttl)
+        stored_fingerprint, response = json.loads(value)
+        return stored_fingerprint, response
+
+    async def complete(self, key: str, fingerprint: str, response: dict, ttl: float):
+        await self._client.set(self._prefix + key, json.dumps([fingerprint, response]), px=int(ttl * 1000))
+
+    async def release(self, key: str):
+        await self._client.delete(self._prefix + key)
+
+
+def create_idempotency_store(url: Optional[str] = None) -> IdempotencyStore:
+    """Build the store configured by `url` (in-memory when empty)"""
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisIdempotencyStore(url)
+    return MemoryIdempotencyStore(settings.idempotency_max_keys)
+
+
+class IdempotencyGuard:
+    """Lets a request run once per key; repeats get the first response"""
+
+    POLL_INTERVAL = 0.05
+    # A claim outlives the repeats' wait by this factor; if its worker dies
+    # mid-request the key frees up soon instead of answering 409 for `ttl`
+    PENDING_TTL_WAITS = 4
+
+    def __init__(self, store: IdempotencyStore, ttl: float, wait: float):
+        self.store = store
+        self.ttl = ttl
+        self.wait = wait
+        self.pending_ttl = min(ttl, max(1.0, wait * self.PENDING_TTL_WAITS))
+
+    async def begin(self, key: str, request_fingerprint: str) -> Optional[dict]:
+        """Claim `key` for this request (returns None) or return the stored response.
+
+        A repeat that arrives while the original is still running waits up to
+        `wait` seconds for its response.
+        """
+        deadline = time.monotonic() + self.wait
+        while True:
+            record = await self.store.claim(key, request_fingerprint, self.pending_ttl)
+            if record is None:
+                return None
+            stored_fingerprint, response = record
+            if stored_fingerprint != request_fingerprint:
+                raise IdempotencyKeyReused(key)
+            if response is not None:
+                return response
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress(key)
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def finish(self, key: str, request_fingerprint: str, response: dict):
+        await self.store.complete(key, request_fingerprint, response, self.ttl)
+
+    async def abandon(self, key: str):
+        """Forget a claim whose request failed, so a retry runs it again"""
+        await self.store.release(key)
+
+
+# Create a singleton instance
+idempotency_guard = IdempotencyGuard(
+    create_idempotency_store(settings.idempotency_storage_url or settings.rate_limit_storage_url),
+    ttl=settings.idempotency_ttl_seconds,
+    wait=settings.idempotency_wait_seconds,
+)
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Set
+
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+background_jobs_in_progress = metrics.registry.register(metrics.Gauge(
+    "background_jobs_in_progress", "Background jobs (e.g. AI replies) currently running"
+))
+
+
+class JobRegistry:
+    """Tracks background jobs so shutdown can wait for them to finish"""
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self.draining = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def run(self, func: Callable[..., Awaitable], *args, **kwargs):
+        """Run `func` as a tracked job (usable with BackgroundTasks.add_task)"""
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        background_jobs_in_progress.inc()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self._tasks.discard(task)
+            background_jobs_in_progress.dec()
+
+    def spawn(self, func: Callable[..., Awaitable], *args, **kwargs) -> asyncio.Task:
+        """Start `func` in its own task, detached from the current request"""
+        return asyncio.create_task(self.run(func, *args, **kwargs))
+
+    async def drain(self, timeout: float):
+        """Stop accepting work and wait up to `timeout` seconds for running jobs"""
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while self._tasks and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._tasks:
+            logger.warning("Shutting down with unfinished background jobs", extra={"jobs": len(self._tasks)})
+
+
+# Create a singleton instance
+background_jobs = JobRegistry()
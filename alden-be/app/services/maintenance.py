@@ -0,0 +1,171 @@
+"""Periodic maintenance jobs and the scheduler that runs them.
+
+Jobs work in batches of `maintenance_batch_size` rows with one short
+transaction per batch, and check the stop event between batches so a
+shutting-down worker is not held up.
+"""
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, Set
+
+from sqlalchemy import delete, func, select
+
+from .. import crud, models
+from ..config import settings
+from ..database import SessionLocal, engine
+from .archival import archive_old_messages
+from .previews import prune_previews
+from .purge import purge_requested_accounts
+from .scheduler import Job, Scheduler
+from .uploads import expire_upload_sessions
+from .usage import prune_usage_records
+
+# SQLite limits bound parameters per statement
+DELETE_CHUNK = 500
+
+
+def close_stale_study_sessions(stop: threading.Event) -> dict:
+    """Complete sessions left running, crediting their planned duration (capped)"""
+    cutoff = datetime.utcnow() - timedelta(hours=settings.stale_session_after_hours)
+    closed = 0
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            batch = db.query(models.StudySession).filter(
+                models.StudySession.completed == False,
+                models.StudySession.start_time < cutoff
+            ).order_by(models.StudySession.start_time).limit(settings.maintenance_batch_size).all()
+            for session in batch:
+                planned = session.duration if session.duration and session.duration > 0 else settings.study_session_max_minutes
+                crud.close_study_session(db, session, session.start_time + timedelta(minutes=planned))
+            # ORM updates, so the change log picks them up for sync
+            db.commit()
+        finally:
+            db.close()
+        closed += len(batch)
+        if len(batch) < settings.maintenance_batch_size:
+            break
+    return {"closed": closed}
+
+
+def current_streak(goal_days: Set[str], today: date) -> int:
+    """Consecutive days meeting the daily goal, ending today or (if today's isn't met yet) yesterday"""
+    day = today if today.isoformat() in goal_days else today - timedelta(days=1)
+    streak = 0
+    while day.isoformat() in goal_days:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+
+def _daily_minutes(db, user_ids: Iterable[str], since: datetime) -> dict:
+    """user_id -> {ISO day: completed study minutes}"""
+    day = func.date(models.StudySession.start_time)
+    minutes = defaultdict(dict)
+    rows = db.query(models.StudySession.user_id, day, func.sum(models.StudySession.duration)).filter(
+        models.StudySession.user_id.in_(user_ids),
+        models.StudySession.completed == True,
+        models.StudySession.start_time >= since
+    ).group_by(models.StudySession.user_id, day)
+    for user_id, study_day, total in rows:
+        minutes[user_id][str(study_day)] = total or 0
+    return minutes
+
+
+def recompute_user_totals(stop: threading.Event) -> dict:
+    """Rebuild study/mindful totals and streaks from the session tables"""
+    today = datetime.utcnow().date()
+    since = datetime.combine(today - timedelta(days=366), datetime.min.time())
+    scanned = updated = 0
+    last_id = ""
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            users = db.query(models.User).filter(models.User.id > last_id).order_by(models.User.id).limit(
+                settings.maintenance_batch_size
+            ).all()
+            if not users:
+                break
+            ids = [user.id for user in users]
+            study = dict(db.query(models.StudySession.user_id, func.sum(models.StudySession.duration)).filter(
+                models.StudySession.user_id.in_(ids), models.StudySession.completed == True
+            ).group_by(models.StudySession.user_id).all())
+            # Completion adds whole minutes per session, so floor each row
+            mindful = dict(db.query(models.MindfulSession.user_id, func.sum(models.MindfulSession.duration // 60)).filter(
+                models.MindfulSession.user_id.in_(ids), models.MindfulSession.completed == True
+            ).group_by(models.MindfulSession.user_id).all())
+            daily = _daily_minutes(db, ids, since)
+
+            for user in users:
+                totals = {
+                    "total_study_time": int(study.get(user.id) or 0),
+                    "total_mindful_time": int(mindful.get(user.id) or 0),
+                    "current_streak": current_streak(
+                        {day for day, minutes in daily[user.id].items() if minutes >= (user.daily_goal or 0)}, today
+                    ),
+                }
+                if any(getattr(user, key) != value for key, value in totals.items()):
+                    for key, value in totals.items():
+                        setattr(user, key, value)
+                    updated += 1
+            db.commit()
+        finally:
+            db.close()
+        scanned += len(users)
+        last_id = ids[-1]
+        if len(users) < settings.maintenance_batch_size:
+            break
+    return {"users": scanned, "updated": updated}
+
+
+def prune_change_log(stop: threading.Event) -> int:
+    """Delete change log entries older than the retention period.
+
+    The newest entry is always kept so ids keep increasing; sync tokens from
+    before the pruned range get `reset: true`.
+    """
+    changes = models.ChangeLog.__table__
+    cutoff = datetime.utcnow() - timedelta(days=settings.change_log_retention_days)
+    pruned = 0
+    with engine.connect() as conn:
+        newest = conn.execute(select(func.max(changes.c.id))).scalar()
+    if newest is None:
+        return 0
+    while not stop.is_set():
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(changes.c.id)
+                .where(changes.c.changed_at < cutoff, changes.c.id < newest)
+                .order_by(changes.c.id)
+                .limit(settings.maintenance_batch_size)
+            ).scalars().all()
+            for start in range(0, len(ids), DELETE_CHUNK):
+                conn.execute(delete(changes).where(changes.c.id.in_(ids[start:start + DELETE_CHUNK])))
+        pruned += len(ids)
+        if len(ids) < settings.maintenance_batch_size:
+            break
+    return pruned
+
+
+def compact_old_data(stop: threading.Event) -> dict:
+    """Prune the sync change log, archive old chat messages, delete unused previews and old AI usage records"""
+    summary = {"change_log_pruned": prune_change_log(stop)}
+    if not stop.is_set():
+        archived = archive_old_messages()
+        summary["messages_archived"] = archived["messages"]
+    if not stop.is_set():
+        summary["previews_removed"] = prune_previews(stop)["removed"]
+    if not stop.is_set():
+        summary["ai_usage_pruned"] = prune_usage_records(stop)
+    return summary
+
+
+# Create a singleton instance
+scheduler = Scheduler([
+    Job("close_stale_study_sessions", timedelta(minutes=settings.stale_session_check_minutes), close_stale_study_sessions),
+    Job("recompute_user_totals", timedelta(hours=settings.rollup_interval_hours), recompute_user_totals),
+    Job("compact_old_data", timedelta(hours=settings.rollup_interval_hours), compact_old_data),
+    Job("purge_requested_accounts", timedelta(minutes=settings.account_purge_check_minutes), purge_requested_accounts),
+    Job("expire_upload_sessions", timedelta(minutes=settings.upload_cleanup_minutes), expire_upload_sessions),
+])
@@ -0,0 +1,284 @@
+"""Thumbnails of uploaded PDFs and images, so document lists don't download originals.
+
+Uploads are queued here after the response is sent. The first PDF page
+(pypdfium2) or the image itself is decoded at reduced resolution where the
+format allows it. It is then scaled down to each of PREVIEW_SIZES in a process
+pool, so a large scan neither blocks the event loop nor holds the GIL.
+Every JPEG is stored under the SHA-256 of its bytes, and the rows also keep
+the SHA-256 of the source file. An identical file uploaded again therefore
+reuses the stored previews without rendering, and a preview URL never changes
+content, so it can be cached forever.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from .. import models
+from ..change_log import UPSERT, record_changes
+from ..config import settings
+from ..database import SessionLocal, engine
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency, see requirements-optional.txt
+    Image = None
+try:
+    import cv2
+except ImportError:  # optional dependency, see requirements-optional.txt
+    cv2 = None
+try:
+    import pypdfium2
+except ImportError:  # optional dependency, see requirements-optional.txt
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels
+PREVIEW_SIZES = {"small": 160, "medium": 480, "large": 1024}
+
+READ_BLOCK = 1024 * 1024
+
+
+def can_render(document_type: str) -> bool:
+    """Whether the installed libraries can preview this kind of document"""
+    if Image is None and cv2 is None:
+        return False
+    if document_type == "image":
+        return True
+    return document_type == "pdf" and pypdfium2 is not None
+
+
+def preview_path(digest: str) -> str:
+    return os.path.join(settings.preview_directory, digest[:2], f"{digest}.jpg")
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# The functions below run in the pool's processes
+
+def _load(path: str, kind: str, edge: int):
+    """Decode the image or first PDF page at no less than about `edge` pixels on the long side"""
+    if kind == "pdf":
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()  # points
+            bitmap = page.render(scale=edge / max(width, height))
+            image = bitmap.to_pil().copy() if Image is not None else bitmap.to_numpy().copy()
+            page.close()
+            return image
+        finally:
+            pdf.close()
+
+    if Image is not None:
+        image = Image.open(path)
+        # JPEGs decode straight at 1/2, 1/4 or 1/8 scale, which is most of the work saved
+        image.draft("RGB", (edge, edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        return image
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Unreadable image")
+    return image
+
+
+def _fit(image, edge: int):
+    """Scale down (never up) so the longest side is at most `edge`"""
+    if Image is not None and isinstance(image, Image.Image):
+        image = image.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        return image, image.size
+    height, width = image.shape[:2]
+    scale = edge / max(width, height)
+    if scale < 1:
+        width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    return image, (width, height)
+
+
+def _encode(image, quality: int) -> bytes:
+    if Image is not None and isinstance(image, Image.Image):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+        return buffer.getvalue()
+    ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return data.tobytes()
+
+
+def _write(directory: str, digest: str, data: bytes):
+    path = os.path.join(directory, digest[:2], f"{digest}.jpg")
+    if os.path.exists(path):
+        return  # same bytes already stored
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def render_previews(path: str, kind: str, directory: str, quality: int) -> List[dict]:
+    """Render and store every preview size; returns one row per size"""
+    sizes = sorted(PREVIEW_SIZES.items(), key=lambda item: item[1], reverse=True)
+    image = _load(path, kind, sizes[0][1])
+    rendered = []
+    # Largest first, each scaled from the previous one
+    for name, edge in sizes:
+        image, (width, height) = _fit(image, edge)
+        data = _encode(image, quality)
+        digest = hashlib.sha256(data).hexdigest()
+        _write(directory, digest, data)
+        rendered.append({"size": name, "digest": digest, "width": width, "height": height, "bytes": len(data)})
+    return rendered
+
+
+class PreviewPipeline:
+    """Renders and stores document previews in the background"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._running: Set[str] = set()
+        self._failed: Set[str] = set()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process with an event loop and open connections is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def rendering(self, document_id: str) -> bool:
+        """Whether this worker is rendering the document's previews right now"""
+        return document_id in self._running
+
+    def wanted(self, document: models.UploadedDocument) -> bool:
+        """Whether rendering this document's previews is possible and not already done or tried"""
+        return (
+            settings.generate_previews
+            and can_render(document.type.value)
+            and not document.previews
+            and document.id not in self._running
+            and document.id not in self._failed
+        )
+
+    async def process(self, document_id: str):
+        """Render previews for one document (usable with BackgroundTasks.add_task)"""
+        db = SessionLocal()
+        try:
+            document = db.get(models.UploadedDocument, document_id)
+            if document is None or not self.wanted(document):
+                return
+            path, kind, user_id = document.uri, document.type.value, document.user_id
+        finally:
+            db.close()
+
+        self._running.add(document_id)
+        start = time.perf_counter()
+        try:
+            source_digest = await asyncio.to_thread(file_digest, path)
+            rendered = self._cached(source_digest)
+            cached = rendered is not None
+            if not cached:
+                rendered = await asyncio.get_running_loop().run_in_executor(
+                    self._executor(), render_previews, path, kind, settings.preview_directory, settings.preview_jpeg_quality
+                )
+            self._store(document_id, user_id, source_digest, rendered)
+        except Exception as e:
+            if len(self._failed) > 10_000:
+                self._failed.clear()
+            self._failed.add(document_id)
+            logger.warning("Preview rendering failed: %s", e, extra={"document_id": document_id})
+            return
+        finally:
+            self._running.discard(document_id)
+        logger.info(
+            "Document previews stored",
+            extra={"document_id": document_id, "cached": cached, "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
+        )
+
+    def _cached(self, source_digest: str) -> Optional[List[dict]]:
+        """Previews already rendered from an identical file, if all of them are still on disk"""
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(models.DocumentPreview.__table__).where(models.DocumentPreview.source_digest == source_digest)
+            ).mappings().all()
+        by_size = {row["size"]: row for row in rows}
+        if set(by_size) != set(PREVIEW_SIZES) or not all(os.path.exists(preview_path(row["digest"])) for row in by_size.values()):
+            return None
+        return [
+            {key: row[key] for key in ("size", "digest", "width", "height", "bytes")}
+            for row in by_size.values()
+        ]
+
+    def _store(self, document_id: str, user_id: str, source_digest: str, rendered: List[dict]):
+        db = SessionLocal()
+        try:
+            if db.get(models.UploadedDocument, document_id) is None:
+                return  # deleted in the meantime
+            for preview in rendered:
+                db.add(models.DocumentPreview(document_id=document_id, source_digest=source_digest, **preview))
+            # Let synced clients pick up the new preview URLs
+            record_changes(db.connection(), [(user_id, "documents", document_id, UPSERT)])
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # another worker stored them first
+        finally:
+            db.close()
+
+
+def prune_previews(stop: threading.Event) -> dict:
+    """Scheduled job: delete preview files no document refers to any more"""
+    # Files younger than this may belong to a render whose rows aren't committed yet
+    cutoff = (datetime.utcnow() - timedelta(hours=1)).timestamp()
+    with engine.connect() as conn:
+        referenced = set(conn.execute(select(models.DocumentPreview.digest).distinct()).scalars())
+    removed = 0
+    if not os.path.isdir(settings.preview_directory):
+        return {"removed": 0}
+    for shard in os.scandir(settings.preview_directory):
+        if stop.is_set():
+            break
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            digest = entry.name.split(".", 1)[0]
+            if digest in referenced or entry.stat().st_mtime > cutoff:
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError as e:
+                logger.warning("Failed to delete preview %s: %s", entry.path, e)
+    return {"removed": removed}
+
+
+# Create a singleton instance
+preview_pipeline = PreviewPipeline(settings.preview_workers)
@@ -0,0 +1,179 @@
+"""Batched deletion of conversations and whole accounts.
+
+Rows are deleted with Core statements, `batch_size` rows per short
+transaction and children before parents, so a huge conversation or account
+never gets loaded into memory or deleted in one long-locking statement. The
+explicit child deletes also keep this working on databases created before the
+foreign keys had ON DELETE CASCADE.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from .. import models, search
+from ..change_log import DELETE, record_changes
+from ..config import settings
+from ..database import engine
+from .uploads import remove_temp_file
+
+logger = logging.getLogger(__name__)
+
+_users = models.User.__table__
+_conversations = models.AidaConversation.__table__
+_messages = models.AidaMessage.__table__
+_archives = models.AidaMessageArchive.__table__
+_documents = models.UploadedDocument.__table__
+_study_aids = models.DocumentStudyAids.__table__
+_previews = models.DocumentPreview.__table__
+_uploads = models.UploadSession.__table__
+
+# Archive blocks hold whole conversations' worth of messages, so fewer per batch
+ARCHIVE_BATCH = 20
+
+
+def _delete_in_batches(table, key, condition, batch_size: int, stop: Optional[threading.Event] = None) -> int:
+    """Delete matching rows `batch_size` at a time, one transaction per batch"""
+    deleted = 0
+    while stop is None or not stop.is_set():
+        with engine.begin() as conn:
+            batch = select(key).where(condition).limit(batch_size).scalar_subquery()
+            count = conn.execute(delete(table).where(key.in_(batch))).rowcount
+        deleted += count
+        if count < batch_size:
+            break
+    return deleted
+
+
+def _delete_archives(conversation_id: str, stop: Optional[threading.Event] = None):
+    """Delete a conversation's archive blocks, taking them out of the search index first"""
+    while stop is None or not stop.is_set():
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(_archives.c.id).where(_archives.c.conversation_id == conversation_id).limit(ARCHIVE_BATCH)
+            ).scalars().all()
+            if ids:
+                search.unindex_archives(conn, ids)
+                conn.execute(delete(_archives).where(_archives.c.id.in_(ids)))
+        if len(ids) < ARCHIVE_BATCH:
+            break
+
+
+def delete_conversation(conversation_id: str, user_id: str, batch_size: Optional[int] = None) -> int:
+    """Delete a conversation with its messages and archive blocks; returns messages deleted"""
+    batch_size = batch_size or settings.maintenance_batch_size
+    messages = _delete_in_batches(_messages, _messages.c.id, _messages.c.conversation_id == conversation_id, batch_size)
+    _delete_archives(conversation_id)
+    with engine.begin() as conn:
+        conn.execute(delete(_conversations).where(_conversations.c.id == conversation_id))
+        # Core delete: log it for sync ourselves
+        record_changes(conn, [(user_id, "conversations", conversation_id, DELETE)])
+    return messages
+
+
+def _remove_file(path: Optional[str]):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        logger.warning("Failed to delete file %s: %s", path, e)
+
+
+def purge_user(user_id: str, stop: Optional[threading.Event] = None) -> dict:
+    """Delete everything stored for a user, then the user; safe to run again after an interruption"""
+    batch_size = settings.maintenance_batch_size
+    summary = {"messages": 0, "conversations": 0, "documents": 0, "uploads": 0}
+
+    while stop is None or not stop.is_set():
+        with engine.connect() as conn:
+            conversation_ids = conn.execute(
+                select(_conversations.c.id).where(_conversations.c.user_id == user_id).limit(batch_size)
+            ).scalars().all()
+        for conversation_id in conversation_ids:
+            summary["messages"] += _delete_in_batches(
+                _messages, _messages.c.id, _messages.c.conversation_id == conversation_id, batch_size, stop
+            )
+            _delete_archives(conversation_id, stop)
+            if stop is not None and stop.is_set():
+                return summary
+            with engine.begin() as conn:
+                conn.execute(delete(_conversations).where(_conversations.c.id == conversation_id))
+            summary["conversations"] += 1
+        if len(conversation_ids) < batch_size:
+            break
+
+    while stop is None or not stop.is_set():
+        with engine.connect() as conn:
+            documents = conn.execute(
+                select(_documents.c.id, _documents.c.uri).where(_documents.c.user_id == user_id).limit(batch_size)
+            ).all()
+        if documents:
+            ids = [document.id for document in documents]
+            with engine.begin() as conn:
+                conn.execute(delete(_study_aids).where(_study_aids.c.document_id.in_(ids)))
+                conn.execute(delete(_previews).where(_previews.c.document_id.in_(ids)))
+                conn.execute(delete(_documents).where(_documents.c.id.in_(ids)))
+            # Files go after the rows, so a crash leaves stray files rather than broken rows
+            for document in documents:
+                _remove_file(document.uri)
+            summary["documents"] += len(documents)
+        if len(documents) < batch_size:
+            break
+
+    while stop is None or not stop.is_set():
+        with engine.connect() as conn:
+            pending = conn.execute(
+                select(_uploads.c.id, _uploads.c.temp_path, _uploads.c.document_id)
+                .where(_uploads.c.user_id == user_id).limit(batch_size)
+            ).all()
+        if pending:
+            with engine.begin() as conn:
+                conn.execute(delete(_uploads).where(_uploads.c.id.in_([upload.id for upload in pending])))
+            for upload in pending:
+                if upload.document_id is None:
+                    remove_temp_file(upload.temp_path)
+            summary["uploads"] += len(pending)
+        if len(pending) < batch_size:
+            break
+
+    for model in (models.StudySession, models.MindfulSession, models.ChangeLog, models.AIUsageRecord):
+        table = model.__table__
+        summary[table.name] = _delete_in_batches(table, table.c.id, table.c.user_id == user_id, batch_size, stop)
+    scores = models.MindfulSessionScore.__table__
+    usage_daily = models.AIUsageDaily.__table__
+    if stop is not None and stop.is_set():
+        return summary
+    with engine.begin() as conn:
+        conn.execute(delete(scores).where(scores.c.user_id == user_id))
+        conn.execute(delete(usage_daily).where(usage_daily.c.user_id == user_id))
+        conn.execute(delete(_users).where(_users.c.id == user_id))
+    summary["user_deleted"] = True
+    logger.info("Purged user", extra={"user_id": user_id, "result": summary})
+    return summary
+
+
+def request_account_deletion(user_id: str) -> bool:
+    """Mark a user for purging; the purge itself runs in the background"""
+    with engine.begin() as conn:
+        result = conn.execute(
+            _users.update().where(_users.c.id == user_id).values(deletion_requested_at=datetime.utcnow())
+        )
+    return result.rowcount == 1
+
+
+def purge_requested_accounts(stop: threading.Event) -> dict:
+    """Scheduled job: finish purges that were requested but not completed"""
+    with engine.connect() as conn:
+        user_ids = conn.execute(
+            select(_users.c.id).where(_users.c.deletion_requested_at.is_not(None))
+        ).scalars().all()
+    purged = 0
+    for user_id in user_ids:
+        if stop.is_set():
+            break
+        if purge_user(user_id, stop).get("user_deleted"):
+            purged += 1
+    return {"purged": purged}
@@ -0,0 +1,220 @@
+import asyncio
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+from ..config import settings
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a caller has used up its token bucket"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class GovernorTimeout(Exception):
+    """Raised when an upstream call waited too long for provider quota"""
+
+
+class BucketStore(ABC):
+    """Storage backend for token buckets.
+
+    `take` removes `cost` tokens from the bucket at `key` and returns 0 when
+    the tokens were available, otherwise the number of seconds until they
+    will be (nothing is removed in that case). `refund` puts tokens from a
+    successful `take` back, up to `capacity`.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0) -> float:
+        ...
+
+    @abstractmethod
+    async def refund(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0):
+        ...
+
+
+class MemoryBucketStore(BucketStore):
+    """Per-process bucket store, used when no shared store is configured"""
+
+    SWEEP_EVERY = 1024
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    async def take(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0) -> float:
+        return self._update(key, capacity, refill_rate, min(cost, capacity))
+
+    async def refund(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0):
+        self._update(key, capacity, refill_rate, -min(cost, capacity))
+
+    def _update(self, key: str, capacity: float, refill_rate: float, cost: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens = min(capacity, tokens - cost)
+            else:
+                wait = (cost - tokens) / refill_rate
+            # Remember when the bucket is full again so idle keys can be dropped
+            full_at = now + (capacity - tokens) / refill_rate
+            self._buckets[key] = (tokens, now, full_at)
+
+            self._calls += 1
+            if self._calls % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+        return wait
+
+    def _sweep(self, now: float):
+        """Drop buckets that have refilled completely (they behave like new ones)"""
+        idle = [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]
+        for key in idle:
+            del self._buckets[key]
+
+
+# Refill and take atomically inside Redis so several workers share one bucket
+_REDIS_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = math.min(capacity, tokens - cost)
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore(BucketStore):
+    """Bucket store backed by Redis (or any server speaking its protocol)"""
+
+    def __init__(self, url: str, prefix: str = "alden:ratelimit:"):
+        import redis.asyncio  # Optional dependency, see requirements-optional.txt
+
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._take = self._client.register_script(_REDIS_TAKE_SCRIPT)
+        self._prefix = prefix
+
+    async def take(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0) -> float:
+        cost = min(cost, capacity)
+        wait = await self._take(keys=[self._prefix + key], args=[capacity, refill_rate, cost, time.time()])
+        return float(wait)
+
+    async def refund(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0):
+        # A negative cost always fits, and the script caps the bucket at capacity
+        await self._take(keys=[self._prefix + key], args=[capacity, refill_rate, -min(cost, capacity), time.time()])
+
+
+def create_bucket_store(url: Optional[str] = None) -> BucketStore:
+    """Build the bucket store configured by `url` (in-memory when empty)"""
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketStore(url)
+    return MemoryBucketStore()
+
+
+class RateLimiter:
+    """Token-bucket limiter keyed per user and per route"""
+
+    def __init__(self, store: BucketStore):
+        self.store = store
+        self.limits: Dict[str, Tuple[float, float]] = {}
+
+    def configure(self, route: str, per_minute: float, burst: float):
+        """Allow `per_minute` calls to `route` with bursts of up to `burst`"""
+        self.limits[route] = (float(burst), per_minute / 60.0)
+
+    async def hit(self, user_id: str, route: str):
+        """Consume one call for `user_id` on `route`, raising RateLimitExceeded if over the limit"""
+        if not settings.rate_limit_enabled or route not in self.limits:
+            return
+        capacity, refill_rate = self.limits[route]
+        wait = await self.store.take(f"user:{user_id}:{route}", capacity, refill_rate)
+        if wait > 0:
+            raise RateLimitExceeded(wait)
+
+
+class UpstreamGovernor:
+    """Smooths calls to the AI provider to its request and token quotas.
+
+    Callers that would exceed the quota wait for the buckets to refill
+    instead of failing; only a wait longer than `max_wait` raises
+    GovernorTimeout so the caller can fall back.
+    """
+
+    def __init__(self, store: BucketStore, requests_per_second: float, tokens_per_minute: float, max_wait: float):
+        self.store = store
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+
+    def _requests(self) -> Tuple[str, float, float]:
+        return "upstream:requests", max(1.0, self.requests_per_second), self.requests_per_second
+
+    def _tokens(self) -> Tuple[str, float, float]:
+        return "upstream:tokens", self.tokens_per_minute, self.tokens_per_minute / 60.0
+
+    async def acquire(self, estimated_tokens: int):
+        """Wait until one request of roughly `estimated_tokens` tokens fits the quota"""
+        deadline = time.monotonic() + self.max_wait
+        await self._wait_for(*self._requests(), 1, deadline)
+        try:
+            await self._wait_for(*self._tokens(), estimated_tokens, deadline)
+        except GovernorTimeout:
+            # The call won't be made, so it must not use up request quota either
+            await self.store.refund(*self._requests(), 1)
+            raise
+
+    async def try_acquire(self, estimated_tokens: int) -> bool:
+        """Take quota only if it is available right now (for optional calls)"""
+        if await self.store.take(*self._requests(), 1) > 0:
+            return False
+        if await self.store.take(*self._tokens(), estimated_tokens) > 0:
+            await self.store.refund(*self._requests(), 1)
+            return False
+        return True
+
+    async def _wait_for(self, key: str, capacity: float, refill_rate: float, cost: float, deadline: float):
+        while True:
+            wait = await self.store.take(key, capacity, refill_rate, cost)
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise GovernorTimeout(f"Upstream quota wait of {wait:.1f}s exceeds the limit")
+            await asyncio.sleep(wait)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for quota accounting (about four characters per token)"""
+    return int(math.ceil(len(text) / 4))
+
+
+# Create singleton instances
+_bucket_store = create_bucket_store(settings.rate_limit_storage_url)
+
+rate_limiter = RateLimiter(_bucket_store)
+rate_limiter.configure("ai_chat", settings.rate_limit_chat_per_minute, settings.rate_limit_chat_burst)
+rate_limiter.configure("ai_flashcards", settings.rate_limit_flashcards_per_minute, settings.rate_limit_flashcards_burst)
+
+ai_governor = UpstreamGovernor(
+    _bucket_store,
+    requests_per_second=settings.ai_max_requests_per_second,
+    tokens_per_minute=settings.ai_max_tokens_per_minute,
+    max_wait=settings.ai_governor_max_wait,
+)
@@ -0,0 +1,94 @@
+"""Ranks catalog mindful sessions per user and context.
+
+Per-session affinity (ratings, completions) is precomputed on completion
+into `mindful_session_scores`; recent study load is kept as a decaying sum
+on the user row. Ranking then only combines those with the request context
+and needs no history scan.
+"""
+import math
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .. import catalog
+
+# Bayesian prior: an unrated session behaves like one rated 3.5 twice
+PRIOR_RATING = 3.5
+PRIOR_WEIGHT = 2.0
+
+# Study minutes lose half their weight every 12 hours
+STUDY_LOAD_HALF_LIFE_HOURS = 12.0
+# Load at which the user counts as heavily loaded
+HEAVY_STUDY_LOAD_MINUTES = 180.0
+
+# Sessions completed this recently are pushed down for variety
+RECENTLY_COMPLETED_HOURS = 6.0
+
+# How well each catalog category fits a context
+CONTEXT_FIT = {
+    "pre_study": {"pre_study": 1.0, "quick_relief": 0.4, "exam_support": 0.3, "post_study": 0.0},
+    "post_study": {"post_study": 1.0, "quick_relief": 0.5, "pre_study": 0.1, "exam_support": 0.1},
+    "exam": {"exam_support": 1.0, "quick_relief": 0.7, "pre_study": 0.4, "post_study": 0.1},
+    "anytime": {"quick_relief": 0.5, "pre_study": 0.5, "post_study": 0.5, "exam_support": 0.5},
+}
+
+AFFINITY_WEIGHT = 1.0
+CONTEXT_WEIGHT = 1.5
+LOAD_WEIGHT = 0.5
+RECENCY_PENALTY = 0.6
+
+
+def affinity(completions: int, rating_sum: int, rating_count: int) -> float:
+    """0..1 preference for a session from its ratings and how often it was finished"""
+    mean_rating = (rating_sum + PRIOR_RATING * PRIOR_WEIGHT) / (rating_count + PRIOR_WEIGHT)
+    rating_part = (mean_rating - 1) / 4
+    # Finishing a session repeatedly is a signal too, with diminishing returns
+    completion_part = 1 - 1 / (1 + math.log1p(completions))
+    return 0.8 * rating_part + 0.2 * completion_part
+
+
+def decayed_load(load: Optional[float], as_of: Optional[datetime], now: datetime) -> float:
+    if not load or as_of is None:
+        return 0.0
+    hours = max(0.0, (now - as_of.replace(tzinfo=None)).total_seconds() / 3600)
+    return load * 0.5 ** (hours / STUDY_LOAD_HALF_LIFE_HOURS)
+
+
+def _load_fit(category: str, load_factor: float) -> float:
+    """After heavy studying favour relief and reflection; when fresh, focus"""
+    if category in ("quick_relief", "post_study"):
+        return load_factor
+    if category == "pre_study":
+        return 1 - load_factor
+    return 0.5
+
+
+def rank(scores: Dict[str, object], context: str, study_load: float, now: datetime, limit: int) -> List[dict]:
+    """Catalog sessions ordered by fit; `scores` maps catalog id to its score row"""
+    fits = CONTEXT_FIT.get(context, CONTEXT_FIT["anytime"])
+    load_factor = min(1.0, study_load / HEAVY_STUDY_LOAD_MINUTES)
+    default_affinity = affinity(0, 0, 0)
+
+    ranked = []
+    for session in catalog.PREBUILT_SESSIONS:
+        row = scores.get(session["id"])
+        session_affinity = row.affinity if row is not None and row.affinity is not None else default_affinity
+        context_fit = fits.get(session["category"], 0.0)
+        load_fit = _load_fit(session["category"], load_factor)
+        score = AFFINITY_WEIGHT * session_affinity + CONTEXT_WEIGHT * context_fit + LOAD_WEIGHT * load_fit
+
+        reasons = []
+        if context_fit >= 1.0:
+            reasons.append("matches_context")
+        if row is not None and row.rating_count and session_affinity > default_affinity:
+            reasons.append("highly_rated")
+        if load_factor >= 0.5 and session["category"] in ("quick_relief", "post_study"):
+            reasons.append("recent_study_load")
+        last_completed = row.last_completed_at if row is not None else None
+        if last_completed is not None and (now - last_completed.replace(tzinfo=None)).total_seconds() < RECENTLY_COMPLETED_HOURS * 3600:
+            score -= RECENCY_PENALTY
+            reasons.append("recently_completed")
+
+        ranked.append({"session": session, "score": round(score, 4), "reasons": reasons})
+
+    ranked.sort(key=lambda item: item["score"], reverse=True)
+    return ranked[:limit]
@@ -0,0 +1,174 @@
+"""In-process scheduler for periodic maintenance jobs.
+
+Every worker runs the loop, but a job only runs where its lease in
+`scheduled_jobs` could be taken: claiming is a single conditional UPDATE,
+so exactly one worker wins each due run, and a worker that dies mid-job
+gives the job up when the lease expires. A running job renews its lease
+between batches, and stops if another worker has taken it over. Jobs run on
+a thread so the event loop keeps serving requests.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .. import metrics, models
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+_jobs = models.ScheduledJob.__table__
+
+
+@dataclass
+class Job:
+    name: str
+    interval: timedelta
+    func: Callable[[threading.Event], dict]  # gets the stop event, returns a JSON-able summary
+
+
+class JobBusy(Exception):
+    """The job is not due, or another worker holds its lease"""
+
+
+class _Lease(threading.Event):
+    """The stop event a running job checks between batches; checking it also renews the job's lease.
+
+    It reads as set once the scheduler stops or the lease has passed to
+    another worker, so the job ends after its current batch.
+    """
+
+    def __init__(self, scheduler: "Scheduler", job: Job):
+        super().__init__()
+        self.scheduler = scheduler
+        self.job = job
+        self._renewed = time.monotonic()
+
+    def is_set(self) -> bool:
+        if super().is_set() or self.scheduler._stop.is_set():
+            return True
+        # Renew well before expiry, without a write per batch
+        if time.monotonic() - self._renewed >= settings.scheduler_lease_seconds / 3:
+            if not self.scheduler._renew(self.job):
+                logger.warning("Scheduled job lost its lease; stopping", extra={"job": self.job.name})
+                self.set()
+                return True
+            self._renewed = time.monotonic()
+        return False
+
+
+class Scheduler:
+    """Runs due jobs on the worker that holds their lease"""
+
+    def __init__(self, jobs: List[Job]):
+        self.jobs = {job.name: job for job in jobs}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._register()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop scheduling; a running job ends after its current batch"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while not self._stop.is_set():
+            for job in self.jobs.values():
+                if self._stop.is_set():
+                    return
+                try:
+                    await asyncio.to_thread(self.run, job.name)
+                except JobBusy:
+                    pass
+                except Exception as e:
+                    logger.warning("Scheduler error: %s", e, extra={"job": job.name})
+            await asyncio.sleep(settings.scheduler_poll_seconds)
+
+    def _register(self):
+        with engine.begin() as conn:
+            known = set(conn.execute(select(_jobs.c.name)).scalars())
+        for name in self.jobs.keys() - known:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(_jobs).values(name=name))
+            except IntegrityError:
+                pass  # registered by another worker
+
+    def _claim(self, job: Job, now: datetime, force: bool) -> bool:
+        conditions = [_jobs.c.name == job.name, or_(_jobs.c.lease_expires_at.is_(None), _jobs.c.lease_expires_at < now)]
+        if not force:
+            conditions.append(or_(_jobs.c.last_started_at.is_(None), _jobs.c.last_started_at <= now - job.interval))
+        with engine.begin() as conn:
+            result = conn.execute(update(_jobs).where(*conditions).values(
+                lease_holder=self.worker_id,
+                lease_expires_at=now + timedelta(seconds=settings.scheduler_lease_seconds),
+                last_started_at=now,
+            ))
+        return result.rowcount == 1
+
+    def _renew(self, job: Job) -> bool:
+        """Extend the lease; False when this worker no longer holds it"""
+        with engine.begin() as conn:
+            result = conn.execute(update(_jobs).where(_jobs.c.name == job.name, _jobs.c.lease_holder == self.worker_id).values(
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=settings.scheduler_lease_seconds),
+            ))
+        return result.rowcount == 1
+
+    def _release(self, job: Job, status: str, result: str):
+        with engine.begin() as conn:
+            conn.execute(update(_jobs).where(_jobs.c.name == job.name, _jobs.c.lease_holder == self.worker_id).values(
+                lease_holder=None,
+                lease_expires_at=None,
+                last_finished_at=datetime.utcnow(),
+                last_status=status,
+                last_result=result,
+            ))
+
+    def run(self, name: str, force: bool = False) -> dict:
+        """Run a job if it is due (or now, with `force`) and no other worker holds it"""
+        job = self.jobs[name]
+        if not self._claim(job, datetime.utcnow(), force):
+            raise JobBusy(name)
+        start = time.perf_counter()
+        try:
+            summary = job.func(_Lease(self, job))
+        except Exception as e:
+            logger.exception("Scheduled job failed: %s", e, extra={"job": name})
+            metrics.scheduled_job_duration.observe(time.perf_counter() - start, name, "error")
+            self._release(job, "error", str(e)[:500])
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.scheduled_job_duration.observe(elapsed, name, "ok")
+        self._release(job, "ok", json.dumps(summary, default=str))
+        logger.info("Scheduled job finished", extra={"job": name, "duration_ms": round(elapsed * 1000, 2), "result": summary})
+        return summary
+
+    def status(self) -> List[dict]:
+        with engine.connect() as conn:
+            rows = conn.execute(select(_jobs).order_by(_jobs.c.name)).mappings().all()
+        return [
+            {**row, "interval_seconds": self.jobs[row["name"]].interval.total_seconds()}
+            for row in rows if row["name"] in self.jobs
+        ]
@@ -0,0 +1,128 @@
+"""Precomputes study aids (summary, key terms, flashcards) for uploaded documents.
+
+When `precompute_study_aids` is on, each upload with extractable text is
+queued here after the response is sent. A per-worker semaphore bounds how
+many documents talk to the model at once; results land in
+`document_study_aids`, where chat and flashcard requests read them instead
+of calling the model again.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import List, Optional
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+from .ai_service import ai_service
+from .usage import attribute
+
+logger = logging.getLogger(__name__)
+
+# Chat messages that the stored summary answers on its own
+SUMMARY_REQUEST = re.compile(
+    r"^\s*(please\s+)?(summari[sz]e|give me (a|the) summary|what are the key (terms|points))\b",
+    re.IGNORECASE,
+)
+
+
+class StudyAidPipeline:
+    """Generates and stores study aids for documents in the background"""
+
+    def __init__(self, max_concurrency: int):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def process(self, document_id: str):
+        """Generate study aids for one document (usable with BackgroundTasks.add_task)"""
+        self._store(document_id, status="pending")
+        async with self._semaphore:
+            db = SessionLocal()
+            try:
+                document = db.get(models.UploadedDocument, document_id)
+                text = document.extracted_text if document else None
+                name = document.name if document else ""
+                user_id = document.user_id if document else None
+            finally:
+                db.close()
+            if not text:
+                self._store(document_id, status="failed", error="No text could be extracted")
+                return
+
+            start = time.perf_counter()
+            with attribute(user_id, "study_aids"):
+                aids = await ai_service.generate_study_aids(text[:settings.study_aids_max_chars], name)
+            if aids is None:
+                self._store(document_id, status="failed", error="The AI provider returned no usable study aids")
+                return
+            self._store(
+                document_id,
+                status="ready",
+                summary=aids["summary"],
+                key_terms=json.dumps(aids["key_terms"]),
+                flashcards=json.dumps(aids["flashcards"]),
+                model=settings.ai_model,
+                error=None,
+            )
+            logger.info(
+                "Study aids stored",
+                extra={"document_id": document_id, "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
+            )
+
+    def _store(self, document_id: str, **values):
+        db = SessionLocal()
+        try:
+            if db.get(models.UploadedDocument, document_id) is None:
+                return  # deleted in the meantime
+            row = db.get(models.DocumentStudyAids, document_id)
+            if row is None:
+                row = models.DocumentStudyAids(document_id=document_id)
+                db.add(row)
+            for key, value in values.items():
+                setattr(row, key, value)
+            db.commit()
+        finally:
+            db.close()
+
+
+def to_schema(row: models.DocumentStudyAids) -> dict:
+    """Stored study aids with the JSON columns decoded"""
+    return {
+        "document_id": row.document_id,
+        "status": row.status,
+        "summary": row.summary,
+        "key_terms": json.loads(row.key_terms) if row.key_terms else [],
+        "flashcards": json.loads(row.flashcards) if row.flashcards else [],
+        "updated_at": row.updated_at,
+    }
+
+
+def prompt_context(rows: List[models.DocumentStudyAids]) -> Optional[str]:
+    """Document notes for the chat prompt, built from stored summaries and key terms"""
+    if not rows:
+        return None
+    parts = []
+    for row in rows:
+        terms = ", ".join(item["term"] for item in json.loads(row.key_terms or "[]"))
+        part = f"Document \"{row.document.name}\": {row.summary}"
+        if terms:
+            part += f"\nKey terms: {terms}"
+        parts.append(part)
+    return "\n\n".join(parts)
+
+
+def answer_from_study_aids(message: str, rows: List[models.DocumentStudyAids]) -> Optional[str]:
+    """A reply built from one document's stored study aids, if the message only asks for those"""
+    if len(rows) != 1 or not SUMMARY_REQUEST.match(message):
+        return None
+    row = rows[0]
+    reply = f"Here's a summary of your document:\n\n{row.summary}"
+    key_terms = json.loads(row.key_terms or "[]")
+    if key_terms:
+        reply += "\n\nKey terms:\n" + "\n".join(f"• {item['term']}: {item['definition']}" for item in key_terms)
+    return reply
+
+
+# Create a singleton instance
+study_aid_pipeline = StudyAidPipeline(settings.study_aids_max_concurrency)
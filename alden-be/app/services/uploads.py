@@ -0,0 +1,202 @@
+"""Resumable document uploads.
+
+The client creates an upload session with the file's total size. Then it sends
+the bytes in PATCH requests, each starting at the session's current offset
+(as in the tus protocol). A chunk is received into a segment file of its own,
+and only the request that moves the offset forward copies it into the temp
+file, which was preallocated to the full size. So two requests for the same
+offset never mix their bytes. The session keeps a running CRC-32 of
+everything received, so a dropped connection only loses the chunk in flight.
+On completion, the file is re-read and checked against that CRC, then renamed
+into place. Only then is the `UploadedDocument` row created. Sessions that are
+never completed expire, and the `expire_upload_sessions` job deletes their
+temp files.
+"""
+import asyncio
+import errno
+import glob
+import logging
+import os
+import re
+import shutil
+import threading
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+
+from .. import models
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+_uploads = models.UploadSession.__table__
+
+READ_BLOCK = 1024 * 1024
+
+CHECKSUM_HEADER = re.compile(r"^crc32 ([0-9a-fA-F]{1,8})$")
+
+
+class UploadOffsetMismatch(Exception):
+    """The chunk does not start where the upload currently ends"""
+
+
+class UploadTooLarge(Exception):
+    """The chunk runs past the announced upload size"""
+
+
+class ChecksumMismatch(Exception):
+    """The received bytes do not match the client's checksum"""
+
+
+def parse_checksum(header: Optional[str]) -> Optional[int]:
+    """Value of an `Upload-Checksum: crc32 <hex>` header; ValueError if malformed"""
+    if header is None:
+        return None
+    match = CHECKSUM_HEADER.match(header.strip())
+    if not match:
+        raise ValueError("Upload-Checksum must be 'crc32 <hex digest>'")
+    return int(match.group(1), 16)
+
+
+def expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=settings.upload_session_ttl_hours)
+
+
+def new_temp_path(upload_id: str) -> str:
+    os.makedirs(settings.upload_partial_directory, exist_ok=True)
+    return os.path.join(settings.upload_partial_directory, f"{upload_id}.part")
+
+
+def preallocate(path: str, size: int):
+    """Create the temp file at its final size, reserving the disk blocks where the OS allows"""
+    with open(path, "wb") as f:
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError as e:
+                # Not supported by every filesystem; a sparse file still works
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+        f.truncate(size)
+
+
+async def write_chunk(
+    upload: models.UploadSession,
+    offset: int,
+    body: AsyncIterator[bytes],
+    expected_checksum: Optional[int] = None,
+) -> Tuple[str, int, int]:
+    """Receive a request body into a new segment file; returns (segment path, bytes written, new running CRC).
+
+    File I/O runs on threads. The segment is removed on any error; otherwise
+    pass it to `commit_chunk`.
+    """
+    if offset != upload.offset:
+        raise UploadOffsetMismatch(upload.offset)
+    remaining = upload.size - offset
+    written = 0
+    chunk_crc = 0
+    running_crc = upload.checksum
+    segment = f"{upload.temp_path}.{uuid.uuid4().hex}.seg"
+    f = await asyncio.to_thread(open, segment, "wb")
+    try:
+        try:
+            async for piece in body:
+                if not piece:
+                    continue
+                written += len(piece)
+                if written > remaining:
+                    raise UploadTooLarge(upload.size)
+                await asyncio.to_thread(f.write, piece)
+                chunk_crc = zlib.crc32(piece, chunk_crc)
+                running_crc = zlib.crc32(piece, running_crc)
+        finally:
+            await asyncio.to_thread(f.close)
+        if expected_checksum is not None and expected_checksum != chunk_crc:
+            raise ChecksumMismatch(f"{chunk_crc:08x}")
+    except BaseException:
+        await asyncio.to_thread(remove_temp_file, segment)
+        raise
+    return segment, written, running_crc
+
+
+def commit_chunk(upload_id: str, temp_path: str, segment: str, old_offset: int, new_offset: int, checksum: int) -> bool:
+    """Advance the offset, then copy the segment into the temp file; False if another request advanced it first.
+
+    A crash between the two leaves the temp file short of bytes the offset
+    covers; completion's CRC check catches that and restarts the upload.
+    """
+    try:
+        if not advance(upload_id, old_offset, new_offset, checksum):
+            return False
+        with open(segment, "rb") as source, open(temp_path, "r+b") as target:
+            target.seek(old_offset)
+            shutil.copyfileobj(source, target, READ_BLOCK)
+        return True
+    finally:
+        remove_temp_file(segment)
+
+
+def advance(upload_id: str, old_offset: int, new_offset: int, checksum: int) -> bool:
+    """Move the offset forward unless another request already did (compare-and-set)"""
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(_uploads)
+            .where(_uploads.c.id == upload_id, _uploads.c.offset == old_offset, _uploads.c.document_id.is_(None))
+            .values(offset=new_offset, checksum=checksum, expires_at=expiry())
+        )
+    return result.rowcount == 1
+
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def reset(upload_id: str):
+    """Start a corrupted upload over from byte 0"""
+    with engine.begin() as conn:
+        conn.execute(update(_uploads).where(_uploads.c.id == upload_id).values(offset=0, checksum=0, expires_at=expiry()))
+
+
+def remove_temp_file(path: Optional[str]):
+    """Delete a partial upload, with any chunk segments a crashed worker left next to it"""
+    if not path:
+        return
+    for leftover in [path] + glob.glob(f"{glob.escape(path)}.*.seg"):
+        try:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        except OSError as e:
+            logger.warning("Failed to delete partial upload %s: %s", leftover, e)
+
+
+def expire_upload_sessions(stop: threading.Event) -> dict:
+    """Scheduled job: delete expired upload sessions and their partial files"""
+    expired = 0
+    while not stop.is_set():
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(_uploads.c.id, _uploads.c.temp_path, _uploads.c.document_id)
+                .where(_uploads.c.expires_at < datetime.utcnow())
+                .limit(settings.maintenance_batch_size)
+            ).all()
+        if rows:
+            with engine.begin() as conn:
+                conn.execute(delete(_uploads).where(_uploads.c.id.in_([row.id for row in rows])))
+            # Completed sessions already moved their file into place
+            for row in rows:
+                if row.document_id is None:
+                    remove_temp_file(row.temp_path)
+        expired += len(rows)
+        if len(rows) < settings.maintenance_batch_size:
+            break
+    return {"expired": expired}
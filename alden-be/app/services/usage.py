@@ -0,0 +1,278 @@
+"""Per-user accounting of AI calls: tokens, latency, model, cache hits and fallbacks.
+
+`AIService` reports every provider call, and the routers report answers
+served from stored study aids, to `usage_recorder.record`. That only appends
+to an in-memory buffer. A background task writes the buffer every
+`ai_usage_flush_seconds` (or sooner, once `ai_usage_batch_size` records are
+waiting) as one executemany INSERT into `ai_usage_records`. The same
+transaction adds the batch's totals to the per-user, per-day rows of
+`ai_usage_daily`. Those rows answer the usage endpoint and the daily token
+quota with a primary key lookup instead of a scan.
+
+Who made a call and for which feature comes from `attribute()`, a context
+variable set by the caller. Background tasks started inside it inherit it.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .. import metrics, models
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+_records = models.AIUsageRecord.__table__
+_daily = models.AIUsageDaily.__table__
+
+_TOTALS = ("requests", "prompt_tokens", "response_tokens", "cached_tokens", "latency_ms", "cache_hits", "fallbacks")
+
+# (user_id, feature) of the AI work being done
+usage_context: ContextVar[Tuple[Optional[str], str]] = ContextVar("ai_usage_context", default=(None, "other"))
+
+
+@contextmanager
+def attribute(user_id: Optional[str], feature: str) -> Iterator[None]:
+    """Charge AI calls made inside the block to `user_id` and `feature`"""
+    token = usage_context.set((user_id, feature))
+    try:
+        yield
+    finally:
+        usage_context.reset(token)
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, response_tokens: int) -> Optional[float]:
+    """USD at the configured prices; None when the model has no price"""
+    prices = settings.ai_token_prices.get(model or "")
+    if prices is None:
+        return None
+    return round((prompt_tokens * prices[0] + response_tokens * prices[1]) / 1_000_000, 6)
+
+
+def next_reset(now: Optional[datetime] = None) -> datetime:
+    """When the daily quota starts over (midnight UTC)"""
+    now = now or datetime.utcnow()
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+
+
+def _daily_totals(batch: List[dict]) -> Dict[tuple, Dict[str, int]]:
+    """(user_id, day, feature, model) -> column increments for ai_usage_daily"""
+    totals = defaultdict(lambda: dict.fromkeys(_TOTALS, 0))
+    for record in batch:
+        row = totals[(record["user_id"] or "", record["created_at"].date(), record["feature"], record["model"] or "")]
+        row["requests"] += 1
+        row["prompt_tokens"] += record["prompt_tokens"]
+        row["response_tokens"] += record["response_tokens"]
+        row["cached_tokens"] += record["cached_tokens"]
+        row["latency_ms"] += record["latency_ms"] or 0
+        row["cache_hits"] += record["cache_hit"]
+        row["fallbacks"] += record["fallback"]
+    return totals
+
+
+def write_batch(batch: List[dict]):
+    """Insert the records and add them to the daily totals in one transaction"""
+    totals = _daily_totals(batch)
+    for attempt in range(2):
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(_records), batch)
+                for (user_id, day, feature, model), values in totals.items():
+                    key = (_daily.c.user_id == user_id, _daily.c.day == day, _daily.c.feature == feature, _daily.c.model == model)
+                    result = conn.execute(
+                        update(_daily).where(*key).values({_daily.c[name]: _daily.c[name] + value for name, value in values.items()})
+                    )
+                    if result.rowcount == 0:
+                        conn.execute(insert(_daily).values(user_id=user_id, day=day, feature=feature, model=model, **values))
+            return
+        except IntegrityError:
+            # Another worker created one of the day rows first; the update will find it now
+            if attempt:
+                raise
+
+
+class UsageRecorder:
+    """Buffers usage records and writes them in batches from a background task"""
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._pending: Deque[dict] = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        model: Optional[str],
+        status: str,
+        prompt_tokens: int = 0,
+        response_tokens: int = 0,
+        cached_tokens: int = 0,
+        latency: Optional[float] = None,
+    ):
+        """Buffer one call (latency in seconds); never blocks or touches the database"""
+        if len(self._pending) >= self.max_pending:
+            metrics.ai_usage_dropped.inc()
+            return
+        user_id, feature = usage_context.get()
+        self._pending.append({
+            "user_id": user_id,
+            "feature": feature,
+            "model": model,
+            "status": status,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_ms": round(latency * 1000) if latency is not None else None,
+            "cache_hit": status == "cached",
+            "fallback": status not in ("ok", "cached", "cancelled"),
+            "created_at": datetime.utcnow(),
+        })
+        if len(self._pending) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    def record_cached(self):
+        """An answer served from stored study aids instead of a model call"""
+        self.record(None, "cached")
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await asyncio.to_thread(write_batch, batch)
+            except Exception as e:
+                # Keep them for the next flush; `record` drops new ones once the buffer is full
+                self._pending.extendleft(reversed(batch))
+                logger.warning("Failed to write AI usage records: %s", e, extra={"records": len(batch)})
+                return
+
+    def pending_tokens(self, user_id: str, day: date) -> int:
+        """Tokens buffered for the user on `day` and not written yet"""
+        return sum(
+            record["prompt_tokens"] + record["response_tokens"]
+            for record in list(self._pending)
+            if record["user_id"] == user_id and record["created_at"].date() == day
+        )
+
+    def tokens_used_today(self, user_id: str) -> int:
+        """Prompt and response tokens charged to the user since midnight UTC (this worker's buffer included)"""
+        today = datetime.utcnow().date()
+        with engine.connect() as conn:
+            stored = conn.execute(
+                select(func.coalesce(func.sum(_daily.c.prompt_tokens + _daily.c.response_tokens), 0))
+                .where(_daily.c.user_id == user_id, _daily.c.day == today)
+            ).scalar()
+        return int(stored) + self.pending_tokens(user_id, today)
+
+    def quota_remaining(self, user_id: str) -> Optional[int]:
+        """Tokens left in today's quota; None when there is no quota"""
+        if settings.ai_daily_token_quota <= 0:
+            return None
+        return max(0, settings.ai_daily_token_quota - self.tokens_used_today(user_id))
+
+
+def daily_usage(user_id: str, days: int) -> List[dict]:
+    """The user's per-day totals by feature and model for the last `days` days, newest first"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(_daily)
+            .where(_daily.c.user_id == user_id, _daily.c.day >= since)
+            .order_by(_daily.c.day.desc(), _daily.c.feature, _daily.c.model)
+        ).mappings().all()
+    return [{
+        "day": row["day"],
+        "feature": row["feature"],
+        "model": row["model"] or None,
+        "requests": row["requests"],
+        "prompt_tokens": row["prompt_tokens"],
+        "response_tokens": row["response_tokens"],
+        "cached_tokens": row["cached_tokens"],
+        "cache_hits": row["cache_hits"],
+        "fallbacks": row["fallbacks"],
+        "avg_latency_ms": round(row["latency_ms"] / row["requests"], 1) if row["requests"] else None,
+        "estimated_cost": estimate_cost(row["model"], row["prompt_tokens"], row["response_tokens"]),
+    } for row in rows]
+
+
+def top_users(days: int, limit: int) -> List[dict]:
+    """Users with the most tokens over the last `days` days, with their estimated cost"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(
+                _daily.c.user_id, _daily.c.model,
+                func.sum(_daily.c.requests).label("requests"),
+                func.sum(_daily.c.prompt_tokens).label("prompt_tokens"),
+                func.sum(_daily.c.response_tokens).label("response_tokens"),
+                func.sum(_daily.c.fallbacks).label("fallbacks"),
+            )
+            .where(_daily.c.day >= since)
+            .group_by(_daily.c.user_id, _daily.c.model)
+        ).all()
+    users = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "response_tokens": 0, "fallbacks": 0, "estimated_cost": 0.0})
+    for row in rows:
+        user = users[row.user_id]
+        for name in ("requests", "prompt_tokens", "response_tokens", "fallbacks"):
+            user[name] += int(getattr(row, name) or 0)
+        user["estimated_cost"] += estimate_cost(row.model, int(row.prompt_tokens or 0), int(row.response_tokens or 0)) or 0.0
+    ranked = sorted(users.items(), key=lambda item: item[1]["prompt_tokens"] + item[1]["response_tokens"], reverse=True)
+    return [
+        {"user_id": user_id or None, **totals, "estimated_cost": round(totals["estimated_cost"], 6)}
+        for user_id, totals in ranked[:limit]
+    ]
+
+
+def prune_usage_records(stop: threading.Event) -> int:
+    """Delete raw usage records older than the retention period; daily totals are kept"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.ai_usage_retention_days)
+    pruned = 0
+    while not stop.is_set():
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(_records.c.id).where(_records.c.created_at < cutoff)
+                .order_by(_records.c.id).limit(settings.maintenance_batch_size)
+            ).scalars().all()
+            if ids:
+                conn.execute(delete(_records).where(_records.c.id.in_(ids)))
+        pruned += len(ids)
+        if len(ids) < settings.maintenance_batch_size:
+            break
+    return pruned
+
+
+# Create a singleton instance
+usage_recorder = UsageRecorder(settings.ai_usage_batch_size, settings.ai_usage_flush_seconds, settings.ai_usage_max_pending)
@@ -0,0 +1,130 @@
+"""Fire parallel study session starts and check that only one stays active.
+
+    python -m benchmarks.active_session --rounds 20 --concurrency 16 --output active.json
+
+Each round, `--concurrency` threads start a session for the same user at
+once, each with its own database session (as separate requests would). All
+of them must get back the same session, and the user must end up with
+exactly one active session. The query plan of the active-session lookup is
+recorded too. Exits non-zero if any round breaks the invariant.
+"""
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import configure_environment, latency_summary, run_metadata, write_results
+
+USER_ID = "default-user"
+
+
+def _setup():
+    from app import models
+    from app.database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if db.get(models.User, USER_ID) is None:
+            db.add(models.User(id=USER_ID, email="demo@alden.app", name="Demo User"))
+            db.commit()
+    finally:
+        db.close()
+
+
+def _start(barrier: threading.Barrier):
+    from app import crud, schemas
+    from app.database import SessionLocal
+
+    create = schemas.StudySessionCreate(subject="Math", goal="Practice", technique="pomodoro", duration=25)
+    db = SessionLocal()
+    try:
+        barrier.wait()
+        start = time.perf_counter()
+        session = crud.create_study_session(db, create, USER_ID)
+        return session.id, (time.perf_counter() - start) * 1000
+    finally:
+        db.close()
+
+
+def run_round(concurrency: int) -> dict:
+    from app import models
+    from app.database import SessionLocal
+
+    barrier = threading.Barrier(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _start(barrier), range(concurrency)))
+
+    db = SessionLocal()
+    try:
+        active = db.query(models.StudySession).filter(
+            models.StudySession.user_id == USER_ID,
+            models.StudySession.completed == False
+        ).all()
+        # Close it so the next round starts from scratch
+        for session in active:
+            session.completed = True
+        db.commit()
+    finally:
+        db.close()
+    return {
+        "distinct_sessions_returned": len({session_id for session_id, _ in results}),
+        "active_sessions": len(active),
+        "latencies_ms": [latency for _, latency in results],
+    }
+
+
+def active_lookup_plan() -> list:
+    """EXPLAIN output for the query behind /study-sessions/active"""
+    from sqlalchemy import text
+
+    from app import models
+    from app.database import SessionLocal, engine
+
+    db = SessionLocal()
+    try:
+        # Same filter as crud.get_active_study_session
+        statement = db.query(models.StudySession).filter(
+            models.StudySession.user_id == USER_ID,
+            models.StudySession.completed == False
+        ).limit(1).statement
+        compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        return [" ".join(str(value) for value in row) for row in db.execute(text(prefix + str(compiled)))]
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the single active study session under parallel starts")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite database")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(args.database_url or f"sqlite:///{tmp}/active_session.db")
+        _setup()
+        rounds = [run_round(args.concurrency) for _ in range(args.rounds)]
+        plan = active_lookup_plan()
+
+    violations = sum(
+        1 for result in rounds if result["distinct_sessions_returned"] != 1 or result["active_sessions"] != 1
+    )
+    write_results({
+        "meta": run_metadata(args),
+        "rounds": args.rounds,
+        "violations": violations,
+        "start_latency_ms": latency_summary([latency for result in rounds for latency in result["latencies_ms"]]),
+        "active_lookup_plan": plan,
+    }, args.output)
+    if violations:
+        print(f"{violations} of {args.rounds} rounds ended with more than one active session", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
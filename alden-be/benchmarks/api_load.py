@@ -0,0 +1,283 @@
+"""Drive every API router in-process at controlled concurrency.
+
+    python -m benchmarks.seed --database-url sqlite:///./benchmark.db
+    python -m benchmarks.api_load --database-url sqlite:///./benchmark.db \
+        --requests 200 --concurrency 8 --output results.json
+
+Requests go through the full ASGI stack (middleware, routing, validation,
+database) via httpx's ASGI transport, with the Gemini client replaced by a
+fake one of configurable latency. For every endpoint the results report
+throughput, latency percentiles and SQL statements per request. Latency is
+measured up to the last body byte, so background tasks (e.g. the AI reply
+after /api/ai/chat) are excluded just like for a real client.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .common import DEFAULT_DATABASE_URL, configure_environment, latency_summary, run_metadata, write_results
+
+ADMIN_TOKEN = "benchmark-admin-token"
+
+# Key of the request in flight; httpx's ASGI transport runs the app in the
+# caller's task, so the timer below sees the value set by that caller
+_request_key: ContextVar[str] = ContextVar("benchmark_request_key", default="")
+
+
+class _ResponseTimer:
+    """ASGI wrapper noting when each request's final body chunk was sent"""
+
+    def __init__(self, app):
+        self.app = app
+        self.finished: Dict[str, float] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        key = _request_key.get()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self.finished[key] = time.perf_counter()
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class Scenario:
+    """One endpoint (or a short dependent sequence) to exercise"""
+
+    def __init__(self, name: str, call: Callable[..., Awaitable], concurrency: Optional[int] = None):
+        self.name = name
+        self.call = call
+        self.concurrency = concurrency
+
+
+def _scenarios(ctx: dict) -> List[Scenario]:
+    """Scenarios covering every router in app/routers/"""
+
+    def get(path, **kwargs):
+        return lambda client, i: client.get(path.format(**ctx), **kwargs)
+
+    async def chat(client, i):
+        return await client.post("/api/ai/chat", json={"message": f"Explain derivatives, question {i}"})
+
+    async def chat_in_conversation(client, i):
+        return await client.post("/api/ai/chat", json={
+            "message": f"Follow-up question {i}", "conversation_id": ctx["conversation_id"]
+        })
+
+    async def flashcards(client, i):
+        return await client.post("/api/ai/flashcards", params={"content": "Photosynthesis converts light to energy.", "subject": "Biology"})
+
+    async def create_delete_conversation(client, i):
+        response = await client.post("/api/ai/conversations", json={"title": f"Benchmark {i}"})
+        if response.status_code != 200:
+            return response
+        return await client.delete(f"/api/ai/conversations/{response.json()['id']}")
+
+    async def start_end_study_session(client, i):
+        response = await client.post("/api/study-sessions/", json={
+            "subject": "Mathematics", "goal": "Benchmark", "technique": "pomodoro", "duration": 25
+        })
+        if response.status_code != 200:
+            return response
+        return await client.put(f"/api/study-sessions/{response.json()['id']}/end", json={"focus_score": 7})
+
+    async def create_complete_mindful(client, i):
+        response = await client.post("/api/mindful-sessions/", json={
+            "title": "Focus Boost", "category": "pre_study", "duration": 240,
+            "audio_url": "/audio/focus-boost.mp3", "description": "Benchmark"
+        })
+        if response.status_code != 200:
+            return response
+        return await client.put(f"/api/mindful-sessions/{response.json()['id']}/complete", json={"rating": 4})
+
+    async def upload_delete_document(client, i):
+        files = {"file": (f"notes-{i}.txt", b"Benchmark notes. " * 512, "text/plain")}
+        response = await client.post("/api/documents/upload", files=files)
+        if response.status_code != 200:
+            return response
+        return await client.delete(f"/api/documents/{response.json()['id']}")
+
+    async def update_goal(client, i):
+        return await client.put("/api/progress/daily-goal", params={"goal_minutes": 120})
+
+    async def update_streak(client, i):
+        return await client.post("/api/progress/streak/update")
+
+    return [
+        # study_sessions
+        Scenario("GET /api/study-sessions/", get("/api/study-sessions/")),
+        Scenario("GET /api/study-sessions/active", get("/api/study-sessions/active")),
+        # Only one session can be active, so starts are serialized
+        Scenario("POST+PUT /api/study-sessions/ (start, end)", start_end_study_session, concurrency=1),
+        # mindful_sessions
+        Scenario("GET /api/mindful-sessions/", get("/api/mindful-sessions/")),
+        Scenario("GET /api/mindful-sessions/prebuilt", get("/api/mindful-sessions/prebuilt")),
+        Scenario("POST+PUT /api/mindful-sessions/ (create, complete)", create_complete_mindful),
+        # ai_chat
+        Scenario("POST /api/ai/chat (new conversation)", chat),
+        Scenario("POST /api/ai/chat (existing conversation)", chat_in_conversation),
+        Scenario("GET /api/ai/conversations", get("/api/ai/conversations")),
+        Scenario("GET /api/ai/conversations/{id}", get("/api/ai/conversations/{conversation_id}")),
+        Scenario("GET /api/ai/conversations/{id}/messages", get("/api/ai/conversations/{conversation_id}/messages")),
+        Scenario("POST+DELETE /api/ai/conversations (create, delete)", create_delete_conversation),
+        Scenario("POST /api/ai/flashcards", flashcards),
+        # documents
+        Scenario("GET /api/documents/", get("/api/documents/")),
+        Scenario("GET /api/documents/{id}/content", get("/api/documents/{document_id}/content")),
+        Scenario("POST+DELETE /api/documents/ (upload, delete)", upload_delete_document),
+        # progress
+        Scenario("GET /api/progress/", get("/api/progress/")),
+        Scenario("GET /api/progress/user", get("/api/progress/user")),
+        Scenario("PUT /api/progress/daily-goal", update_goal),
+        Scenario("POST /api/progress/streak/update", update_streak),
+        # admin
+        Scenario("GET /api/admin/profiles", get("/api/admin/profiles", headers={"X-Admin-Token": ADMIN_TOKEN})),
+    ]
+
+
+async def _prepare_context(client) -> dict:
+    """Look up or create the ids the scenarios refer to"""
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        conversation_id = db.query(models.AidaConversation.id).filter(
+            models.AidaConversation.user_id == "default-user"
+        ).limit(1).scalar()
+        # End a session left active by an interrupted run
+        db.query(models.StudySession).filter(
+            models.StudySession.user_id == "default-user",
+            models.StudySession.completed == False
+        ).update({"completed": True})
+        db.commit()
+    finally:
+        db.close()
+
+    if conversation_id is None:
+        response = await client.post("/api/ai/conversations", json={"title": "Benchmark conversation"})
+        response.raise_for_status()
+        conversation_id = response.json()["id"]
+
+    files = {"file": ("benchmark-content.txt", b"Benchmark document content. " * 256, "text/plain")}
+    response = await client.post("/api/documents/upload", files=files)
+    response.raise_for_status()
+    return {"conversation_id": conversation_id, "document_id": response.json()["id"]}
+
+
+async def _run_scenario(client, timer: _ResponseTimer, scenario: Scenario, requests: int, concurrency: int, warmup: int, query_counter: List[int]) -> dict:
+    sequence = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+    statuses: Dict[int, int] = {}
+
+    async def one(i: int, record: bool):
+        nonlocal errors
+        key = f"{scenario.name}:{next(sequence)}"
+        _request_key.set(key)
+        start = time.perf_counter()
+        response = await scenario.call(client, i)
+        finished = timer.finished.pop(key, None) or time.perf_counter()
+        if record:
+            latencies.append((finished - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 400:
+                errors += 1
+
+    for i in range(warmup):
+        await one(i, record=False)
+
+    # Workers pull request numbers from a shared counter
+    next_index = iter(range(requests))
+
+    async def worker():
+        for i in next_index:
+            await one(i, record=True)
+
+    queries_before = query_counter[0]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    queries = query_counter[0] - queries_before
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "db_queries_per_request": round(queries / requests, 2) if requests else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    import httpx
+    from sqlalchemy import event
+
+    from app.database import engine, init_db
+    from app.routers import documents
+    from main import app
+
+    from .fake_genai import install_fake_client
+
+    # The ASGI transport does not run the lifespan, so migrate explicitly
+    init_db()
+    fake_client = install_fake_client(args.ai_latency_ms, args.ai_jitter_ms)
+    documents.UPLOAD_DIRECTORY = tempfile.mkdtemp(prefix="alden-benchmark-uploads-")
+
+    query_counter = [0]
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _count(*_):
+        query_counter[0] += 1
+
+    timer = _ResponseTimer(app)
+    transport = httpx.ASGITransport(app=timer, raise_app_exceptions=False)
+    results = {"meta": run_metadata(args), "endpoints": {}}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        ctx = await _prepare_context(client)
+        for scenario in _scenarios(ctx):
+            if args.only and args.only.lower() not in scenario.name.lower():
+                continue
+            concurrency = scenario.concurrency or args.concurrency
+            print(f"{scenario.name} ...", file=sys.stderr)
+            results["endpoints"][scenario.name] = await _run_scenario(
+                client, timer, scenario, args.requests, concurrency, args.warmup, query_counter
+            )
+
+    results["meta"]["fake_ai_calls"] = fake_client.models.calls
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test every API router in-process")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--ai-latency-ms", type=float, default=800.0)
+    parser.add_argument("--ai-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--only", help="run only endpoints whose name contains this text")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+    write_results(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cancel a half-open circuit breaker's probe call and check the model recovers.
+
+    python -m benchmarks.breaker_probe --output breaker.json
+
+Opens the default model's circuit, waits out `open_seconds`, then starts
+the single probe call against a slow fake provider and cancels it (as
+shutdown drains or a disconnect would). The breaker must let the next call
+through, and the cancelled call's tokens must be recorded once its thread
+returns. Exits non-zero if either fails.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from .common import configure_environment, run_metadata, write_results
+
+
+class _SlowModels:
+    """Answers after `latency` seconds, with usage metadata like the SDK's"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def generate_content(self, model: str, contents: str):
+        time.sleep(self.latency)
+        usage = SimpleNamespace(prompt_token_count=10, candidates_token_count=20, cached_content_token_count=0)
+        return SimpleNamespace(text="probe answer", usage_metadata=usage)
+
+
+async def _cancel_probe(latency: float) -> dict:
+    from app.config import settings
+    from app.services.ai_service import ai_service
+    from app.services.usage import attribute, usage_recorder
+
+    ai_service.client = SimpleNamespace(models=_SlowModels(latency))
+    breaker = ai_service._breaker(settings.ai_model)
+    breaker.open_seconds = 0.0
+    breaker._open(breaker._clock())
+
+    with attribute("breaker-probe", "chat"):
+        probe = asyncio.create_task(ai_service._complete("probe"))
+        await asyncio.sleep(latency / 4)
+        state_during_probe = breaker.state
+        probe.cancel()
+        try:
+            await probe
+        except asyncio.CancelledError:
+            pass
+    # The provider call runs on until it returns; its usage is recorded then
+    await asyncio.sleep(latency * 2)
+    return {
+        "state_during_probe": state_during_probe,
+        "allowed_after_cancel": breaker.allow(),
+        "cancelled_usage_records": [
+            {"model": record["model"], "prompt_tokens": record["prompt_tokens"], "response_tokens": record["response_tokens"]}
+            for record in usage_recorder._pending
+            if record["user_id"] == "breaker-probe" and record["status"] == "cancelled"
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that cancelling a half-open probe call frees the circuit breaker")
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds the fake provider takes to answer")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(f"sqlite:///{tmp}/breaker_probe.db")
+        result = asyncio.run(_cancel_probe(args.latency))
+
+    write_results({"meta": run_metadata(args), **result}, args.output)
+    if result["state_during_probe"] != "half_open" or not result["allowed_after_cancel"]:
+        print("The breaker refused calls after its half-open probe was cancelled", file=sys.stderr)
+        sys.exit(1)
+    if not result["cancelled_usage_records"]:
+        print("The cancelled probe call's usage was not recorded", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional
+
+DEFAULT_DATABASE_URL = "sqlite:///./benchmark.db"
+
+
+def configure_environment(database_url: str, log_level: str = "WARNING"):
+    """Point the app at the benchmark database and lift limits that would skew results.
+
+    Must run before anything under `app` is imported, since settings and the
+    engine are created at import time.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ["AI_MAX_REQUESTS_PER_SECOND"] = "1000000"
+    os.environ["AI_MAX_TOKENS_PER_MINUTE"] = "1000000000"
+    os.environ["LOG_LEVEL"] = log_level
+    os.environ["SCHEDULER_ENABLED"] = "false"
+    # Any value works: the real client is replaced by the fake one
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark-fake-key")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(latencies_ms: List[float]) -> dict:
+    values = sorted(latencies_ms)
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+        "max": round(values[-1], 3) if values else 0.0,
+    }
+
+
+def run_metadata(args) -> dict:
+    """Describe the environment a result was produced in, so runs can be compared"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        revision = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": revision,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "arguments": {key: value for key, value in vars(args).items() if key != "output"},
+    }
+
+
+def write_results(results: dict, output: Optional[str]):
+    """Write results as JSON to `output`, or stdout when not given"""
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {output}", file=sys.stderr)
+    else:
+        print(text)
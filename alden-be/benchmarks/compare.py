@@ -0,0 +1,69 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.15
+
+Exits with status 1 when any endpoint's p95 latency or DB queries per
+request grew, or its throughput dropped, by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def _change(old: float, new: float) -> float:
+    if old == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - old) / old
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    """Return one row per endpoint present in both runs"""
+    rows = []
+    for name, old in baseline.get("endpoints", {}).items():
+        new = candidate.get("endpoints", {}).get(name)
+        if new is None:
+            continue
+        p95_change = _change(old["latency_ms"]["p95"], new["latency_ms"]["p95"])
+        rps_change = _change(old["throughput_rps"], new["throughput_rps"])
+        queries_change = _change(old.get("db_queries_per_request", 0), new.get("db_queries_per_request", 0))
+        regressed = p95_change > threshold or rps_change < -threshold or queries_change > threshold
+        rows.append({
+            "endpoint": name,
+            "p95_ms": (old["latency_ms"]["p95"], new["latency_ms"]["p95"]),
+            "p95_change": p95_change,
+            "throughput_change": rps_change,
+            "queries": (old.get("db_queries_per_request"), new.get("db_queries_per_request")),
+            "regressed": regressed,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative change (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows = compare(baseline, candidate, args.threshold)
+    width = max((len(row["endpoint"]) for row in rows), default=10)
+    print(f"{'endpoint':<{width}}  {'p95 ms (old -> new)':>24}  {'p95':>8}  {'rps':>8}  {'queries':>12}")
+    for row in rows:
+        old_p95, new_p95 = row["p95_ms"]
+        old_q, new_q = row["queries"]
+        marker = "  REGRESSION" if row["regressed"] else ""
+        print(
+            f"{row['endpoint']:<{width}}  {old_p95:>10.2f} -> {new_p95:>10.2f}  "
+            f"{row['p95_change']:>+8.1%}  {row['throughput_change']:>+8.1%}  {old_q!s:>5} -> {new_q!s:<5}{marker}"
+        )
+
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
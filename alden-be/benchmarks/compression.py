@@ -0,0 +1,175 @@
+"""Bytes on the wire and serialization CPU for a 1,000-message conversation.
+
+    python -m benchmarks.compression --messages 1000 --iterations 50 --output compression.json
+
+Serialization compares the stdlib JSON renderer with orjson (when installed)
+on the same validated payload. Wire size is measured end to end: the
+conversation is stored in a scratch SQLite database and fetched through the
+app with each Accept-Encoding.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from .common import configure_environment, run_metadata, write_results
+
+USER_ID = "default-user"
+VOCABULARY = (
+    "the a of to and in is that for it as with on be this by are derivative integral function limit "
+    "slope tangent curve rate change example practice problem exam concept theorem proof value "
+    "photosynthesis energy cell membrane reaction equation balance molecule atom electron force "
+    "velocity acceleration mass momentum history revolution economy market supply demand price "
+    "because therefore however first second finally remember notice try explain step answer"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def _message_text(rng: random.Random, assistant: bool) -> str:
+    sentences = rng.randint(6, 14) if assistant else rng.randint(1, 3)
+    return " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(sentences))
+
+
+def _store_conversation(messages: int, seed: int) -> str:
+    from app import models
+    from app.database import engine, init_db
+
+    init_db()
+    rng = random.Random(seed)
+    conversation_id = str(uuid.uuid4())
+    start = datetime.utcnow() - timedelta(days=1)
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{
+            "id": USER_ID, "email": "demo@alden.app", "name": "Demo User", "daily_goal": 120,
+            "current_streak": 0, "total_study_time": 0, "total_mindful_time": 0,
+        }])
+        conn.execute(models.AidaConversation.__table__.insert(), [{
+            "id": conversation_id, "user_id": USER_ID, "title": "Calculus review",
+            "subject": "Mathematics", "last_message": start + timedelta(seconds=messages),
+        }])
+        conn.execute(models.AidaMessage.__table__.insert(), [{
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "type": "assistant" if i % 2 else "user",
+            "content": _message_text(rng, assistant=bool(i % 2)),
+            "timestamp": start + timedelta(seconds=i),
+        } for i in range(messages)])
+    return conversation_id
+
+
+def _cpu_ms(func, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        start = time.process_time()
+        func()
+        samples.append((time.process_time() - start) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3)}
+
+
+def measure_serialization(conversation_id: str, iterations: int):
+    """CPU per stage of the response path FastAPI takes for this endpoint.
+
+    Returns the results and the uncompressed response body.
+    """
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+
+    from app import crud, schemas
+    from app.compression import FastJSONResponse, orjson
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        conversation = crud.get_conversation(db, conversation_id, USER_ID)
+        crud.attach_messages(conversation, crud.get_messages(db, conversation_id, USER_ID))
+        adapter = TypeAdapter(schemas.AidaConversation)
+        payload = adapter.dump_python(adapter.validate_python(conversation), mode="json")
+
+        results = {
+            "validate_and_encode": _cpu_ms(lambda: adapter.dump_python(adapter.validate_python(conversation), mode="json"), iterations),
+            "render_stdlib_json": _cpu_ms(lambda: JSONResponse(payload).body, iterations),
+        }
+        if orjson is not None:
+            results["render_orjson"] = _cpu_ms(lambda: FastJSONResponse(payload).body, iterations)
+        else:
+            results["render_orjson"] = None
+        return results, JSONResponse(payload).body
+    finally:
+        db.close()
+
+
+def measure_compression(body: bytes, iterations: int) -> dict:
+    """Size and CPU of each encoding at the configured levels"""
+    from app.compression import brotli, compress_body
+
+    results = {"identity": {"bytes": len(body)}}
+    for encoding in ("gzip", "br"):
+        if encoding == "br" and brotli is None:
+            results[encoding] = None
+            continue
+        compressed = compress_body(body, encoding)
+        results[encoding] = {
+            "bytes": len(compressed),
+            "ratio": round(len(body) / len(compressed), 2),
+            "cpu": _cpu_ms(lambda: compress_body(body, encoding), iterations),
+        }
+    return results
+
+
+async def measure_wire(conversation_id: str, iterations: int) -> dict:
+    """Response size and latency through the full ASGI stack per Accept-Encoding"""
+    import httpx
+
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for accept in ("identity", "gzip", "br"):
+            latencies, size, encoding = [], 0, None
+            for _ in range(iterations):
+                start = time.perf_counter()
+                # Read the raw stream so httpx does not decode the body
+                async with client.stream("GET", f"/api/ai/conversations/{conversation_id}", headers={"Accept-Encoding": accept}) as response:
+                    raw = b"".join([chunk async for chunk in response.aiter_raw()])
+                latencies.append((time.perf_counter() - start) * 1000)
+                size, encoding = len(raw), response.headers.get("content-encoding", "identity")
+            results[accept] = {
+                "content_encoding": encoding,
+                "bytes": size,
+                "median_latency_ms": round(statistics.median(latencies), 3),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare response encodings and JSON renderers")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(f"sqlite:///{tmp}/compression.db")
+        conversation_id = _store_conversation(args.messages, args.seed)
+
+        serialization, body = measure_serialization(conversation_id, args.iterations)
+        results = {
+            "meta": run_metadata(args),
+            "serialization": serialization,
+            "compression": measure_compression(body, args.iterations),
+            "wire": asyncio.run(measure_wire(conversation_id, args.iterations)),
+        }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
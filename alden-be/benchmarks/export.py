@@ -0,0 +1,141 @@
+"""Memory and throughput of the streaming history export for one heavy user.
+
+    python -m benchmarks.export --rows 1000000 --output export.json
+
+All rows belong to the demo user (mostly messages, then study sessions,
+mindful sessions, conversations and documents). The NDJSON export is
+consumed in process under tracemalloc; the traced peak is recorded after
+10%, 50% and 100% of the rows, so flat memory shows as three similar
+numbers. For comparison, loading `--baseline-rows` messages as ORM objects
+(what the crud list functions do) is measured the same way.
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from .common import configure_environment, run_metadata, write_results
+
+USER_ID = "default-user"
+
+
+def _split(rows: int) -> dict:
+    return {
+        "messages": int(rows * 0.75),
+        "study_sessions": int(rows * 0.2),
+        "mindful_sessions": int(rows * 0.04),
+        "conversations": max(1, int(rows * 0.009)),
+        "documents": int(rows * 0.001),
+    }
+
+
+def seed_history(rows: int) -> dict:
+    from .seed import seed
+
+    split = _split(rows)
+    counts = seed(
+        users=1,
+        study_sessions=split["study_sessions"],
+        mindful_sessions=split["mindful_sessions"],
+        conversations=split["conversations"],
+        messages=split["messages"],
+        documents=split["documents"],
+        user_sessions=split["study_sessions"],
+        user_conversations=split["conversations"],
+        user_messages_per_conversation=max(1, split["messages"] // split["conversations"] + 1),
+    )
+    counts["total_rows"] = sum(split.values())
+    return counts
+
+
+def _mb(value: int) -> float:
+    return round(value / (1024 * 1024), 2)
+
+
+def measure_streaming_memory(total_rows: int) -> dict:
+    from app import export
+
+    checkpoints = {0.1: None, 0.5: None}
+    exported = size = 0
+    tracemalloc.start()
+    try:
+        for chunk in export.stream_ndjson(USER_ID):
+            exported += chunk.count(b"\n")
+            size += len(chunk)
+            for fraction, peak in checkpoints.items():
+                if peak is None and exported >= fraction * total_rows:
+                    checkpoints[fraction] = tracemalloc.get_traced_memory()[1]
+        final_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "rows": exported,
+        "bytes": size,
+        "peak_mb_at_10pct": _mb(checkpoints[0.1] or 0),
+        "peak_mb_at_50pct": _mb(checkpoints[0.5] or 0),
+        "peak_mb_at_100pct": _mb(final_peak),
+    }
+
+
+def measure_throughput() -> dict:
+    """Untraced wall time for each format"""
+    from app import export
+
+    results = {}
+    for name, stream in (
+        ("ndjson", lambda: export.stream_ndjson(USER_ID)),
+        ("csv_messages", lambda: export.stream_csv(USER_ID, "messages")),
+    ):
+        start = time.perf_counter()
+        rows = size = 0
+        for chunk in stream():
+            rows += chunk.count(b"\n")
+            size += len(chunk)
+        elapsed = time.perf_counter() - start
+        results[name] = {"seconds": round(elapsed, 2), "bytes": size, "rows_per_second": round(rows / elapsed)}
+    return results
+
+
+def measure_orm_baseline(rows: int) -> dict:
+    """Peak memory of materializing `rows` messages as ORM objects"""
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    tracemalloc.start()
+    try:
+        loaded = db.query(models.AidaMessage).limit(rows).all()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        db.close()
+    return {
+        "rows": len(loaded),
+        "peak_mb": _mb(peak),
+        "bytes_per_row": round(peak / max(1, len(loaded))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory and speed of the streaming export")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--baseline-rows", type=int, default=100000, help="0 skips the ORM baseline")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(f"sqlite:///{tmp}/export.db")
+        counts = seed_history(args.rows)
+        results = {
+            "meta": run_metadata(args),
+            "seed": counts,
+            "streaming_ndjson": measure_streaming_memory(counts["total_rows"]),
+            "throughput": measure_throughput(),
+        }
+        if args.baseline_rows:
+            results["orm_baseline"] = measure_orm_baseline(args.baseline_rows)
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
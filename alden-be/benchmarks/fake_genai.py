@@ -0,0 +1,10 @@
+from app.services.fake_ai import FakeGeminiClient, FakeModels  # noqa: F401 - re-exported for benchmarks
+
+
+def install_fake_client(latency_ms: float, jitter_ms: float = 0.0, error_rate: float = 0.0) -> FakeGeminiClient:
+    """Replace the AI service's client with a fake one and return it"""
+    from app.services.ai_service import ai_service
+
+    client = FakeGeminiClient(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate)
+    ai_service.client = client
+    return client
@@ -0,0 +1,93 @@
+"""Run a new user's first requests against an empty database and check they succeed.
+
+    python -m benchmarks.first_run --output first_run.json
+
+Starts from a fresh SQLite database (or `--database-url`, which must be
+empty), migrates it, then starts a study session, sends a chat message and
+uploads a document, each through the API with a fake Gemini client. These
+are the first writes for "default-user", so they also check that the demo
+user is created with the id the rows point at (foreign keys are enforced).
+Exits non-zero if any request fails.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+
+from .common import configure_environment, run_metadata, write_results
+
+USER_ID = "default-user"
+
+
+async def _first_requests() -> dict:
+    import httpx
+
+    from app.database import init_db
+    from app.routers import documents
+    from main import app
+
+    from .fake_genai import install_fake_client
+
+    # The ASGI transport does not run the lifespan, so migrate explicitly
+    init_db()
+    install_fake_client(latency_ms=0)
+    documents.UPLOAD_DIRECTORY = tempfile.mkdtemp(prefix="alden-first-run-uploads-")
+
+    steps = {
+        "start_study_session": lambda client: client.post("/api/study-sessions/", json={
+            "subject": "Math", "goal": "Practice", "technique": "pomodoro", "duration": 25,
+        }),
+        "chat": lambda client: client.post("/api/ai/chat", json={"message": "Help me plan my revision"}),
+        "upload": lambda client: client.post("/api/documents/upload", files={
+            "file": ("notes.txt", b"First run notes. " * 64, "text/plain"),
+        }),
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://first-run", timeout=None) as client:
+        for name, call in steps.items():
+            start = time.perf_counter()
+            response = await call(client)
+            results[name] = {
+                "status_code": response.status_code,
+                "ms": round((time.perf_counter() - start) * 1000, 3),
+                "error": None if response.is_success else response.text[:500],
+            }
+    return results
+
+
+def _user_ids() -> list:
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return [user_id for user_id, in db.query(models.User.id)]
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a new user's first session start, chat and upload on an empty database")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite database; must be empty")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(args.database_url or f"sqlite:///{tmp}/first_run.db")
+        steps = asyncio.run(_first_requests())
+        user_ids = _user_ids()
+
+    failures = [name for name, result in steps.items() if result["error"] is not None]
+    write_results({"meta": run_metadata(args), "steps": steps, "user_ids": user_ids}, args.output)
+    if failures:
+        print(f"Failed on an empty database: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+    if user_ids != [USER_ID]:
+        print(f"Expected only the {USER_ID} user, found {user_ids}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""CPU per row of the list endpoints: ORM + response model versus lean Core rows.
+
+    python -m benchmarks.list_serialization --rows 5000 --iterations 20 --output lists.json
+
+For study sessions, mindful sessions and documents, the same rows are read
+and encoded two ways:
+
+- `orm`: ORM objects from `crud.get_*`, validated through the response
+  model (`from_attributes`) and rendered by FastJSONResponse. This is what
+  FastAPI did for these routes before.
+- `lean`: the response columns as Core rows from `crud.list_*`, encoded by
+  `compression.rows_response`. This is what the routes do now.
+
+Each iteration uses a fresh database session, so loading into the identity
+map is counted. Both bodies are decoded and compared, so a speedup can't come
+from returning different data.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from .common import configure_environment, run_metadata, write_results
+
+USER_ID = "default-user"
+
+
+def _seed(rows: int, seed: int):
+    from app import models
+    from app.database import engine, init_db
+
+    init_db()
+    rng = random.Random(seed)
+    start = datetime.utcnow() - timedelta(days=365)
+    documents = [{
+        "id": str(uuid.uuid4()), "user_id": USER_ID, "name": f"notes-{i}.pdf", "type": "pdf",
+        "uri": f"uploads/{uuid.uuid4()}.pdf", "size": rng.randint(10_000, 5_000_000),
+        "upload_date": start + timedelta(minutes=i),
+    } for i in range(rows)]
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{
+            "id": USER_ID, "email": "demo@alden.app", "name": "Demo User", "daily_goal": 120,
+            "current_streak": 0, "total_study_time": 0, "total_mindful_time": 0,
+        }])
+        conn.execute(models.StudySession.__table__.insert(), [{
+            "id": str(uuid.uuid4()), "user_id": USER_ID, "subject": rng.choice(["Mathematics", "Physics", "History"]),
+            "goal": "Finish the problem set", "technique": rng.choice(["pomodoro", "deep_work", "active_recall"]),
+            "duration": rng.randint(15, 90), "start_time": start + timedelta(hours=i),
+            "end_time": start + timedelta(hours=i, minutes=45), "completed": True,
+            "focus_score": rng.randint(1, 10), "notes": "Went well" if i % 3 else None,
+            "created_at": start + timedelta(hours=i),
+        } for i in range(rows)])
+        conn.execute(models.MindfulSession.__table__.insert(), [{
+            "id": str(uuid.uuid4()), "user_id": USER_ID, "title": "Focus Boost", "category": "pre_study",
+            "duration": 240, "audio_url": "/audio/focus-boost.mp3", "description": "A short breathing exercise",
+            "completed": bool(i % 2), "completed_at": start + timedelta(hours=i) if i % 2 else None,
+            "rating": rng.randint(1, 5) if i % 2 else None, "created_at": start + timedelta(hours=i),
+        } for i in range(rows)])
+        conn.execute(models.UploadedDocument.__table__.insert(), documents)
+        # Half the documents have previews
+        conn.execute(models.DocumentPreview.__table__.insert(), [{
+            "document_id": document["id"], "size": size, "digest": uuid.uuid4().hex * 2,
+            "source_digest": uuid.uuid4().hex * 2, "width": 160, "height": 120, "bytes": 4000,
+        } for document in documents[::2] for size in ("small", "medium", "large")])
+
+
+def _cpu_ms(func, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        start = time.process_time()
+        func()
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _paths(rows: int):
+    """name -> (orm path, lean path); each returns the response body"""
+    from typing import List
+
+    from pydantic import TypeAdapter
+
+    from app import crud, schemas
+    from app.compression import FastJSONResponse, rows_response
+    from app.database import SessionLocal
+
+    def orm(load, schema):
+        adapter = TypeAdapter(List[schema])
+
+        def run():
+            db = SessionLocal()
+            try:
+                payload = adapter.dump_python(adapter.validate_python(load(db)), mode="json")
+                return FastJSONResponse(payload).body
+            finally:
+                db.close()
+        return run
+
+    def lean(load):
+        def run():
+            db = SessionLocal()
+            try:
+                return rows_response(load(db)).body
+            finally:
+                db.close()
+        return run
+
+    return {
+        "study_sessions": (
+            orm(lambda db: crud.get_study_sessions(db, USER_ID, 0, rows), schemas.StudySession),
+            lean(lambda db: crud.list_study_sessions(db, USER_ID, 0, rows)),
+        ),
+        "mindful_sessions": (
+            orm(lambda db: crud.get_mindful_sessions(db, USER_ID), schemas.MindfulSession),
+            lean(lambda db: crud.list_mindful_sessions(db, USER_ID)),
+        ),
+        "documents": (
+            orm(lambda db: crud.get_documents(db, USER_ID), schemas.UploadedDocument),
+            lean(lambda db: crud.list_documents(db, USER_ID)),
+        ),
+    }
+
+
+def measure(rows: int, iterations: int) -> dict:
+    results = {}
+    for name, (orm, lean) in _paths(rows).items():
+        orm_body, lean_body = orm(), lean()
+        orm_ms = _cpu_ms(orm, iterations)
+        lean_ms = _cpu_ms(lean, iterations)
+        results[name] = {
+            "rows": len(json.loads(lean_body)),
+            "same_output": json.loads(orm_body) == json.loads(lean_body),
+            "orm_ms": round(orm_ms, 3),
+            "lean_ms": round(lean_ms, 3),
+            "orm_us_per_row": round(orm_ms * 1000 / rows, 3),
+            "lean_us_per_row": round(lean_ms * 1000 / rows, 3),
+            "cpu_reduction": round(1 - lean_ms / orm_ms, 3) if orm_ms else None,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-row CPU of the list endpoints, ORM versus lean reads")
+    parser.add_argument("--rows", type=int, default=5000, help="rows of each kind for the demo user")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(f"sqlite:///{tmp}/list_serialization.db")
+        _seed(args.rows, args.seed)
+        results = measure(args.rows, args.iterations)
+
+    write_results({"meta": run_metadata(args), "lists": results}, args.output)
+    mismatched = [name for name, result in results.items() if not result["same_output"]]
+    if mismatched:
+        print(f"Lean output differs for: {', '.join(mismatched)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Seed a benchmark database with realistic data volumes.
+
+    python -m benchmarks.seed --database-url sqlite:///./benchmark.db \
+        --users 1000 --study-sessions 1000000 --messages 1000000
+
+The demo user the API serves ("default-user") gets a heavy but realistic
+history; the remaining rows are spread over the other users so per-user
+queries have to find their rows among millions.
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from .common import DEFAULT_DATABASE_URL, configure_environment
+
+BENCHMARK_USER_ID = "default-user"
+BATCH_SIZE = 10000
+
+SUBJECTS = ["Mathematics", "Physics", "Chemistry", "Biology", "History", "Literature", "Economics", "Computer Science"]
+TECHNIQUES = ["pomodoro", "deep_work", "active_recall"]
+MINDFUL = [
+    ("Focus Boost", "pre_study", 240, "/audio/focus-boost.mp3"),
+    ("SOS Breathing", "quick_relief", 60, "/audio/sos-breathing.mp3"),
+    ("Study Reflection", "post_study", 420, "/audio/study-reflection.mp3"),
+    ("Pre-Exam Calm", "exam_support", 600, "/audio/pre-exam-calm.mp3"),
+]
+MESSAGE_TEXT = (
+    "Can you explain how this concept works and give me an example I can practice with? "
+    "I want to make sure I understand the underlying idea before the exam."
+)
+
+
+def _insert(conn, table, rows):
+    if rows:
+        conn.execute(table.insert(), rows)
+        rows.clear()
+
+
+def _random_time(rng: random.Random, now: datetime, days: int = 365) -> datetime:
+    return now - timedelta(seconds=rng.randint(0, days * 86400))
+
+
+def seed(
+    users: int,
+    study_sessions: int,
+    mindful_sessions: int,
+    conversations: int,
+    messages: int,
+    documents: int,
+    user_sessions: int,
+    user_conversations: int,
+    user_messages_per_conversation: int,
+    seed_value: int = 1234,
+) -> dict:
+    """Create tables and insert the requested volumes; returns row counts"""
+    from app import models
+    from app.database import engine, init_db
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    init_db()
+
+    user_ids = [BENCHMARK_USER_ID] + [f"bench-user-{i}" for i in range(1, users)]
+    counts = {}
+    start = time.perf_counter()
+
+    with engine.begin() as conn:
+        rows = []
+        for user_id in user_ids:
+            rows.append({
+                "id": user_id,
+                "email": "demo@alden.app" if user_id == BENCHMARK_USER_ID else f"{user_id}@bench.alden.app",
+                "name": "Demo User" if user_id == BENCHMARK_USER_ID else user_id,
+                "created_at": now - timedelta(days=400),
+                "daily_goal": 120,
+                "current_streak": rng.randint(0, 30),
+                "total_study_time": 0,
+                "total_mindful_time": 0,
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(conn, models.User.__table__, rows)
+        _insert(conn, models.User.__table__, rows)
+        counts["users"] = len(user_ids)
+
+        def owner(i: int, heavy_count: int) -> str:
+            # First rows belong to the benchmark user, the rest are spread out
+            if i < heavy_count or len(user_ids) == 1:
+                return BENCHMARK_USER_ID
+            return user_ids[1 + (i % (len(user_ids) - 1))]
+
+        for i in range(study_sessions):
+            start_time = _random_time(rng, now)
+            duration = rng.choice([25, 50, 90])
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "user_id": owner(i, user_sessions),
+                "subject": rng.choice(SUBJECTS),
+                "goal": "Review chapter notes and practice problems",
+                "technique": rng.choice(TECHNIQUES),
+                "duration": duration,
+                "start_time": start_time,
+                "end_time": start_time + timedelta(minutes=duration),
+                "completed": True,
+                "focus_score": rng.randint(1, 10),
+                "notes": None,
+                "created_at": start_time,
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(conn, models.StudySession.__table__, rows)
+        _insert(conn, models.StudySession.__table__, rows)
+        counts["study_sessions"] = study_sessions
+
+        for i in range(mindful_sessions):
+            title, category, duration, audio_url = rng.choice(MINDFUL)
+            created = _random_time(rng, now)
+            completed = rng.random() < 0.8
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "user_id": owner(i, min(mindful_sessions, 200)),
+                "title": title,
+                "category": category,
+                "duration": duration,
+                "audio_url": audio_url,
+                "description": "Benchmark mindful session",
+                "completed": completed,
+                "completed_at": created + timedelta(seconds=duration) if completed else None,
+                "rating": rng.randint(1, 5) if completed else None,
+                "created_at": created,
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(conn, models.MindfulSession.__table__, rows)
+        _insert(conn, models.MindfulSession.__table__, rows)
+        counts["mindful_sessions"] = mindful_sessions
+
+        conversation_ids = []
+        for i in range(conversations):
+            conversation_id = str(uuid.uuid4())
+            conversation_ids.append(conversation_id)
+            created = _random_time(rng, now)
+            rows.append({
+                "id": conversation_id,
+                "user_id": owner(i, user_conversations),
+                "title": f"Chat about {rng.choice(SUBJECTS)}",
+                "subject": None,
+                "last_message": created,
+                "created_at": created,
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(conn, models.AidaConversation.__table__, rows)
+        _insert(conn, models.AidaConversation.__table__, rows)
+        counts["conversations"] = conversations
+
+        # The benchmark user's conversations get a fixed number of messages
+        # each; the remaining messages go to other users' conversations
+        heavy_messages = min(messages, user_conversations * user_messages_per_conversation)
+        other_conversations = conversation_ids[user_conversations:] or conversation_ids
+        for i in range(messages):
+            if i < heavy_messages:
+                conversation_id = conversation_ids[i // user_messages_per_conversation]
+            else:
+                conversation_id = other_conversations[i % len(other_conversations)]
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
+                "type": "user" if i % 2 == 0 else "assistant",
+                "content": MESSAGE_TEXT,
+                "timestamp": now - timedelta(seconds=messages - i),
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(conn, models.AidaMessage.__table__, rows)
+        _insert(conn, models.AidaMessage.__table__, rows)
+        counts["messages"] = messages
+
+        for i in range(documents):
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "user_id": owner(i, min(documents, 50)),
+                "name": f"notes-{i}.txt",
+                "type": "text",
+                "uri": f"uploads/benchmark-{i}.txt",
+                "size": rng.randint(1000, 5000000),
+                "upload_date": _random_time(rng, now),
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(conn, models.UploadedDocument.__table__, rows)
+        _insert(conn, models.UploadedDocument.__table__, rows)
+        counts["documents"] = documents
+
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    return counts
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--study-sessions", type=int, default=1000000)
+    parser.add_argument("--mindful-sessions", type=int, default=100000)
+    parser.add_argument("--conversations", type=int, default=50000)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--user-sessions", type=int, default=2000, help="study sessions owned by the benchmark user")
+    parser.add_argument("--user-conversations", type=int, default=40, help="conversations owned by the benchmark user")
+    parser.add_argument("--user-messages-per-conversation", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1234)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a database for benchmarks")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    counts = seed(
+        users=args.users,
+        study_sessions=args.study_sessions,
+        mindful_sessions=args.mindful_sessions,
+        conversations=args.conversations,
+        messages=args.messages,
+        documents=args.documents,
+        user_sessions=args.user_sessions,
+        user_conversations=args.user_conversations,
+        user_messages_per_conversation=args.user_messages_per_conversation,
+        seed_value=args.seed,
+    )
+    print(counts, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
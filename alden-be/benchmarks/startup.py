@@ -0,0 +1,120 @@
+"""Measure cold-start cost: app import time and time to first response.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+
+Every run uses a fresh interpreter. Import time covers `import main`;
+time to first response spans from spawning uvicorn to the first 200 from
+/health, including lifespan startup (schema check/creation).
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from .common import configure_environment, run_metadata, write_results
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: dict, top: int) -> list:
+    """Modules with the largest cumulative import time, from -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        module = name.strip()
+        if module == "main":
+            continue
+        # Nesting is shown by two extra spaces of indentation per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append({
+            "module": module,
+            "depth": depth,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "self_ms": int(self_us) / 1000,
+        })
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+
+
+def measure_first_response(env: dict, timeout: float = 60.0) -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("Server did not answer /health in time")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _summary(values: list) -> dict:
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 2),
+        "min_ms": round(min(values) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+        "runs_ms": [round(value * 1000, 2) for value in values],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first response")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top-imports", type=int, default=15)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file per run")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    imports, first_responses = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            configure_environment(args.database_url or f"sqlite:///{tmp}/startup.db")
+            env = dict(os.environ)
+            imports.append(measure_import(env))
+            first_responses.append(measure_first_response(env))
+
+    configure_environment(args.database_url or "sqlite:///:memory:")
+    results = {
+        "meta": run_metadata(args),
+        "import_main": _summary(imports),
+        "time_to_first_response": _summary(first_responses),
+        "slowest_imports": slowest_imports(dict(os.environ), args.top_imports),
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
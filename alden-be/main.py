@@ -1,18 +1,57 @@
+from contextlib import asynccontextmanager
+import logging
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
 import uvicorn
 
 from app.config import settings
-from app.database import create_tables
-from app.routers import study_sessions, mindful_sessions, ai_chat, documents, progress
+from app.logging_config import setup_logging, RequestIdMiddleware
 
-# Create tables on startup
-create_tables()
+# Configure logging before the routers import their services
+setup_logging()
+
+from app.compression import CompressionMiddleware
+from app.database import engine, init_db
+from app.metrics import registry, MetricsMiddleware
+from app.profiling import ProfilingMiddleware
+from app.routers import study_sessions, mindful_sessions, ai_chat, documents, progress, admin, sync, search, export, audio
+from app.services.ai_service import ai_service
+from app.services.jobs import background_jobs
+from app.services.maintenance import scheduler
+from app.services.previews import preview_pipeline
+from app.services.usage import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create or migrate the schema; a no-op when another worker already did
+    if settings.auto_migrate:
+        init_db()
+    if settings.scheduler_enabled:
+        scheduler.start()
+    usage_recorder.start()
+    if settings.metrics_directory:
+        registry.share(settings.metrics_directory, settings.metrics_write_seconds)
+    yield
+    await scheduler.stop()
+    # uvicorn has stopped accepting connections and finished open requests;
+    # let detached AI jobs and preview renders complete before the worker exits
+    await background_jobs.drain(settings.graceful_shutdown_timeout)
+    preview_pipeline.shutdown()
+    # Their AI usage too
+    await usage_recorder.stop()
+    await registry.stop()
+    logger.info("Worker shut down", extra={"pid": os.getpid()})
 
 app = FastAPI(
     title="Alden Backend API",
     description="Backend API for Alden - Study Assistant with AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -24,12 +63,30 @@ app.add_middleware(
     allow_headers=settings.allow_headers,
 )
 
+# Compress large text responses (brotli or gzip)
+app.add_middleware(CompressionMiddleware)
+
+# Sample slow requests when profiling is enabled
+app.add_middleware(ProfilingMiddleware)
+
+# Record per-route latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Outermost: assign request ids so every log line below can be correlated
+app.add_middleware(RequestIdMiddleware)
+
 # Include routers
 app.include_router(study_sessions.router, prefix="/api")
 app.include_router(mindful_sessions.router, prefix="/api")
 app.include_router(ai_chat.router, prefix="/api")
 app.include_router(documents.router, prefix="/api")
 app.include_router(progress.router, prefix="/api")
+app.include_router(sync.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+app.include_router(export.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+# Audio is served at /audio/<name>, matching the catalog's audio_url values
+app.include_router(audio.router)
 
 @app.get("/")
 def read_root():
@@ -39,10 +96,43 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+def readiness_check():
+    """Whether this worker can serve traffic: database reachable and not draining"""
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        database = "ok"
+    except Exception:
+        logger.exception("Readiness check could not reach the database")
+        database = "unavailable"
+
+    ready = database == "ok" and not background_jobs.draining
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "pid": os.getpid(),
+        "database": database,
+        "ai_client": ai_service.client_state,
+        "ai_circuits": ai_service.circuit_states,
+        "draining": background_jobs.draining,
+        "background_jobs": background_jobs.in_flight,
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics for this worker, or for all workers of the server under app.server"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    # Development server; use `python -m app.server` in production
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=True,
+        # Let uvicorn's loggers propagate to our JSON handler; requests are
+        # already logged by RequestIdMiddleware
+        log_config=None,
+        access_log=False
     )
\ No newline at end of file
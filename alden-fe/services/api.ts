@@ -59,6 +59,18 @@ export interface APIUploadedDocument {
   uri: string;
   size?: number;
   upload_date: string;
+  // Preview image paths (append to API_BASE_URL); missing until rendered
+  previews?: { small?: string; medium?: string; large?: string };
+}
+
+export interface APIUploadSession {
+  id: string;
+  name: string;
+  content_type: string;
+  size: number;
+  offset: number; // bytes the server has received
+  expires_at: string;
+  document_id?: string;
 }
 
 export interface APIUserProgress {
@@ -71,6 +83,60 @@ export interface APIUserProgress {
   mindful_sessions_completed: number;
 }
 
+export interface APIAIUsageDay {
+  day: string; // UTC date
+  feature: 'chat' | 'flashcards' | 'study_aids';
+  model: string | null; // null for answers served from stored study aids
+  requests: number;
+  prompt_tokens: number;
+  response_tokens: number;
+  cached_tokens: number;
+  cache_hits: number;
+  fallbacks: number;
+  avg_latency_ms: number | null;
+  estimated_cost: number | null; // USD
+}
+
+export interface APIAIUsageSummary {
+  daily_token_quota: number | null; // null when unlimited
+  used_today: number;
+  remaining_today: number | null;
+  resets_at: string;
+  days: APIAIUsageDay[];
+}
+
+// Last response per URL for GET requests, revalidated with If-None-Match
+// so unchanged data costs a 304 instead of a full download
+const etagCache = new Map<string, { etag: string; data: unknown }>();
+
+export interface APISyncResponse {
+  token: string;
+  reset: boolean;
+  has_more: boolean;
+  study_sessions: APIStudySession[];
+  mindful_sessions: APIMindfulSession[];
+  conversations: Omit<APIAidaConversation, 'messages'>[];
+  messages: APIAidaMessage[];
+  documents: APIUploadedDocument[];
+  user?: {
+    daily_goal: number;
+    current_streak: number;
+    total_study_time: number;
+    total_mindful_time: number;
+  } | null;
+  deleted: Partial<Record<'study_sessions' | 'mindful_sessions' | 'conversations' | 'documents', string[]>>;
+}
+
+export interface APISearchResult {
+  kind: 'message' | 'conversation' | 'document';
+  id: string;
+  conversation_id: string | null;
+  title: string | null;
+  snippet: string | null; // matches wrapped in <mark></mark>
+  score: number;
+  timestamp: string | null;
+}
+
 // Helper function to handle API requests
 async function apiRequest<T>(
   endpoint: string,
@@ -92,6 +158,12 @@ async function apiRequest<T>(
   // Merge headers
   requestOptions.headers = { ...defaultOptions.headers, ...options.headers };
 
+  const isGet = (options.method || 'GET').toUpperCase() === 'GET';
+  const cached = isGet ? etagCache.get(url) : undefined;
+  if (cached) {
+    requestOptions.headers = { ...requestOptions.headers, 'If-None-Match': cached.etag };
+  }
+
   if (config.enableLogging) {
     console.log(`API Request: ${options.method || 'GET'} ${url}`);
     if (options.body) {
@@ -106,6 +178,10 @@ async function apiRequest<T>(
       console.log(`API Response: ${response.status} ${response.statusText}`);
     }
 
+    if (response.status === 304 && cached) {
+      return cached.data as T;
+    }
+
     if (!response.ok) {
       let errorMessage = `HTTP error! status: ${response.status}`;
       
@@ -121,6 +197,13 @@ async function apiRequest<T>(
     }
 
     const data = await response.json();
+
+    const etag = response.headers.get('ETag');
+    if (isGet && etag) {
+      etagCache.set(url, { etag, data });
+    } else if (isGet) {
+      etagCache.delete(url);
+    }
     
     if (config.enableLogging) {
       console.log('API Response Data:', data);
@@ -217,6 +300,14 @@ export const mindfulSessionsAPI = {
   },
 };
 
+// Retries of a chat message carry the same key, so the backend stores the
+// message and calls the model only once
+const CHAT_SEND_ATTEMPTS = 3;
+
+function newIdempotencyKey(): string {
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
 // AI Chat API
 export const aiChatAPI = {
   async sendMessage(message: string, conversationId?: string, documents?: string[]): Promise<{
@@ -224,14 +315,29 @@ export const aiChatAPI = {
     conversation_id: string;
     message_id: string;
   }> {
-    return apiRequest('/ai/chat', {
-      method: 'POST',
-      body: JSON.stringify({
-        message,
-        conversation_id: conversationId,
-        documents,
-      }),
-    });
+    const idempotencyKey = newIdempotencyKey();
+    for (let attempt = 1; ; attempt++) {
+      try {
+        return await apiRequest('/ai/chat', {
+          method: 'POST',
+          headers: { 'Idempotency-Key': idempotencyKey },
+          body: JSON.stringify({
+            message,
+            conversation_id: conversationId,
+            documents,
+          }),
+        });
+      } catch (error) {
+        // Only connection failures are retried; the server may or may not have
+        // received the request
+        const retryable = error.message.startsWith('Unable to connect') || error.message.includes('timed out')
+          || error.message.includes('still being processed');
+        if (!retryable || attempt >= CHAT_SEND_ATTEMPTS) {
+          throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** (attempt - 1)));
+      }
+    }
   },
 
   async getConversations(): Promise<APIAidaConversation[]> {
@@ -265,8 +371,17 @@ export const aiChatAPI = {
       body: JSON.stringify({ content, subject }),
     });
   },
+
+  async getUsage(days: number = 30): Promise<APIAIUsageSummary> {
+    return apiRequest(`/ai/usage?days=${days}`);
+  },
 };
 
+// Resumable uploads send the file in chunks; after a dropped connection only
+// the bytes the server is missing are sent again
+const UPLOAD_CHUNK_BYTES = 2 * 1024 * 1024;
+const UPLOAD_CHUNK_ATTEMPTS = 5;
+
 // Documents API
 export const documentsAPI = {
   async upload(file: FormData): Promise<APIUploadedDocument> {
@@ -289,6 +404,52 @@ export const documentsAPI = {
     });
   },
 
+  async uploadResumable(uri: string, name: string, contentType: string): Promise<APIUploadedDocument> {
+    const file = await (await fetch(uri)).blob();
+    const upload: APIUploadSession = await apiRequest('/documents/uploads', {
+      method: 'POST',
+      body: JSON.stringify({ name, content_type: contentType, size: file.size }),
+    });
+
+    let offset = upload.offset;
+    let failures = 0;
+    while (offset < file.size) {
+      try {
+        const response = await fetch(`${API_BASE_URL}/documents/uploads/${upload.id}`, {
+          method: 'PATCH',
+          headers: {
+            'Content-Type': 'application/offset+octet-stream',
+            'Upload-Offset': String(offset),
+          },
+          body: file.slice(offset, offset + UPLOAD_CHUNK_BYTES),
+          timeout: API_CONFIG.TIMEOUT * 2,
+        });
+        if (!response.ok) {
+          throw new Error(`Upload failed: ${response.status}`);
+        }
+        offset = (await response.json()).offset;
+        failures = 0;
+      } catch (error) {
+        failures++;
+        if (failures >= UPLOAD_CHUNK_ATTEMPTS) {
+          throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** (failures - 1)));
+        try {
+          // Resume from wherever the server got to
+          const current: APIUploadSession = await apiRequest(`/documents/uploads/${upload.id}`);
+          offset = current.offset;
+        } catch (e) {
+          // Still unreachable; the next attempt finds out
+        }
+      }
+    }
+
+    return apiRequest(`/documents/uploads/${upload.id}/complete`, {
+      method: 'POST',
+    });
+  },
+
   async getAll(): Promise<APIUploadedDocument[]> {
     return apiRequest('/documents/');
   },
@@ -332,6 +493,58 @@ export const progressAPI = {
   },
 };
 
+// Audio assets are served next to the API, not under /api
+const AUDIO_BASE_URL = API_BASE_URL.replace(/\/api\/?$/, '');
+
+export interface APIAudioAsset {
+  name: string;
+  url: string; // versioned, cacheable forever
+  size: number;
+  duration: number | null; // seconds
+  content_type: string;
+  etag: string;
+}
+
+// Audio API
+export const audioAPI = {
+  // Sizes and durations of all session audio, to prefetch the next one
+  async getManifest(): Promise<APIAudioAsset[]> {
+    const response = await fetch(`${AUDIO_BASE_URL}/audio/manifest`);
+    if (!response.ok) {
+      throw new Error(`Failed to load audio manifest: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  // Absolute URL for a catalog audio_url or manifest url
+  resolveUrl(path: string): string {
+    return `${AUDIO_BASE_URL}${path}`;
+  },
+};
+
+// Sync API
+export const syncAPI = {
+  // Without a token the server returns one to start from (reset: true)
+  async sync(since?: string | null): Promise<APISyncResponse> {
+    const query = since ? `?since=${encodeURIComponent(since)}` : '';
+    return apiRequest(`/sync${query}`);
+  },
+};
+
+// Search API
+export const searchAPI = {
+  async search(
+    q: string,
+    options: { kinds?: ('messages' | 'conversations' | 'documents')[]; limit?: number; offset?: number } = {}
+  ): Promise<{ results: APISearchResult[]; has_more: boolean }> {
+    const params = new URLSearchParams({ q });
+    options.kinds?.forEach(kind => params.append('kind', kind));
+    if (options.limit !== undefined) params.set('limit', String(options.limit));
+    if (options.offset !== undefined) params.set('offset', String(options.offset));
+    return apiRequest(`/search/?${params.toString()}`);
+  },
+};
+
 // Data transformation utilities
 export const transformers = {
   // Convert API StudySession to frontend format
@@ -382,6 +595,17 @@ export const transformers = {
     };
   },
 
+  // Convert API Message to frontend format
+  messageFromAPI(apiMessage: APIAidaMessage) {
+    return {
+      id: apiMessage.id,
+      type: apiMessage.type,
+      content: apiMessage.content,
+      timestamp: new Date(apiMessage.timestamp),
+      conversationId: apiMessage.conversation_id,
+    };
+  },
+
   // Convert API Document to frontend format
   documentFromAPI(apiDocument: APIUploadedDocument) {
     return {
@@ -391,6 +615,7 @@ export const transformers = {
       uri: apiDocument.uri,
       uploadDate: new Date(apiDocument.upload_date),
       size: apiDocument.size,
+      thumbnailUri: apiDocument.previews?.small ? `${API_BASE_URL}${apiDocument.previews.small}` : undefined,
     };
   },
 }; 
\ No newline at end of file
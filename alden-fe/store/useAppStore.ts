@@ -7,6 +7,7 @@ import {
   aiChatAPI, 
   documentsAPI, 
   progressAPI,
+  syncAPI,
   transformers 
 } from '../services/api';
 
@@ -58,6 +59,7 @@ export interface UploadedDocument {
   uri: string;
   uploadDate: Date;
   size?: number;
+  thumbnailUri?: string; // small preview; show this in lists instead of loading `uri`
 }
 
 interface AppState {
@@ -89,6 +91,9 @@ interface AppState {
   // Loading states
   isLoading: boolean;
   error: string | null;
+  
+  // Delta sync token from /api/sync (null until the first full load)
+  syncToken: string | null;
 }
 
 interface AppActions {
@@ -128,6 +133,7 @@ interface AppActions {
   
   // Initialization
   initializeApp: () => Promise<void>;
+  syncChanges: () => Promise<void>;
   
   // Reset Actions
   reset: () => void;
@@ -153,8 +159,23 @@ const initialState: AppState = {
   isTimerRunning: false,
   isLoading: false,
   error: null,
+  syncToken: null,
 };
 
+// Replace items by id, append new ones, and drop deleted ids
+function mergeById<T extends { id: string }>(items: T[], updates: T[], deletedIds: string[] = []): T[] {
+  const deleted = new Set(deletedIds);
+  const updatesById = new Map(updates.map(item => [item.id, item]));
+  const merged = items
+    .filter(item => !deleted.has(item.id))
+    .map(item => updatesById.get(item.id) ?? item);
+  const existingIds = new Set(items.map(item => item.id));
+  return [...merged, ...updates.filter(item => !existingIds.has(item.id) && !deleted.has(item.id))];
+}
+
+// Optimistic messages added before the server confirms them
+const LOCAL_MESSAGE_PREFIX = 'local-';
+
 export const useAppStore = create<AppStore>()(
   persist(
     (set, get) => ({
@@ -165,6 +186,10 @@ export const useAppStore = create<AppStore>()(
         try {
           set({ isLoading: true, error: null });
           
+          // Take the sync token before loading so nothing changed during the
+          // load is missed; syncing it again later is harmless
+          const { token } = await syncAPI.sync();
+          
           // Load all data in parallel
           await Promise.all([
             get().loadStudySessions(),
@@ -175,6 +200,8 @@ export const useAppStore = create<AppStore>()(
             get().loadPrebuiltSessions(),
           ]);
           
+          set({ syncToken: token });
+          
         } catch (error) {
           console.error('Failed to initialize app:', error);
           set({ error: error.message });
@@ -183,6 +210,113 @@ export const useAppStore = create<AppStore>()(
         }
       },
       
+      // Apply only what changed on the server since the last sync
+      syncChanges: async () => {
+        const { syncToken } = get();
+        if (!syncToken) {
+          await get().initializeApp();
+          return;
+        }
+        
+        try {
+          let token = syncToken;
+          let hasMore = true;
+          let progressChanged = false;
+          
+          while (hasMore) {
+            const changes = await syncAPI.sync(token);
+            if (changes.reset) {
+              set({ syncToken: null });
+              await get().initializeApp();
+              return;
+            }
+            
+            const state = get();
+            const deleted = changes.deleted;
+            
+            // Conversations keep their loaded messages; new messages are
+            // merged in below and replace matching optimistic ones
+            const existingConversations = new Map(state.aidaConversations.map(conv => [conv.id, conv]));
+            const conversationUpdates = changes.conversations.map(apiConversation => ({
+              ...transformers.conversationFromAPI({ ...apiConversation, messages: [] }),
+              messages: existingConversations.get(apiConversation.id)?.messages ?? [],
+            }));
+            let aidaConversations = mergeById(state.aidaConversations, conversationUpdates, deleted.conversations);
+            
+            const messagesByConversation = new Map<string, AidaMessage[]>();
+            for (const apiMessage of changes.messages) {
+              const message = transformers.messageFromAPI(apiMessage);
+              const list = messagesByConversation.get(message.conversationId) ?? [];
+              list.push(message);
+              messagesByConversation.set(message.conversationId, list);
+            }
+            aidaConversations = aidaConversations.map(conv => {
+              const newMessages = messagesByConversation.get(conv.id);
+              if (!newMessages) return conv;
+              const confirmed = new Set(newMessages.map(msg => `${msg.type}:${msg.content}`));
+              const kept = conv.messages.filter(msg =>
+                !(msg.id.startsWith(LOCAL_MESSAGE_PREFIX) && confirmed.has(`${msg.type}:${msg.content}`))
+              );
+              const messages = mergeById(kept, newMessages)
+                .sort((a, b) => a.timestamp.getTime() - b.timestamp.getTime());
+              return { ...conv, messages };
+            });
+            aidaConversations.sort((a, b) => b.lastMessage.getTime() - a.lastMessage.getTime());
+            
+            const studySessions = mergeById(
+              state.studySessions,
+              changes.study_sessions.map(transformers.studySessionFromAPI),
+              deleted.study_sessions
+            );
+            // A session ended on another device is no longer active here
+            const endedElsewhere = changes.study_sessions.some(s => s.id === state.activeSession?.id && s.completed);
+            const activeSession = endedElsewhere ? null : state.activeSession;
+            
+            set({
+              studySessions,
+              activeSession,
+              isTimerRunning: activeSession ? state.isTimerRunning : false,
+              mindfulSessions: mergeById(
+                state.mindfulSessions,
+                changes.mindful_sessions.map(transformers.mindfulSessionFromAPI),
+                deleted.mindful_sessions
+              ),
+              aidaConversations,
+              activeConversation: deleted.conversations?.includes(state.activeConversation ?? '')
+                ? null
+                : state.activeConversation,
+              uploadedDocuments: mergeById(
+                state.uploadedDocuments,
+                changes.documents.map(transformers.documentFromAPI),
+                deleted.documents
+              ).sort((a, b) => b.uploadDate.getTime() - a.uploadDate.getTime()),
+              syncToken: changes.token,
+            });
+            
+            if (changes.user) {
+              set({
+                dailyGoal: changes.user.daily_goal,
+                currentStreak: changes.user.current_streak,
+                totalStudyTime: changes.user.total_study_time,
+                totalMindfulTime: changes.user.total_mindful_time,
+              });
+            }
+            progressChanged = progressChanged || !!changes.user || changes.study_sessions.length > 0;
+            
+            token = changes.token;
+            hasMore = changes.has_more;
+          }
+          
+          // Today's totals are computed server-side
+          if (progressChanged) {
+            await get().loadUserProgress();
+          }
+        } catch (error) {
+          console.error('Failed to sync changes:', error);
+          set({ error: error.message });
+        }
+      },
+      
       // Study Session Actions
       startStudySession: async (sessionData) => {
         try {
@@ -371,7 +505,7 @@ export const useAppStore = create<AppStore>()(
           
           // Add user message immediately for better UX
           const userMessage: AidaMessage = {
-            id: Date.now().toString(),
+            id: `${LOCAL_MESSAGE_PREFIX}${Date.now()}`,
             type: 'user',
             content,
             timestamp: new Date(),
@@ -396,17 +530,17 @@ export const useAppStore = create<AppStore>()(
           // Send message to API
           const response = await aiChatAPI.sendMessage(content, conversationId);
           
-          // The backend will process the AI response in the background
-          // We need to poll for new messages or implement real-time updates
+          // The backend will process the AI response in the background; a
+          // delta sync then fetches just the new messages
           setTimeout(async () => {
             try {
-              await get().loadConversation(conversationId);
+              await get().syncChanges();
             } catch (error) {
-              console.error('Failed to load updated conversation:', error);
+              console.error('Failed to sync conversation:', error);
             } finally {
               set({ isAidaTyping: false });
             }
-          }, 2000); // Wait 2 seconds then reload conversation
+          }, 2000); // Wait 2 seconds then sync
           
         } catch (error) {
           console.error('Failed to send message:', error);
@@ -474,16 +608,9 @@ export const useAppStore = create<AppStore>()(
         try {
           set({ isLoading: true, error: null });
           
-          // Create FormData for file upload
-          const formData = new FormData();
-          formData.append('file', {
-            uri: document.uri,
-            name: document.name,
-            type: document.type === 'pdf' ? 'application/pdf' : 
-                  document.type === 'image' ? 'image/jpeg' : 'text/plain',
-          } as any);
-          
-          const apiDocument = await documentsAPI.upload(formData);
+          const contentType = document.type === 'pdf' ? 'application/pdf' :
+                              document.type === 'image' ? 'image/jpeg' : 'text/plain';
+          const apiDocument = await documentsAPI.uploadResumable(document.uri, document.name, contentType);
           const newDocument = transformers.documentFromAPI(apiDocument);
           
           const { uploadedDocuments } = get();